@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "LittleLemon.settings")
 
 application = get_asgi_application()
+
+# Compile the URL patterns, build the serializers and load the price index now rather than on the first request
+from django.conf import settings
+
+if getattr(settings, 'WARM_UP_ON_STARTUP', False):
+    from LittleLemonDRF.warmup import warm_up
+    warm_up()
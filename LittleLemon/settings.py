@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,12 +47,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "LittleLemonDRF.throttling.AdmissionControlMiddleware",
+    "LittleLemonDRF.querylog.QueryInspectorMiddleware",
+    "LittleLemonDRF.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "LittleLemonDRF.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "LittleLemon.urls"
@@ -98,6 +104,24 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing. LittleLemonDRF.hashers reads and writes the usual pbkdf2_sha256 hashes with
+# PASSWORD_HASHING['ITERATIONS'] (see `python manage.py bench_login`), Django's own count by default;
+# hashes with fewer iterations are rehashed on the user's next login. Counts below Django's are only
+# used with ALLOW_FEWER_ITERATIONS
+
+PASSWORD_HASHERS = [
+    "LittleLemonDRF.hashers.ProfiledPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+PASSWORD_HASHING = {
+    'ALLOW_FEWER_ITERATIONS': False
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -129,6 +153,127 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
         'rest_framework.filters.SearchFilter',
     ]
+    , 'DEFAULT_THROTTLE_CLASSES': [
+        'LittleLemonDRF.throttling.RoleRateThrottle'
+    ]
+    # orjson backed when the optional orjson package is installed, DRF's JSON renderer/parser otherwise
+    , 'DEFAULT_RENDERER_CLASSES': [
+        'LittleLemonDRF.renderers.FastJSONRenderer'
+        , 'rest_framework.renderers.BrowsableAPIRenderer'
+    ]
+    , 'DEFAULT_PARSER_CLASSES': [
+        'LittleLemonDRF.parsers.FastJSONParser'
+        , 'rest_framework.parsers.FormParser'
+        , 'rest_framework.parsers.MultiPartParser'
+    ]
     # , 'DEFAULT_PAGINATION_CLASS': 'LittleLemonDRF.paginator.StandardResultsSetPagination'
     # , 'PAGE_SIZE': 2
-}
\ No newline at end of file
+}
+
+# MessagePack responses (`Accept: application/msgpack`) when the optional msgpack package is installed
+if importlib.util.find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('LittleLemonDRF.renderers.MessagePackRenderer')
+
+# Cached `GET /api/menu-items` listings (LittleLemonDRF/filters.py). Entries are keyed by the menu version,
+# so saving a menu item or category invalidates them; TIMEOUT bounds staleness for bulk updates
+MENU_CACHE = {
+    'TIMEOUT': 300
+}
+
+# gzip/brotli response compression (LittleLemonDRF/middleware.py). Brotli needs the optional brotli package.
+# Responses under EXEMPT_PATHS carry tokens or credentials and are never compressed (BREACH)
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': 1024
+    , 'BROTLI_QUALITY': 5
+    , 'EXEMPT_PATHS': ('/api/users/',)
+}
+
+# Background jobs (LittleLemonDRF/jobs.py). Jobs the in-process pool does not
+# pick up are drained by `python manage.py run_jobs`.
+JOB_QUEUE = {
+    'EXECUTOR_WORKERS': 2
+    , 'MAX_ATTEMPTS': 3
+    , 'RETRY_DELAY': 30
+    , 'LEASE': 300 # A job still RUNNING after this many seconds is presumed lost and run again
+}
+
+# Delivered orders older than AFTER_DAYS are moved to the archive tables by
+# `python manage.py archive_orders` (LittleLemonDRF/archive.py)
+ORDER_ARCHIVE = {
+    'AFTER_DAYS': 90
+    , 'BATCH_SIZE': 500
+}
+
+# In-process menu price index used by the cart and checkout
+# (LittleLemonDRF/price_index.py). MAX_AGE bounds how stale it can get.
+PRICE_INDEX = {
+    'MAX_AGE': 60
+}
+
+# What checkout does with cart lines whose menu item price changed since they were added
+# (LittleLemonDRF/carts.py): 'reprice' charges the current price and lists the changed lines in
+# the response, 'reject' answers 409 with the changed lines and updates the cart to the current prices
+CHECKOUT = {
+    'PRICE_CHANGES': 'reprice'
+}
+
+# `Idempotency-Key` records for checkout and cart POSTs (LittleLemonDRF/idempotency.py),
+# kept for TTL seconds. Expired ones are removed by `python manage.py purge_idempotency_keys`.
+IDEMPOTENCY = {
+    'TTL': 24 * 60 * 60
+    , 'PURGE_BATCH_SIZE': 1000
+    , 'REPLAY_HEADERS': ('Location', 'ETag', 'Last-Modified') # Stored with the response and sent again on retries
+}
+
+# Token bucket rate limits per role and scope (LittleLemonDRF/throttling.py): 'N/min' allows bursts of N
+# requests, refilled at N per minute. Scopes are 'read'/'write' unless the view names one for the method
+# ('polling', 'checkout'); a missing scope falls back to 'read'/'write', a missing role is not throttled.
+# BACKEND 'cache' shares the buckets between processes through CACHES[CACHE_ALIAS].
+# ADMISSION sheds GET requests with 503 while the average latency is above LATENCY_THRESHOLD seconds.
+THROTTLING = {
+    'BACKEND': 'local'
+    , 'CACHE_ALIAS': 'default'
+    , 'RATES': {
+        'Customer': {'read': '600/min', 'write': '300/min', 'polling': '240/min', 'checkout': '60/min'}
+        , 'Delivery Crew': {'read': '600/min', 'write': '300/min', 'polling': '240/min'}
+        , 'Manager': {'read': '1200/min', 'write': '600/min', 'polling': '600/min'}
+        , 'authenticated': {'read': '600/min', 'write': '300/min'}
+        , 'anonymous': {'read': '600/min', 'write': '300/min'}
+    }
+    , 'ADMISSION': {
+        'ENABLED': False
+        , 'LATENCY_THRESHOLD': 1.0
+        , 'HALF_LIFE': 5.0
+        , 'RETRY_AFTER': 5
+        , 'EXEMPT_PATHS': ['/admin/']
+    }
+}
+
+# Warm up URL patterns, serializers, the price index and the menu listing when the WSGI/ASGI
+# application is loaded (LittleLemonDRF/warmup.py). `python manage.py bench_coldstart` measures cold starts.
+# The listing is cached per origin: list the ones clients use, e.g. ['https://api.example.com'];
+# None derives them from ALLOWED_HOSTS. On when DEBUG is off; LITTLELEMON_WARM_UP=1/0 overrides that
+WARM_UP_ON_STARTUP = os.environ.get('LITTLELEMON_WARM_UP', '0' if DEBUG else '1') == '1'
+WARM_UP_MENU_ORIGINS = None
+
+# Slow query log, duplicate (N+1) query detection and per-endpoint query report for development and
+# staging (LittleLemonDRF/querylog.py), e.g.
+# LITTLELEMON_QUERY_INSPECTOR=1 LITTLELEMON_QUERY_REPORT=query-report.json python manage.py test
+QUERY_INSPECTOR = {
+    'ENABLED': os.environ.get('LITTLELEMON_QUERY_INSPECTOR') == '1'
+    , 'SLOW_QUERY_SECONDS': 0.05
+    , 'DUPLICATE_THRESHOLD': 3
+    , 'REPORT_PATH': os.environ.get('LITTLELEMON_QUERY_REPORT')
+}
+
+# Admin-only request profiling (LittleLemonDRF/profiling.py): send `X-Profile: cprofile` or
+# `X-Profile: collapsed` (or `?profile=...`) to get the profile instead of the response.
+# SAMPLE_RATES = {'SingleOrderView': 100} profiles 1 in 100 requests to that view into DIRECTORY.
+# Off unless LITTLELEMON_PROFILING=1, like the query inspector
+PROFILING = {
+    'ENABLED': os.environ.get('LITTLELEMON_PROFILING') == '1'
+    , 'SAMPLE_RATES': {}
+    , 'SAMPLE_PROFILER': 'cprofile'
+    , 'DIRECTORY': BASE_DIR / 'profiles'
+    , 'MAX_FILES': 100
+}
@@ -1,8 +1,14 @@
 from django.contrib import admin
 
-from .models import Category, MenuItem, Cart
+from .models import Category, MenuItem, Cart, Job
 # Register your models here.
 
 admin.site.register(Category)
 admin.site.register(MenuItem)
-admin.site.register(Cart)
\ No newline at end of file
+admin.site.register(Cart)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after', 'updated_at')
+    list_filter = ('status', 'name')
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, pre_delete, post_delete
 
 
 class LittlelemondrfConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "LittleLemonDRF"
+
+    def ready(self):
+        from . import tasks # noqa: F401 (registers job handlers)
+        from .price_index import bump_menu_version
+        from .carts import menu_item_deleted
+
+        menu_item = self.get_model('MenuItem')
+        post_save.connect(bump_menu_version, sender=menu_item, dispatch_uid='menuitem-saved-bump-menu-version')
+        post_delete.connect(bump_menu_version, sender=menu_item, dispatch_uid='menuitem-deleted-bump-menu-version')
+        # Its cart lines go by cascade: take them off the cart headers first
+        pre_delete.connect(menu_item_deleted, sender=menu_item, dispatch_uid='menuitem-deleted-update-cart-headers')
+
+        # Menu listings show the category title, so category changes invalidate the cached listings too
+        category = self.get_model('Category')
+        post_save.connect(bump_menu_version, sender=category, dispatch_uid='category-saved-bump-menu-version')
+        post_delete.connect(bump_menu_version, sender=category, dispatch_uid='category-deleted-bump-menu-version')
@@ -0,0 +1,67 @@
+"""
+Moves delivered orders out of the hot `Order`/`OrderItem` tables into
+`ArchivedOrder`/`ArchivedOrderItem`. Run through
+`python manage.py archive_orders`; archived orders stay readable at
+`/api/orders/history`. Orders whose rollup jobs haven't run yet are left for
+a later run.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+DEFAULTS = {
+    'AFTER_DAYS': 90,
+    'BATCH_SIZE': 500,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'ORDER_ARCHIVE', {}).get(name, DEFAULTS[name])
+
+
+def archivable_orders(after_days=None):
+    cutoff = date.today() - timedelta(days=get_setting('AFTER_DAYS') if after_days is None else after_days)
+    # Only orders the rollups have fully counted: their jobs read the live tables, so an order archived
+    # before them would never be counted
+    return Order.objects.filter(status=True, date__lt=cutoff, rolled_up=True).filter(
+        Q(delivery_crew__isnull=True) | Q(delivery_rolled_up_crew_id=F('delivery_crew_id'))
+    )
+
+
+def archive_batch(after_days=None, batch_size=None):
+    """Archive one batch in its own transaction. Returns the number of orders moved."""
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+
+    with transaction.atomic():
+        orders = list(
+            archivable_orders(after_days).order_by('id')
+            .values('id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date')[:batch_size]
+        )
+        if not orders:
+            return 0
+        order_ids = [order['id'] for order in orders]
+
+        ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(**line) for line in OrderItem.objects.filter(order_id__in=order_ids)
+            .values('order_id', 'menuitem_id', 'quantity', 'unit_price', 'price')
+        ])
+
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+    return len(orders)
+
+
+def archive_orders(after_days=None, batch_size=None, max_batches=None):
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(after_days, batch_size)
+        if not moved:
+            break
+        total += moved
+        batches += 1
+    return total
@@ -0,0 +1,158 @@
+"""
+Cart headers: one `CartHeader` row per customer holding the subtotal, item
+count and a revision number of their cart, so the cart summary and the
+cart ETags are one primary key read instead of a SUM over the `Cart` rows.
+
+Every change to a user's cart lines calls `apply` (or `clear`) in the same
+transaction as the line change. The header is updated with F() expressions,
+so concurrent changes add up instead of overwriting each other. Menu items
+deleted with lines still in carts are taken off the headers by
+`menu_item_deleted` (pre_delete, see apps.py). Bulk writers (factories,
+generate_data) call `rebuild` for the users they touched.
+
+`check` compares every header with the lines; `python manage.py
+check_cart_headers --fix` repairs what it finds, e.g. after Cart rows were
+edited in the admin.
+
+Cart lines keep the price of the menu item when it was added. Checkout
+loads the lines joined with their menu items and `reprice`s the ones whose
+price has changed since, all in memory; CHECKOUT['PRICE_CHANGES'] decides
+whether the order then goes through at the new prices ('reprice') or is
+refused so the customer can review them ('reject', the cart is updated to
+the new prices with `save_prices`).
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import Cart, CartHeader
+from .price_index import get_menu_version
+
+REPRICE = 'reprice'
+REJECT = 'reject'
+
+DEFAULTS = {
+    'PRICE_CHANGES': REPRICE,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'CHECKOUT', {}).get(name, DEFAULTS[name])
+
+
+def apply(user_id, subtotal=0, item_count=0):
+    """Add the deltas to the user's header and bump its revision, creating the header if needed."""
+    increments = {'subtotal': F('subtotal') + subtotal, 'item_count': F('item_count') + item_count, 'revision': F('revision') + 1}
+    if CartHeader.objects.filter(user_id=user_id).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            CartHeader.objects.create(user_id=user_id, subtotal=subtotal, item_count=item_count, revision=1)
+    except IntegrityError: # Someone else created the row in between
+        CartHeader.objects.filter(user_id=user_id).update(**increments)
+
+
+def clear(user_id):
+    """Delete the user's cart lines and zero the header."""
+    with transaction.atomic():
+        Cart.objects.filter(user_id=user_id).delete()
+        if not CartHeader.objects.filter(user_id=user_id).update(subtotal=0, item_count=0, revision=F('revision') + 1):
+            apply(user_id) # No header yet: create an empty one, still with a new revision
+
+
+def lock(user_id):
+    # Serializes checkout against other changes to the same cart (a no-op on SQLite, which locks the whole database)
+    return CartHeader.objects.select_for_update().filter(user_id=user_id).first()
+
+
+def get(user_id):
+    # Users who never had a cart have no row: an unsaved empty header stands in for it
+    return CartHeader.objects.filter(user_id=user_id).first() or CartHeader(user_id=user_id)
+
+
+def etag(header, with_menu=False):
+    # The line listing embeds the menu items, so it also changes with the menu version
+    if with_menu:
+        return '"cart-{}-{}-{}"'.format(header.user_id, header.revision, get_menu_version())
+    return '"cart-{}-{}"'.format(header.user_id, header.revision)
+
+
+def reprice(lines):
+    """
+    Brings cart lines loaded with select_related('menuitem') to the current menu prices, in memory.
+    Returns the lines that changed, each with its previous `old_unit_price`.
+    """
+    changed = []
+    for line in lines:
+        if line.unit_price != line.menuitem.price:
+            line.old_unit_price = line.unit_price
+            line.unit_price, line.price = line.menuitem.price, line.menuitem.price * line.quantity
+            changed.append(line)
+    return changed
+
+
+def describe(changed):
+    return [{
+        'menuitem_id': line.menuitem_id
+        , 'title': line.menuitem.title
+        , 'quantity': line.quantity
+        , 'old_unit_price': str(line.old_unit_price)
+        , 'unit_price': str(line.unit_price)
+    } for line in changed]
+
+
+def save_prices(user_id, changed):
+    """Writes repriced lines back in one statement and moves the header by the difference."""
+    if changed:
+        Cart.objects.bulk_update(changed, ['unit_price', 'price'])
+        apply(user_id, sum((line.unit_price - line.old_unit_price) * line.quantity for line in changed))
+
+
+def totals(user_ids=None):
+    """{user id: (subtotal, item count)} summed from the cart lines."""
+    queryset = Cart.objects.all() if user_ids is None else Cart.objects.filter(user_id__in=user_ids)
+    rows = queryset.values('user_id').annotate(subtotal=Sum('price'), item_count=Sum('quantity')).order_by()
+    return {row['user_id']: (row['subtotal'], row['item_count']) for row in rows.iterator()}
+
+
+def rebuild(user_ids, batch_size=1000):
+    """Recompute the headers of `user_ids` from their lines (bulk writes, in one transaction)."""
+    user_ids = set(user_ids)
+    with transaction.atomic():
+        actual = totals(user_ids)
+        headers = {header.user_id: header for header in CartHeader.objects.filter(user_id__in=user_ids)}
+        for user_id, header in headers.items():
+            header.subtotal, header.item_count = actual.get(user_id, (Decimal(0), 0))
+            header.revision += 1
+        CartHeader.objects.bulk_update(headers.values(), ['subtotal', 'item_count', 'revision'], batch_size=batch_size)
+        CartHeader.objects.bulk_create((
+            CartHeader(user_id=user_id, subtotal=subtotal, item_count=item_count, revision=1)
+            for user_id, (subtotal, item_count) in actual.items() if user_id not in headers
+        ), batch_size=batch_size)
+
+
+def check(fix=False):
+    """
+    Returns [(user id, (header subtotal, item count), (line subtotal, item count))] for every header that
+    disagrees with the lines, a missing header counting as zeros. With `fix`, those headers are rebuilt.
+    """
+    actual = totals()
+    stored = {row[0]: row[1:] for row in CartHeader.objects.values_list('user_id', 'subtotal', 'item_count').iterator()}
+    empty = (Decimal(0), 0)
+    mismatches = [
+        (user_id, stored.get(user_id, empty), actual.get(user_id, empty))
+        for user_id in sorted(stored.keys() | actual.keys())
+        if tuple(stored.get(user_id, empty)) != tuple(actual.get(user_id, empty))
+    ]
+    if fix and mismatches:
+        rebuild([user_id for user_id, _, _ in mismatches])
+    return mismatches
+
+
+def menu_item_deleted(sender, instance, **kwargs):
+    # pre_delete receiver for MenuItem: its cart lines are about to go by cascade, in the same transaction
+    lines = Cart.objects.filter(menuitem_id=instance.id).values('user_id').annotate(subtotal=Sum('price'), item_count=Sum('quantity'))
+    for row in lines.order_by():
+        apply(row['user_id'], -row['subtotal'], -row['item_count'])
@@ -0,0 +1,127 @@
+"""
+Assignment of orders to delivery crew: bulk assignment for `/api/orders/assign`
+and the crew work queue's "claim next order" for `/api/orders/queue/claim`.
+"""
+import heapq
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, Q, Value, When
+
+from .jobs import enqueue
+from .models import Order
+
+CHUNK_SIZE = 500 # Keeps the CASE statement well under SQLite's bound parameter limit
+
+
+class AssignmentError(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def crew_ids_in(ids):
+    return set(User.objects.filter(id__in=ids, groups__name='Delivery Crew').values_list('id', flat=True))
+
+
+def _update(assignments, only_unassigned=False):
+    updated = 0
+    items = list(assignments.items())
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = items[start:start + CHUNK_SIZE]
+        queryset = Order.objects.filter(id__in=[order_id for order_id, _ in chunk])
+        if only_unassigned:
+            queryset = queryset.filter(delivery_crew__isnull=True)
+        updated += queryset.update(delivery_crew_id=Case(
+            *[When(id=order_id, then=Value(crew_id)) for order_id, crew_id in chunk]
+            , output_field=BigIntegerField()
+        ))
+    return updated
+
+
+def assign_orders(assignments):
+    """
+    Apply `{order_id: delivery_crew_id}` in one transaction. Every crew id is
+    validated with one query and every order with another; nothing is written
+    if any of them is invalid (raises AssignmentError).
+    """
+    errors = {}
+    invalid_crew = set(assignments.values()) - crew_ids_in(set(assignments.values()))
+    if invalid_crew:
+        errors['delivery_crew_id'] = ["User id '{}' is not a 'Delivery Crew'".format(crew_id) for crew_id in sorted(invalid_crew)]
+
+    with transaction.atomic():
+        current = {
+            order_id: (crew_id, status)
+            for order_id, crew_id, status in Order.objects.filter(id__in=assignments.keys()).values_list('id', 'delivery_crew_id', 'status')
+        }
+        missing = set(assignments) - set(current)
+        if missing:
+            errors['order_id'] = ["Order id '{}' does not exists".format(order_id) for order_id in sorted(missing)]
+        if errors:
+            raise AssignmentError(errors)
+
+        _update(assignments)
+
+        for order_id, crew_id in assignments.items(): # Delivered orders move between crew in the rollup
+            previous_crew_id, status = current[order_id]
+            if status and previous_crew_id != crew_id:
+                enqueue('rollup_delivery', order_id=order_id)
+    return assignments
+
+
+def auto_balance(limit=500):
+    """
+    Spread the oldest unassigned open orders over the delivery crew, always
+    giving the next order to the crew member with the fewest open orders.
+    Returns the assignments that were made; orders assigned by someone else
+    in the meantime keep their crew and are left out.
+    """
+    loads = [
+        (load, crew_id) for crew_id, load in User.objects.filter(groups__name='Delivery Crew')
+        .annotate(load=Count('delivery_crew', filter=Q(delivery_crew__status=False))).values_list('id', 'load')
+    ]
+    if not loads:
+        return {}
+    heapq.heapify(loads)
+
+    assignments = {}
+    with transaction.atomic():
+        # Databases with row locks hold the candidates until commit and skip the ones a claimant holds
+        candidates = Order.objects.select_for_update(skip_locked=True).filter(
+            delivery_crew__isnull=True, status=False
+        ).order_by('date', 'id').values_list('id', flat=True)[:limit]
+        for order_id in candidates:
+            load, crew_id = heapq.heappop(loads)
+            assignments[order_id] = crew_id
+            heapq.heappush(loads, (load + 1, crew_id))
+
+        if _update(assignments, only_unassigned=True) < len(assignments):
+            # Some were assigned between the read and the UPDATE (no row locks, e.g. SQLite): keep what we changed.
+            # The UPDATE wrote our crew ids, so after it a row holding another crew id is someone else's
+            current = dict(Order.objects.filter(id__in=assignments.keys()).values_list('id', 'delivery_crew_id'))
+            assignments = {order_id: crew_id for order_id, crew_id in assignments.items() if current[order_id] == crew_id}
+    return assignments
+
+
+def next_unassigned_order():
+    # Oldest unassigned open order; with row locks, the ones other claimants hold are skipped
+    return Order.objects.select_for_update(skip_locked=True).filter(
+        delivery_crew__isnull=True, status=False
+    ).order_by('date', 'id').values_list('id', flat=True).first()
+
+
+def claim_next_order(crew_id):
+    """
+    Assign the oldest unassigned open order to `crew_id` and return its id, or
+    None if there is nothing to claim. The conditional UPDATE only succeeds
+    for one claimant; losers retry with the next order until there is none
+    left. Every lost race means another order was claimed, so the loop ends.
+    """
+    while True:
+        with transaction.atomic():
+            order_id = next_unassigned_order()
+            if order_id is None:
+                return None
+            if Order.objects.filter(id=order_id, delivery_crew__isnull=True).update(delivery_crew_id=crew_id):
+                return order_id
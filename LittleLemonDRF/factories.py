@@ -0,0 +1,112 @@
+"""
+Bulk fixture factories for the test suite and the benchmarks.
+
+Each factory creates its rows with `bulk_create`, in a handful of queries
+whatever the count, and returns the saved objects (with ids, which SQLite
+3.35+ and PostgreSQL return from the insert). Values come from a seeded
+`random.Random`, so the same arguments build the same data.
+
+`bulk_create` skips `save()` and the signals behind it: `create_menu_items`
+bumps the menu version itself (the price index and the cached menu listings
+follow it), `create_carts` rebuilds the cart headers of its users, and
+orders are not rolled up; call `rollups.rebuild()` when the reports matter.
+"""
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group
+from django.utils.text import slugify
+
+from .models import Category, MenuItem, Cart, Order, OrderItem
+from .price_index import bump_menu_version
+from . import carts as cart_headers
+
+ROLES = ('Manager', 'Delivery Crew', 'Customer')
+
+
+def create_groups(names=ROLES):
+    """Returns {name: Group}; groups that already exist are reused."""
+    Group.objects.bulk_create([Group(name=name) for name in names], ignore_conflicts=True)
+    return {group.name: group for group in Group.objects.filter(name__in=names)}
+
+
+def create_users(count, prefix='user', group=None, password=None, **fields):
+    # Every user gets the same hash, so only one password is hashed however many users there are
+    password = make_password(password)
+    users = User.objects.bulk_create([
+        User(username='{}{}'.format(prefix, i), email='{}{}@littlelemon.test'.format(prefix, i), password=password, **fields)
+        for i in range(count)
+    ])
+    if group is not None:
+        User.groups.through.objects.bulk_create([User.groups.through(user_id=user.id, group_id=group.id) for user in users])
+    return users
+
+
+def create_categories(count, prefix='Category'):
+    return Category.objects.bulk_create([
+        Category(title='{} {}'.format(prefix, i), slug=slugify('{} {}'.format(prefix, i))) for i in range(count)
+    ])
+
+
+def create_menu_items(count, categories, prefix='Menu item', featured_every=10, seed=0):
+    rng = random.Random(seed)
+    menu_items = MenuItem.objects.bulk_create([
+        MenuItem(
+            title = '{} {}'.format(prefix, i)
+            , price = Decimal(rng.randrange(200, 4000)) / 100
+            , featured = i % featured_every == 0
+            , category = categories[i % len(categories)]
+        )
+        for i in range(count)
+    ])
+    bump_menu_version()
+    return menu_items
+
+
+def create_carts(users, menu_items, lines_per_user=2, seed=0):
+    rng = random.Random(seed)
+    carts = []
+    for user in users:
+        for menuitem in rng.sample(menu_items, lines_per_user): # (menuitem, user) is unique
+            quantity = rng.randint(1, 4)
+            carts.append(Cart(
+                user=user, menuitem=menuitem, quantity=quantity, unit_price=menuitem.price, price=menuitem.price * quantity
+            ))
+    carts = Cart.objects.bulk_create(carts)
+    cart_headers.rebuild(user.id for user in users)
+    return carts
+
+
+def create_orders(count, customers, menu_items, lines_per_order=3, crew=(), assigned_ratio=1.0, delivered_ratio=0.0
+, start_date=date(2024, 1, 1), days=365, seed=0):
+    """
+    `count` orders of `lines_per_order` distinct menu items each, spread over `days` days from `start_date`.
+    With `crew`, `assigned_ratio` of the orders are assigned round-robin and `delivered_ratio` of those are
+    marked delivered.
+    Returns the orders; their lines are in `OrderItem`.
+    """
+    rng = random.Random(seed)
+    orders, lines = [], []
+    for i in range(count):
+        order_lines = []
+        for menuitem in rng.sample(menu_items, lines_per_order): # (order, menuitem) is unique
+            quantity = rng.randint(1, 4)
+            order_lines.append(OrderItem(menuitem=menuitem, quantity=quantity, unit_price=menuitem.price, price=menuitem.price * quantity))
+        delivery_crew = crew[i % len(crew)] if crew and rng.random() < assigned_ratio else None
+        orders.append(Order(
+            user = customers[i % len(customers)]
+            , delivery_crew = delivery_crew
+            , status = delivery_crew is not None and rng.random() < delivered_ratio
+            , total = sum(line.price for line in order_lines)
+            , date = start_date + timedelta(days=rng.randrange(days))
+        ))
+        lines.append(order_lines)
+
+    orders = Order.objects.bulk_create(orders)
+    for order, order_lines in zip(orders, lines):
+        for line in order_lines:
+            line.order = order
+    OrderItem.objects.bulk_create([line for order_lines in lines for line in order_lines])
+    return orders
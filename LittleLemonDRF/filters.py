@@ -0,0 +1,104 @@
+"""
+Filtering and ordering for `GET /api/menu-items`, kept to the indexed columns.
+
+`MenuItemFilter` validates `price__gte`, `price__lte`, `featured`, `category`
+(id or slug) and `title` (prefix) with `MenuItemFilterSerializer`; invalid
+values are answered with 400 instead of being ignored. Every filter maps onto
+an index: price, featured, title, the category foreign key or the category
+slug. `IndexedOrderingFilter` only sorts by indexed columns, with the id as
+the tie-breaker (SQLite index entries end with the rowid, so `price, id` is
+still read in index order).
+
+Listings are cached by `MenuItemView` under `menu_cache_key`: the menu
+version (bumped whenever a menu item or category changes, see
+price_index.py) plus the normalized query, so `?price__gte=5` and
+`?price__gte=5.00` share an entry.
+"""
+import hashlib
+import json
+import sys
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .links import get_links
+from .price_index import get_menu_version
+from .serializers import MenuItemFilterSerializer
+
+FILTER_PARAMS = list(MenuItemFilterSerializer().fields)
+
+DEFAULTS = {
+    'TIMEOUT': 300, # seconds, bounds staleness for changes the signals cannot see (QuerySet.update)
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'MENU_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def parse_filters(request):
+    # Validated filters from the query string, cached on the request (the menu cache key reads them too)
+    http_request = getattr(request, '_request', request)
+    filters = getattr(http_request, '_littlelemon_menu_filters', None)
+    if filters is None:
+        params = {name: request.query_params[name] for name in FILTER_PARAMS if name in request.query_params}
+        serializer = MenuItemFilterSerializer(data=params)
+        if not serializer.is_valid():
+            raise ValidationError(serializer.errors)
+        filters = http_request._littlelemon_menu_filters = dict(serializer.validated_data)
+    return filters
+
+
+def prefix_range(prefix):
+    # 'Sal' -> ('Sal', 'Sam'): a range the title index can serve, unlike LIKE 'Sal%' on SQLite
+    last = ord(prefix[-1])
+    if last == sys.maxunicode:
+        return None
+    return prefix, prefix[:-1] + chr(last + 1)
+
+
+class MenuItemFilter(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        filters = parse_filters(request)
+        lookups = {}
+        for name in ('price__gte', 'price__lte', 'featured'):
+            if name in filters:
+                lookups[name] = filters[name]
+        if 'category' in filters:
+            category = filters['category']
+            lookups['category_id' if isinstance(category, int) else 'category__slug'] = category
+        if filters.get('title'):
+            title_range = prefix_range(filters['title'])
+            if title_range is not None:
+                lookups['title__gte'], lookups['title__lt'] = title_range
+            lookups['title__startswith'] = filters['title'] # Keeps the exact semantics where collation ordering differs
+        return queryset.filter(**lookups)
+
+
+class IndexedOrderingFilter(OrderingFilter):
+    # `ordering_fields` must be set on the view; anything else in `?ordering=` is ignored, like DRF does
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view) or []
+        if ordering and ordering[-1].lstrip('-') not in ('id', 'pk'):
+            # Stable pages for ties (e.g. equal prices), in the same direction so the index can still be scanned
+            ordering = list(ordering) + ['-id' if ordering[-1].startswith('-') else 'id']
+        return ordering
+
+
+def menu_cache_key(request, view):
+    # Everything the listing depends on, normalized: validated filters, effective ordering, search, page,
+    # and the scheme and host of the links in it
+    queryset = view.get_queryset()
+    ordering = IndexedOrderingFilter().get_ordering(request, queryset, view)
+    params = request.query_params
+    query = {
+        'filters': {name: str(value) for name, value in parse_filters(request).items()}
+        , 'ordering': ordering
+        , 'search': params.get('search', '').strip()
+        , 'page': params.get(view.paginator.page_query_param, '1') if view.paginator else None
+        , 'page_size': params.get(view.paginator.page_size_query_param) if view.paginator else None
+        , 'origin': get_links(request).origin
+    }
+    digest = hashlib.sha256(json.dumps(query, sort_keys=True).encode()).hexdigest()
+    return 'littlelemon:menu-list:{}:{}'.format(get_menu_version(), digest)
@@ -0,0 +1,42 @@
+"""
+PBKDF2 password hasher with a configurable cost.
+
+Login (djoser's TokenCreateView) and registration (UserView) spend nearly all
+of their CPU time hashing the password, so the iteration count is a setting:
+PASSWORD_HASHING['ITERATIONS'], picked with `python manage.py bench_login`.
+It never goes below Django's own count unless
+PASSWORD_HASHING['ALLOW_FEWER_ITERATIONS'] is set.
+Existing `pbkdf2_sha256` hashes keep working whatever their iteration count;
+Django rehashes a password whose count is below the current one the next time
+its user logs in (`must_update`), so raising the setting upgrades accounts
+transparently. Lowering it never downgrades a stored hash.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, must_update_salt
+
+DEFAULTS = {
+    'ITERATIONS': PBKDF2PasswordHasher.iterations, # Django's default for its version
+    'ALLOW_FEWER_ITERATIONS': False, # Explicit opt-in to counts below Django's
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, DEFAULTS[name])
+
+
+def get_iterations():
+    if get_setting('ALLOW_FEWER_ITERATIONS'):
+        return get_setting('ITERATIONS')
+    return max(get_setting('ITERATIONS'), PBKDF2PasswordHasher.iterations)
+
+
+class ProfiledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # Same algorithm name, so it reads and upgrades the hashes Django's own PBKDF2 hasher wrote
+    @property
+    def iterations(self):
+        return get_iterations()
+
+    def must_update(self, encoded):
+        # Only upgrades: a hash with more iterations than configured stays as it is
+        decoded = self.decode(encoded)
+        return decoded['iterations'] < self.iterations or must_update_salt(decoded['salt'], self.salt_entropy)
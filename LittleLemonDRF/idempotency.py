@@ -0,0 +1,114 @@
+"""
+`Idempotency-Key` support for POST handlers (checkout, cart).
+
+The first request with a key runs the handler and stores its response in the
+same transaction. Retries with the same key get the stored response back
+from one indexed lookup, with the same status, body and
+IDEMPOTENCY['REPLAY_HEADERS'] (Location, ETag, ...), without running the
+handler again, except for server errors and responses the handler marks
+with `not_stored`. Keys are scoped
+to the user and expire after IDEMPOTENCY['TTL'] seconds; expired rows are
+removed by `python manage.py purge_idempotency_keys`.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_422_UNPROCESSABLE_ENTITY
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+DEFAULTS = {
+    'TTL': 24 * 60 * 60, # seconds
+    'PURGE_BATCH_SIZE': 1000,
+    'REPLAY_HEADERS': ('Location', 'ETag', 'Last-Modified'),
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'IDEMPOTENCY', {}).get(name, DEFAULTS[name])
+
+
+def fingerprint(request):
+    # Same method, path and data (in any field order) means the same request
+    data = request.data
+    if hasattr(data, 'lists'): # QueryDict
+        data = dict(data.lists())
+    content = json.dumps([request.method, request.get_full_path(), data], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def replay(stored, request_hash):
+    if stored.request_hash != request_hash:
+        return Response(
+            "'{}' was already used for a different request".format(HEADER), status=HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(stored.response_data, status=stored.response_status, headers={**stored.response_headers, REPLAYED_HEADER: 'true'})
+
+
+def not_stored(response):
+    # For answers a retry with the same key should not get back, e.g. a refusal the handler has already
+    # resolved (the cart was repriced) so that the same request now succeeds
+    response.idempotency_store = False
+    return response
+
+
+def idempotent(handler):
+    """Decorator for APIView handlers. Requests without the header are handled as usual."""
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > 255:
+            return Response("'{}' must be 1 to 255 characters long".format(HEADER), status=HTTP_400_BAD_REQUEST)
+
+        request_hash = fingerprint(request)
+        now = timezone.now()
+        stored = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if stored is not None and stored.expires_at > now:
+            return replay(stored, request_hash)
+
+        try:
+            with transaction.atomic():
+                response = handler(view, request, *args, **kwargs)
+                # Server errors and `not_stored` responses are not stored, so a retry runs again
+                if response.status_code < 500 and getattr(response, 'idempotency_store', True):
+                    if stored is not None:
+                        IdempotencyKey.objects.filter(id=stored.id).delete()
+                    IdempotencyKey.objects.create(
+                        user = request.user
+                        , key = key
+                        , request_hash = request_hash
+                        , response_status = response.status_code
+                        , response_data = response.data
+                        , response_headers = {name: response[name] for name in get_setting('REPLAY_HEADERS') if response.has_header(name)}
+                        , expires_at = now + timedelta(seconds=get_setting('TTL'))
+                    )
+        except IntegrityError:
+            # A concurrent request with the same key committed first: everything above was rolled back
+            stored = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if stored is None:
+                raise
+            return replay(stored, request_hash)
+        return response
+    return wrapper
+
+
+def purge_expired(batch_size=None):
+    """Delete expired keys in batches. Returns the number of rows deleted."""
+    batch_size = batch_size or get_setting('PURGE_BATCH_SIZE')
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,161 @@
+"""
+Lightweight database-backed job queue.
+
+Jobs are rows in the `Job` table. `enqueue` writes the row inside the caller's
+transaction and, once that transaction commits, hands the job id to an
+in-process thread pool. Anything the pool does not pick up (pool disabled,
+process restarted, retry scheduled for later) is drained by
+`python manage.py run_jobs`.
+
+A claimed job holds a lease of JOB_QUEUE['LEASE'] seconds. If its worker
+dies mid-job the job stays RUNNING, and `run_pending` puts it back to
+PENDING (or FAILED, when it is out of attempts) once the lease has expired,
+so every job runs at least once. Handlers must therefore be idempotent, and
+the lease must be longer than the slowest job.
+"""
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'EXECUTOR_WORKERS': 2, # 0 disables the in-process thread pool
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 30, # seconds, multiplied by the attempt number
+    'LEASE': 300, # seconds a RUNNING job may take before it is reclaimed
+}
+
+_handlers = {}
+_executor = None
+_executor_lock = Lock()
+
+
+def get_setting(name):
+    return getattr(settings, 'JOB_QUEUE', {}).get(name, DEFAULTS[name])
+
+
+def register(name):
+    """Decorator registering `func(**payload)` as the handler of job `name`."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def get_executor():
+    global _executor
+    workers = get_setting('EXECUTOR_WORKERS')
+    if not workers:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='littlelemon-jobs')
+    return _executor
+
+
+def enqueue(name, max_attempts=None, delay=0, **payload):
+    if name not in _handlers:
+        raise ValueError("Job '{}' is not registered".format(name))
+
+    job = Job.objects.create(
+        name = name
+        , payload = payload
+        , max_attempts = max_attempts or get_setting('MAX_ATTEMPTS')
+        , run_after = timezone.now() + timedelta(seconds=delay)
+    )
+    if not delay:
+        transaction.on_commit(lambda: _submit(job.id))
+    return job
+
+
+def _submit(job_id):
+    executor = get_executor()
+    if executor is not None:
+        executor.submit(_run_in_thread, job_id)
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def claim(job_id):
+    # The conditional UPDATE is the lock: only one worker gets rowcount == 1
+    now = timezone.now()
+    return Job.objects.filter(
+        id=job_id, status=Job.PENDING, run_after__lte=now
+    ).update(status=Job.RUNNING, attempts=F('attempts') + 1, lease_expires_at=now + timedelta(seconds=get_setting('LEASE'))) == 1
+
+
+def reclaim_expired():
+    """Put RUNNING jobs whose lease has expired back in the queue, or fail them when out of attempts."""
+    now = timezone.now()
+    expired = Job.objects.filter(status=Job.RUNNING, lease_expires_at__lt=now)
+    error = 'Lease expired: the worker running the job stopped before finishing it'
+    failed = expired.filter(attempts__gte=F('max_attempts')).update(status=Job.FAILED, lease_expires_at=None, last_error=error)
+    retried = expired.update(status=Job.PENDING, run_after=now, lease_expires_at=None, last_error=error)
+    if failed or retried:
+        logger.warning('Reclaimed %s job(s) with an expired lease, %s out of attempts', failed + retried, failed)
+    return retried
+
+
+def run_job(job_id):
+    """Run a single job if it can be claimed. Returns the final status or None."""
+    if not claim(job_id):
+        return None
+
+    job = Job.objects.get(id=job_id)
+    handler = _handlers.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError("No handler registered for job '{}'".format(job.name))
+        with transaction.atomic():
+            handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()[-4000:]
+        if job.attempts < job.max_attempts:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(seconds=get_setting('RETRY_DELAY') * job.attempts)
+        else:
+            job.status = Job.FAILED
+        logger.warning('Job %s #%s failed (attempt %s/%s)', job.name, job.id, job.attempts, job.max_attempts)
+    else:
+        job.status = Job.DONE
+    job.lease_expires_at = None
+    job.save(update_fields=['status', 'run_after', 'last_error', 'lease_expires_at', 'updated_at'])
+    return job.status
+
+
+def run_pending(limit=100):
+    """Run due jobs in this thread, oldest first. Returns the number of jobs run."""
+    reclaim_expired()
+    due_ids = Job.objects.filter(
+        status=Job.PENDING, run_after__lte=timezone.now()
+    ).order_by('run_after', 'id').values_list('id', flat=True)[:limit]
+
+    return sum(1 for job_id in list(due_ids) if run_job(job_id) is not None)
+
+
+def queue_depth():
+    """Job counts per name and status, plus the age of the oldest pending job."""
+    stats = {'total': {}, 'jobs': {}}
+    for row in Job.objects.values('name', 'status').annotate(count=Count('id')).order_by('name', 'status'):
+        stats['jobs'].setdefault(row['name'], {})[row['status']] = row['count']
+        stats['total'][row['status']] = stats['total'].get(row['status'], 0) + row['count']
+
+    oldest = Job.objects.filter(status=Job.PENDING).aggregate(oldest=Min('run_after'))['oldest']
+    stats['oldest_pending_seconds'] = max((timezone.now() - oldest).total_seconds(), 0) if oldest else 0
+    return stats
@@ -0,0 +1,82 @@
+"""
+Absolute links for the API (category -> menu items, resource `url` fields,
+pagination `next`/`previous`).
+
+Route paths are reversed once per process: the URLconf doesn't change while
+the process runs, so `path('menu-items')` is a dictionary lookup after the
+first call, and `resource('menu-item', pk)` fills one cached template. The
+scheme and host are read once per request (`get_links(request)`), and query
+strings are built with `urlencode`, so values like 'Fish & Chips' survive.
+"""
+import functools
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.urls import get_script_prefix, get_urlconf, reverse
+from django.utils.encoding import escape_uri_path
+
+PLACEHOLDER = 987654321 # Stands in for the id when reversing a detail route into a template
+
+
+def get_cache_key():
+    # The same name reverses differently under another URLconf or script prefix (tests, FORCE_SCRIPT_NAME)
+    return get_urlconf() or settings.ROOT_URLCONF, get_script_prefix()
+
+
+@functools.lru_cache(maxsize=None)
+def reverse_path(name, cache_key):
+    return reverse(name)
+
+
+@functools.lru_cache(maxsize=None)
+def reverse_template(name, cache_key):
+    # '/api/orders/987654321' -> ('/api/orders/', '')
+    prefix, suffix = reverse(name, args=[PLACEHOLDER]).rsplit(str(PLACEHOLDER), 1)
+    return prefix, suffix
+
+
+def path(name):
+    return reverse_path(name, get_cache_key())
+
+
+def resource_path(name, pk):
+    prefix, suffix = reverse_template(name, get_cache_key())
+    return '{}{}{}'.format(prefix, int(pk), suffix)
+
+
+def clear():
+    reverse_path.cache_clear()
+    reverse_template.cache_clear()
+
+
+class LinkBuilder:
+    def __init__(self, request=None):
+        # Without a request (e.g. serializers used outside a view) links are relative
+        self.request = request
+        self.origin = '{}://{}'.format(request.scheme, request.get_host()) if request is not None else ''
+
+    def url(self, name, query=None):
+        url = self.origin + path(name)
+        return url + '?' + urlencode(query, doseq=True) if query else url
+
+    def resource(self, name, pk):
+        return self.origin + resource_path(name, pk)
+
+    def current(self, **params):
+        # The requested URL with `params` replaced; None removes a parameter. Keys are sorted like DRF's
+        # replace_query_param does, so links don't change
+        query = {key: values for key, values in self.request.GET.lists() if key not in params}
+        query.update({key: [value] for key, value in params.items() if value is not None})
+        url = self.origin + escape_uri_path(self.request.path)
+        return url + '?' + urlencode(sorted(query.items()), doseq=True) if query else url
+
+
+def get_links(request):
+    # Cached on the request, like the roles, so every serializer and paginator of a request shares it
+    if request is None:
+        return LinkBuilder()
+    http_request = getattr(request, '_request', request)
+    links = getattr(http_request, '_littlelemon_links', None)
+    if links is None:
+        links = http_request._littlelemon_links = LinkBuilder(http_request)
+    return links
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonDRF.archive import archivable_orders, archive_orders, get_setting
+
+
+class Command(BaseCommand):
+    help = 'Move delivered orders older than ORDER_ARCHIVE["AFTER_DAYS"] days into the archive tables, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Override ORDER_ARCHIVE["AFTER_DAYS"]')
+        parser.add_argument('--batch-size', type=int, default=None, help='Override ORDER_ARCHIVE["BATCH_SIZE"]')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the orders that would be archived')
+
+    def handle(self, *args, **options):
+        days = get_setting('AFTER_DAYS') if options['days'] is None else options['days']
+
+        if options['dry_run']:
+            self.stdout.write('{} delivered order(s) older than {} day(s) can be archived'.format(
+                archivable_orders(days).count(), days
+            ))
+            return
+
+        moved = archive_orders(after_days=days, batch_size=options['batch_size'], max_batches=options['max_batches'])
+        self.stdout.write('Archived {} order(s)'.format(moved))
@@ -0,0 +1,111 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from statistics import median
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter, so every import and cache is cold
+SCRIPT = '''
+import json, os, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+import django
+django.setup()
+setup_done = time.perf_counter()
+
+from django.urls import get_resolver
+get_resolver().url_patterns
+urls_done = time.perf_counter()
+
+if {warm_up!r}:
+    from LittleLemonDRF.warmup import warm_up
+    warm_up()
+warm_up_done = time.perf_counter()
+
+from django.conf import settings
+from django.test import Client
+host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost').lstrip('.')
+client = Client(HTTP_HOST=host)
+status = client.get({path!r}).status_code
+first_done = time.perf_counter()
+client.get({path!r})
+second_done = time.perf_counter()
+
+print(json.dumps({{
+    'status': status
+    , 'setup': setup_done - started
+    , 'urls': urls_done - setup_done
+    , 'warm up': warm_up_done - urls_done
+    , 'first response': first_done - warm_up_done
+    , 'second response': second_done - first_done
+    , 'to first response': first_done - started
+}}))
+'''
+
+
+def parse_importtime(output):
+    # `-X importtime` lines: "import time: self [us] | cumulative | imported package", nesting shown by indentation
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), len(name) - len(name.lstrip()), int(self_us), int(cumulative_us)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start (import time breakdown and time to first response) in fresh processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Fresh processes to start, the median is reported')
+        parser.add_argument('--path', default='/api/menu-items', help='Endpoint requested first')
+        parser.add_argument('--top', type=int, default=15, help='Packages and modules to list in the import breakdown')
+        parser.add_argument('--no-warm-up', action='store_true', help='Skip LittleLemonDRF.warmup before the first request')
+        parser.add_argument('--budget', type=float, default=None, help='Fail if the median process start to first response (ms) exceeds this')
+
+    def run_once(self, warm_up, path):
+        script = SCRIPT.format(settings_module=os.environ['DJANGO_SETTINGS_MODULE'], warm_up=warm_up, path=path)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(settings.BASE_DIR), os.environ.get('PYTHONPATH')])))
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        wall = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError('Cold start run failed:\n{}'.format(result.stderr[-2000:]))
+
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        timings['process start to first response'] = wall - timings.pop('second response') # Includes interpreter startup
+        return timings, parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        warm_up = not options['no_warm_up']
+        runs = [self.run_once(warm_up, options['path']) for _ in range(options['runs'])]
+
+        self.stdout.write('Cold start over {} run(s), first request GET {} (status {}), warm-up {}'.format(
+            len(runs), options['path'], runs[-1][0]['status'], 'on' if warm_up else 'off'
+        ))
+        for step in ('setup', 'urls', 'warm up', 'first response', 'to first response', 'process start to first response'):
+            self.stdout.write('  {:<34} {:>9.1f} ms'.format(step, median(timings[step] for timings, _ in runs) * 1000))
+
+        modules = runs[-1][1]
+        packages = defaultdict(int)
+        for name, indent, _, cumulative in modules:
+            if indent == 1: # Top level imports only, so nested ones are not counted twice
+                packages[name.split('.')[0]] += cumulative
+        self.stdout.write('Import time by top-level package (last run):')
+        for package, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write('  {:<34} {:>9.1f} ms'.format(package, cumulative / 1000))
+        self.stdout.write('Slowest modules by self time (last run):')
+        for name, _, self_us, _ in sorted(modules, key=lambda module: -module[2])[:options['top']]:
+            self.stdout.write('  {:<34} {:>9.1f} ms'.format(name, self_us / 1000))
+
+        total_ms = median(timings['process start to first response'] for timings, _ in runs) * 1000
+        if options['budget'] is not None and total_ms > options['budget']:
+            raise CommandError('Cold start {:.1f} ms is over the {:.1f} ms budget'.format(total_ms, options['budget']))
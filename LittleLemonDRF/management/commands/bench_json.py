@@ -0,0 +1,54 @@
+import io
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from LittleLemonDRF.management.commands.bench_renderers import cpu_ms, order_payload
+from LittleLemonDRF.models import Category, MenuItem
+from LittleLemonDRF.parsers import FastJSONParser
+from LittleLemonDRF.renderers import FastJSONRenderer, orjson
+from LittleLemonDRF.serializers import MenuItemSerializer
+
+
+def menu_payload(items):
+    # `GET /api/menu-items` for unsaved menu items, so the Decimal prices go through the serializer as usual
+    categories = [Category(id=i + 1, slug='category-{}'.format(i), title='Category {}'.format(i)) for i in range(5)]
+    menu_items = [
+        MenuItem(id=i + 1, title='Menu item {}'.format(i), price=Decimal(i % 50) + Decimal('0.25'), featured=i % 7 == 0
+        , category=categories[i % 5])
+        for i in range(items)
+    ]
+    return MenuItemSerializer(menu_items, many=True).data
+
+
+class Command(BaseCommand):
+    help = "Compare DRF's JSON renderer and parser with the orjson backed ones on menu and order payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000, help='Menu items / order lines per payload')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per measurement, the best is reported')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write('orjson is not installed: both renderers use the standard json module')
+
+        repeat = options['repeat']
+        self.stdout.write('{:<8} {:>10} {:>14} {:>14} {:>13} {:>13}'.format(
+            'payload', 'bytes', 'drf render ms', 'fast render ms', 'drf parse ms', 'fast parse ms'
+        ))
+        for name, payload in (('menu', menu_payload(options['items'])), ('orders', order_payload(options['items']))):
+            expected, drf_render = cpu_ms(lambda: JSONRenderer().render(payload), repeat)
+            content, fast_render = cpu_ms(lambda: FastJSONRenderer().render(payload), repeat)
+            if content != expected:
+                raise CommandError('FastJSONRenderer output differs from JSONRenderer for the {} payload'.format(name))
+
+            parsed, drf_parse = cpu_ms(lambda: JSONParser().parse(io.BytesIO(content)), repeat)
+            fast_parsed, fast_parse = cpu_ms(lambda: FastJSONParser().parse(io.BytesIO(content)), repeat)
+            if fast_parsed != parsed:
+                raise CommandError('FastJSONParser result differs from JSONParser for the {} payload'.format(name))
+
+            self.stdout.write('{:<8} {:>10} {:>14.2f} {:>14.2f} {:>13.2f} {:>13.2f}'.format(
+                name, len(content), drf_render, fast_render, drf_parse, fast_parse
+            ))
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.request import Request
+from rest_framework.reverse import reverse
+
+from LittleLemonDRF import links
+from LittleLemonDRF.management.commands.bench_renderers import cpu_ms
+from LittleLemonDRF.models import Category
+from LittleLemonDRF.serializers import CategorySerializer
+
+
+def category_listing(categories):
+    # Unsaved categories, so nothing but the serializer is measured
+    return [Category(id=i + 1, slug='category-{}'.format(i), title='Category {} & co'.format(i)) for i in range(categories)]
+
+
+class ReversingCategorySerializer(CategorySerializer):
+    # What CategorySerializer did before: resolve and build the absolute URL for every category
+    def get_related_url(self, category):
+        return self.context['request'].build_absolute_uri(reverse('menu-items')) + '?search={}'.format(category.title)
+
+
+class Command(BaseCommand):
+    help = 'Measure link generation on a large `GET /api/category` listing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10000, help='Categories in the listing')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement, the best is reported')
+
+    def get_request(self):
+        host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost').lstrip('.')
+        return RequestFactory().get('/api/category', HTTP_HOST=host)
+
+    def handle(self, *args, **options):
+        categories, repeat = category_listing(options['categories']), options['repeat']
+
+        def listing(serializer_class):
+            return lambda: serializer_class(categories, many=True, context={'request': Request(self.get_request())}).data
+
+        _, reversing_ms = cpu_ms(listing(ReversingCategorySerializer), repeat)
+        links.clear()
+        _, cold_ms = cpu_ms(listing(CategorySerializer), 1)
+        data, cached_ms = cpu_ms(listing(CategorySerializer), repeat)
+        expected = self.get_request().build_absolute_uri(reverse('menu-items')) + '?search=Category+{}+%26+co'.format(len(categories) - 1)
+        if data[-1]['menu_items_url'] != expected:
+            raise CommandError('Unexpected menu_items_url: {}'.format(data[-1]['menu_items_url']))
+
+        self.stdout.write('GET /api/category serialization, {} categories'.format(len(categories)))
+        self.stdout.write('  {:<44} {:>9.2f} ms'.format('reverse + build_absolute_uri per category', reversing_ms))
+        self.stdout.write('  {:<44} {:>9.2f} ms'.format('link builder, first request of the process', cold_ms))
+        self.stdout.write('  {:<44} {:>9.2f} ms'.format('link builder', cached_ms))
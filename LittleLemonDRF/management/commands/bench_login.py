@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+
+from LittleLemonDRF.hashers import ProfiledPBKDF2PasswordHasher, get_iterations
+from LittleLemonDRF.management.commands.bench_renderers import cpu_ms
+
+PASSWORD = 'bench-login-password'
+
+
+class Command(BaseCommand):
+    help = 'Measure password hashing cost per PBKDF2 iteration count and end-to-end login throughput.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', default='1000000,1500000,2000000', help=(
+            'Comma separated iteration counts to compare. Counts below Django\'s default are measured when listed here, '
+            'but only take effect with PASSWORD_HASHING["ALLOW_FEWER_ITERATIONS"]'
+        ))
+        parser.add_argument('--logins', type=int, default=20, help='Logins through /api/users/login, 0 to skip')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the best is reported')
+        parser.add_argument('--target-ms', type=float, default=None, help='Recommend the highest iteration count that verifies within this time')
+
+    def measure_hasher(self, iterations, repeat):
+        with override_settings(PASSWORD_HASHING={'ITERATIONS': iterations, 'ALLOW_FEWER_ITERATIONS': True}):
+            hasher = ProfiledPBKDF2PasswordHasher()
+            encoded = hasher.encode(PASSWORD, hasher.salt())
+            _, verify_ms = cpu_ms(lambda: hasher.verify(PASSWORD, encoded), repeat)
+        return verify_ms
+
+    def measure_logins(self, logins):
+        # Runs in a transaction that is rolled back, so the user and its tokens are not kept
+        host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost').lstrip('.')
+        client = Client(HTTP_HOST=host)
+        with transaction.atomic(), override_settings(THROTTLING={'RATES': {}}):
+            User.objects.create(username='bench-login-user', password=make_password(PASSWORD))
+            def login():
+                for _ in range(logins):
+                    resp = client.post('/api/users/login', {'username': 'bench-login-user', 'password': PASSWORD})
+                    if resp.status_code != 200:
+                        raise CommandError('Login failed with status {}: {}'.format(resp.status_code, resp.content[:200]))
+            _, total_ms = cpu_ms(login, 1)
+            transaction.set_rollback(True)
+        return total_ms / logins
+
+    def handle(self, *args, **options):
+        candidates = sorted({int(value) for value in options['iterations'].split(',')} | {get_iterations()})
+        self.stdout.write('PBKDF2-SHA256 verify cost (one login or registration hashes once), CPU time of one core:')
+        self.stdout.write('  {:>12} {:>10} {:>16}'.format('iterations', 'ms', 'logins/s/core'))
+        results = []
+        for iterations in candidates:
+            verify_ms = self.measure_hasher(iterations, options['repeat'])
+            results.append((iterations, verify_ms))
+            if iterations == get_iterations():
+                note = '  <- current'
+            elif iterations < PBKDF2PasswordHasher.iterations:
+                note = '  below Django\'s default, needs PASSWORD_HASHING["ALLOW_FEWER_ITERATIONS"]'
+            else:
+                note = ''
+            self.stdout.write('  {:>12} {:>10.1f} {:>16.1f}{}'.format(iterations, verify_ms, 1000 / verify_ms, note))
+
+        if options['logins']:
+            login_ms = self.measure_logins(options['logins'])
+            self.stdout.write('POST /api/users/login with the current settings: {:.1f} ms, {:.1f} logins/s/core'.format(
+                login_ms, 1000 / login_ms
+            ))
+
+        if options['target_ms'] is not None:
+            within = [iterations for iterations, verify_ms in results if verify_ms <= options['target_ms']]
+            if not within:
+                raise CommandError('No candidate verifies within {} ms'.format(options['target_ms']))
+            # Cost grows linearly with the count, so extrapolate from the fastest measurement
+            iterations, verify_ms = results[0]
+            suggested = int(iterations * options['target_ms'] / verify_ms) // 10000 * 10000
+            self.stdout.write('Highest measured count within {} ms: {}; about {} would take the full budget'.format(
+                options['target_ms'], max(within), suggested
+            ))
+            if suggested < PBKDF2PasswordHasher.iterations:
+                self.stdout.write('That is below Django\'s default of {}: only use it with PASSWORD_HASHING["ALLOW_FEWER_ITERATIONS"]'.format(
+                    PBKDF2PasswordHasher.iterations
+                ))
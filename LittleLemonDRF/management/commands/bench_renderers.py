@@ -0,0 +1,78 @@
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from LittleLemonDRF import factories
+from LittleLemonDRF.middleware import available_encodings, compress
+from LittleLemonDRF.models import OrderItem
+from LittleLemonDRF.renderers import MessagePackRenderer, msgpack
+from LittleLemonDRF.serializers import OrderItemSerializer
+
+
+def order_payload(lines, lines_per_order=5, expanded=True):
+    """
+    What `GET /api/orders` (OrderItemSerializer) returns for `lines` order lines, or `?expand=` when not
+    `expanded`. The rows are built with the factories in a transaction that is rolled back.
+    """
+    host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost').lstrip('.')
+    request = Request(APIRequestFactory().get('/api/orders', {} if expanded else {'expand': ''}, HTTP_HOST=host))
+    with transaction.atomic():
+        groups = factories.create_groups()
+        customers = factories.create_users(200, 'bench-customer-', groups['Customer'])
+        crew = factories.create_users(8, 'bench-crew-', groups['Delivery Crew'])
+        menu_items = factories.create_menu_items(40, factories.create_categories(5, 'Bench category'), 'Bench item')
+        orders = factories.create_orders(-(-lines // lines_per_order), customers, menu_items, lines_per_order, crew=crew)
+        queryset = OrderItem.objects.filter(order__in=orders).order_by('id')[:lines]
+        payload = OrderItemSerializer(OrderItemSerializer.fetch(queryset, request), many=True, context={'request': request}).data
+        transaction.set_rollback(True)
+    return payload
+
+
+def cpu_ms(function, repeat):
+    # Best of `repeat` runs, in CPU milliseconds
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = function()
+        elapsed = (time.process_time() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+class Command(BaseCommand):
+    help = 'Report response size and render/compression CPU time for large order listings, per renderer and encoding.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1000, help='Order lines in the payload')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per measurement, the best is reported')
+
+    def handle(self, *args, **options):
+        renderers = [('json', JSONRenderer())]
+        if msgpack is not None:
+            renderers.append(('msgpack', MessagePackRenderer()))
+        else:
+            self.stdout.write('msgpack is not installed, skipping the MessagePack renderer')
+
+        self.stdout.write('{:<10} {:<9} {:<9} {:>10} {:>11} {:>13}'.format(
+            'payload', 'renderer', 'encoding', 'bytes', 'render ms', 'compress ms'
+        ))
+        started = datetime.now()
+        for payload_name, expanded in (('expanded', True), ('ids', False)):
+            payload = order_payload(options['lines'], expanded=expanded)
+            for renderer_name, renderer in renderers:
+                content, render_ms = cpu_ms(lambda: renderer.render(payload), options['repeat'])
+                self.stdout.write('{:<10} {:<9} {:<9} {:>10} {:>11.2f} {:>13}'.format(
+                    payload_name, renderer_name, 'identity', len(content), render_ms, '-'
+                ))
+                for encoding in available_encodings():
+                    compressed, compress_ms = cpu_ms(lambda: compress(content, encoding), options['repeat'])
+                    self.stdout.write('{:<10} {:<9} {:<9} {:>10} {:>11.2f} {:>13.2f}'.format(
+                        payload_name, renderer_name, encoding, len(compressed), render_ms, compress_ms
+                    ))
+        self.stdout.write('Done in {:.1f}s'.format((datetime.now() - started).total_seconds()))
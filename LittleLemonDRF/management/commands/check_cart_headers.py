@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonDRF.carts import check
+
+
+class Command(BaseCommand):
+    help = 'Compare every cart header (subtotal, item count) with the cart lines it summarizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rebuild the headers that disagree with their lines')
+
+    def handle(self, *args, **options):
+        mismatches = check(fix=options['fix'])
+        for user_id, (stored_subtotal, stored_count), (subtotal, item_count) in mismatches:
+            self.stdout.write('User {}: header has {} item(s) for {}, lines have {} item(s) for {}'.format(
+                user_id, stored_count, stored_subtotal, item_count, subtotal
+            ))
+
+        if not mismatches:
+            self.stdout.write('All cart headers match their lines')
+        elif options['fix']:
+            self.stdout.write('Rebuilt {} cart header(s)'.format(len(mismatches)))
+        else:
+            raise CommandError('{} cart header(s) disagree with their lines, run with --fix to rebuild them'.format(len(mismatches)))
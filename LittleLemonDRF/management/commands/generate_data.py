@@ -0,0 +1,155 @@
+import itertools
+import random
+import time
+from bisect import bisect_left
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from LittleLemonDRF import carts as cart_headers, factories, rollups
+from LittleLemonDRF.models import Cart, Order, OrderItem
+
+
+def zipf_weights(count, exponent):
+    # Cumulative weights for rank 1..count, for random.choices(cum_weights=...)
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def line_count(rng, alpha, max_lines):
+    # Pareto: most orders have 1 to 3 lines, a few are large
+    return min(max_lines, int(rng.paretovariate(alpha)))
+
+
+def pick_lines(rng, item_weights, size):
+    # `size` distinct menu item indexes, popular items first in probability; quantities are mostly 1
+    picked = {}
+    while len(picked) < size:
+        item = bisect_left(item_weights, rng.random() * item_weights[-1])
+        picked.setdefault(item, min(9, 1 + int(rng.expovariate(1.5))))
+    return list(picked.items())
+
+
+def order_specs(seed, orders, customers, crew, menu_items, start_date, days, zipf=1.1, alpha=1.5, max_lines=20):
+    """
+    Yields (customer index, date, crew index or None, delivered, [(menu item index, quantity)]) for every order.
+    Only depends on the arguments, so a seed always gives the same orders. Orders are spread evenly over
+    `days` days from `start_date`; all but the last day's orders are delivered, half of the last day's are
+    assigned. Menu items and customers are picked with Zipf popularity (customers with a flatter curve).
+    """
+    rng = random.Random(seed)
+    item_weights = zipf_weights(menu_items, zipf)
+    customer_weights = zipf_weights(customers, zipf / 2)
+    size_cap = min(max_lines, menu_items)
+    for i in range(orders):
+        order_date = start_date + timedelta(days=i * days // orders)
+        customer = bisect_left(customer_weights, rng.random() * customer_weights[-1])
+        lines = pick_lines(rng, item_weights, line_count(rng, alpha, size_cap))
+
+        delivered = order_date < start_date + timedelta(days=days - 1)
+        crew_member = rng.randrange(crew) if crew and (delivered or rng.random() < 0.5) else None
+        yield customer, order_date, crew_member, delivered and crew_member is not None, lines
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic, realistic data set (skewed popularity, heavy-tail order sizes) in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='gen', help='Prefix of the generated usernames and category titles')
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--menu-items', type=int, default=300)
+        parser.add_argument('--customers', type=int, default=20000)
+        parser.add_argument('--crew', type=int, default=50)
+        parser.add_argument('--managers', type=int, default=5)
+        parser.add_argument('--carts', type=int, default=2000, help='Customers with an open cart')
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365, help='Orders are spread over this many days')
+        parser.add_argument('--start-date', type=date.fromisoformat, default=date(2024, 1, 1))
+        parser.add_argument('--zipf', type=float, default=1.1, help='Menu item popularity exponent, higher is more skewed')
+        parser.add_argument('--alpha', type=float, default=1.5, help='Pareto shape of the order sizes, lower means a heavier tail')
+        parser.add_argument('--max-lines', type=int, default=20, help='Largest order, in distinct menu items')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Orders written per transaction')
+        parser.add_argument('--skip-rollups', action='store_true', help="Don't rebuild the report rollups afterwards")
+
+    def handle(self, *args, **options):
+        prefix, started = options['prefix'], time.monotonic()
+        if User.objects.filter(username__startswith='{}_'.format(prefix)).exists():
+            raise CommandError("Users prefixed '{}_' already exist: pass another --prefix".format(prefix))
+        if options['menu_items'] < 1 or options['customers'] < 1 or options['categories'] < 1:
+            raise CommandError('--categories, --menu-items and --customers must be at least 1')
+
+        with transaction.atomic():
+            groups = factories.create_groups()
+            customers = factories.create_users(options['customers'], '{}_customer_'.format(prefix), groups['Customer'])
+            crew = factories.create_users(options['crew'], '{}_crew_'.format(prefix), groups['Delivery Crew'])
+            factories.create_users(options['managers'], '{}_manager_'.format(prefix), groups['Manager'])
+            categories = factories.create_categories(options['categories'], '{} category'.format(prefix.capitalize()))
+            menu_items = factories.create_menu_items(
+                options['menu_items'], categories, '{} item'.format(prefix.capitalize()), seed=options['seed']
+            )
+            self.write_carts(customers, menu_items, options)
+        self.stdout.write('Created {} customer(s), {} crew, {} manager(s), {} categories, {} menu item(s)'.format(
+            len(customers), len(crew), options['managers'], len(categories), len(menu_items)
+        ))
+
+        written = self.write_orders(customers, crew, menu_items, options)
+        self.stdout.write('Created {} order(s) with {} line(s) in {:.1f}s'.format(*written, time.monotonic() - started))
+
+        if not options['skip_rollups']:
+            rollups.rebuild()
+            self.stdout.write('Rebuilt rollups')
+
+    def write_carts(self, customers, menu_items, options):
+        rng = random.Random(options['seed'] + 1)
+        item_weights = zipf_weights(len(menu_items), options['zipf'])
+        carts = []
+        for customer in rng.sample(customers, min(options['carts'], len(customers))):
+            for item, quantity in pick_lines(rng, item_weights, line_count(rng, options['alpha'], min(5, len(menu_items)))):
+                menuitem = menu_items[item]
+                carts.append(Cart(
+                    user_id=customer.id, menuitem_id=menuitem.id, quantity=quantity, unit_price=menuitem.price, price=menuitem.price * quantity
+                ))
+        Cart.objects.bulk_create(carts, batch_size=options['batch_size'])
+        cart_headers.rebuild({cart.user_id for cart in carts}, batch_size=options['batch_size'])
+
+    def write_orders(self, customers, crew, menu_items, options):
+        # The database assigns the order ids (bulk_create returns them), so its id sequence stays in step and
+        # concurrent inserts can't collide with the generated orders
+        prices = [menu_item.price for menu_item in menu_items]
+        specs = order_specs(
+            options['seed'], options['orders'], len(customers), len(crew), len(menu_items), options['start_date']
+            , options['days'], options['zipf'], options['alpha'], options['max_lines']
+        )
+
+        order_count = line_count_total = 0
+        while True:
+            orders, lines = [], []
+            for customer, order_date, crew_member, delivered, order_lines in itertools.islice(specs, options['batch_size']):
+                total, order_items = Decimal(0), []
+                for item, quantity in order_lines:
+                    price = prices[item] * quantity
+                    total += price
+                    order_items.append(OrderItem(menuitem_id=menu_items[item].id, quantity=quantity, unit_price=prices[item], price=price))
+                orders.append(Order(
+                    user_id = customers[customer].id
+                    , delivery_crew_id = crew[crew_member].id if crew_member is not None else None
+                    , status = delivered
+                    , total = total
+                    , date = order_date
+                ))
+                lines.append(order_items)
+            if not orders:
+                return order_count, line_count_total
+
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                for order, order_items in zip(orders, lines):
+                    for line in order_items:
+                        line.order = order
+                lines = [line for order_items in lines for line in order_items]
+                OrderItem.objects.bulk_create(lines)
+            order_count, line_count_total = order_count + len(orders), line_count_total + len(lines)
+            self.stdout.write('  {}/{} orders'.format(order_count, options['orders']))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonDRF.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete expired Idempotency-Key records, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Override IDEMPOTENCY["PURGE_BATCH_SIZE"]')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write('Deleted {} expired idempotency key(s)'.format(deleted))
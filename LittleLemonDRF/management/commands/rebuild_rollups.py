@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonDRF.models import DailySales, MenuItemSales, CrewDeliveries
+from LittleLemonDRF.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the reporting rollup tables from the full order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuild(batch_size=options['batch_size'])
+        self.stdout.write('Rebuilt rollups: {} day(s), {} item-day row(s), {} crew-day row(s)'.format(
+            DailySales.objects.count(), MenuItemSales.objects.count(), CrewDeliveries.objects.count()
+        ))
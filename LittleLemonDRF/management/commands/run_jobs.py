@@ -0,0 +1,30 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonDRF.jobs import queue_depth, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (emails, rollups, ...). Loops forever unless --once is given.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due jobs once and exit')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--stats', action='store_true', help='Print the queue depth and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(queue_depth(), indent=2))
+            return
+
+        while True:
+            ran = run_pending(limit=options['batch_size'])
+            if ran:
+                self.stdout.write('Ran {} job(s)'.format(ran))
+            if options['once'] and ran < options['batch_size']:
+                return
+            if not ran:
+                time.sleep(options['sleep'])
@@ -0,0 +1,61 @@
+"""
+Bulk add/remove of users to the role groups ('Manager', 'Delivery Crew'), used
+by the `/api/groups/.../users` endpoints. Costs the same handful of queries
+for one user or a few hundred.
+"""
+from collections import Counter
+
+from django.contrib.auth.models import User, Group
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+ADDED = 'added'
+REMOVED = 'removed'
+ALREADY_MEMBER = 'already a member'
+NOT_MEMBER = 'not a member'
+NOT_FOUND = 'user not found'
+
+UserGroup = User.groups.through
+
+
+def change_membership(group_name, user_ids, add=True):
+    """
+    Add (or remove) `user_ids` to the group. Returns `[(user_id, result), ...]`
+    in the order given. Raises Group.DoesNotExist for an unknown group.
+    """
+    group_id = Group.objects.values_list('id', flat=True).get(name=group_name)
+
+    # Existing users and their current membership in one query
+    is_member = dict(
+        User.objects.filter(id__in=set(user_ids))
+        .annotate(is_member=Exists(UserGroup.objects.filter(user_id=OuterRef('pk'), group_id=group_id)))
+        .values_list('id', 'is_member')
+    )
+
+    results, to_change = [], []
+    for user_id in dict.fromkeys(user_ids): # Drop duplicates, keep order
+        if user_id not in is_member:
+            results.append((user_id, NOT_FOUND))
+        elif is_member[user_id] == add:
+            results.append((user_id, ALREADY_MEMBER if add else NOT_MEMBER))
+        else:
+            results.append((user_id, ADDED if add else REMOVED))
+            to_change.append(user_id)
+
+    if to_change:
+        with transaction.atomic():
+            if add:
+                UserGroup.objects.bulk_create(
+                    [UserGroup(user_id=user_id, group_id=group_id) for user_id in to_change], ignore_conflicts=True
+                )
+            else:
+                UserGroup.objects.filter(group_id=group_id, user_id__in=to_change).delete()
+    return results
+
+
+def summarize(group_name, results):
+    return {
+        'group': group_name
+        , 'summary': dict(Counter(result for _, result in results))
+        , 'results': [{'userId': user_id, 'result': result} for user_id, result in results]
+    }
@@ -0,0 +1,112 @@
+"""
+Response compression negotiated through `Accept-Encoding`.
+
+Brotli is used when the `brotli` package is installed and the client accepts
+it, gzip otherwise. Responses smaller than RESPONSE_COMPRESSION['MIN_SIZE']
+bytes are sent as they are: compressing them costs more than it saves.
+
+Compressed responses that reflect request input next to a secret leak the
+secret through their size (BREACH). gzip output gets Django's random
+filename padding; brotli has no such field, so secrets are kept out of
+compression altogether: paths under RESPONSE_COMPRESSION['EXEMPT_PATHS']
+(token login/logout and the user endpoints by default) and views decorated
+with `never_compress` are never compressed.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError: # Optional
+    brotli = None
+
+DEFAULTS = {
+    'MIN_SIZE': 1024, # bytes
+    'BROTLI_QUALITY': 5,
+    'EXEMPT_PATHS': ('/api/users/',), # Token login/logout and the djoser user endpoints
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'RESPONSE_COMPRESSION', {}).get(name, DEFAULTS[name])
+
+
+def available_encodings():
+    # In order of preference
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding):
+    """Pick the encoding for an `Accept-Encoding` header, or None to send the response as is."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for coding in available_encodings():
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=get_setting('BROTLI_QUALITY'))
+    return compress_string(content, max_random_bytes=GZipMiddleware.max_random_bytes)
+
+
+def never_compress(view_func):
+    """View decorator: its responses are sent uncompressed, for anything carrying a secret."""
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        response = view_func(*args, **kwargs)
+        response.never_compress = True
+        return response
+    return wrapper
+
+
+class CompressionMiddleware(GZipMiddleware):
+    # Django's GZipMiddleware (with its random filename padding against BREACH) plus brotli and MIN_SIZE
+    def process_response(self, request, response):
+        if getattr(response, 'never_compress', False) or request.path.startswith(tuple(get_setting('EXEMPT_PATHS'))):
+            return response
+        if response.streaming: # Size unknown up front: gzip them as Django would
+            return super().process_response(request, response)
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < get_setting('MIN_SIZE'):
+            return response
+
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding == 'gzip':
+            return super().process_response(request, response)
+        if encoding != 'br':
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'): # The body changed, so a strong ETag no longer matches it byte for byte
+            response['ETag'] = 'W/' + etag
+        return response
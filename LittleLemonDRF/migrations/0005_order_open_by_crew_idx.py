@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonDRF', '0004_order_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', False)), fields=['delivery_crew', 'date', 'id'], name='order_open_by_crew_idx'),
+        ),
+    ]
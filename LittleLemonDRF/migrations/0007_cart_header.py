@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill(apps, schema_editor):
+    # One header per user with cart lines; revision 1 so the first ETag differs from an empty cart's
+    Cart = apps.get_model('LittleLemonDRF', 'Cart')
+    CartHeader = apps.get_model('LittleLemonDRF', 'CartHeader')
+    totals = Cart.objects.values('user_id').annotate(subtotal=Sum('price'), item_count=Sum('quantity')).order_by()
+    CartHeader.objects.bulk_create((
+        CartHeader(user_id=row['user_id'], subtotal=row['subtotal'], item_count=row['item_count'], revision=1)
+        for row in totals.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonDRF', '0006_idempotency_key'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartHeader',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cart_header', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('item_count', models.IntegerField(default=0)),
+                ('revision', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
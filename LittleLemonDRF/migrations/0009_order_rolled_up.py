@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonDRF', '0008_job_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+    ]
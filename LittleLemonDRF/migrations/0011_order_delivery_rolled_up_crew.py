@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, When
+
+
+def mark_counted_orders(apps, schema_editor):
+    # Orders from before the flags were counted by their jobs or by a rebuild, unless a rollup job for them is
+    # still queued. Those keep the flags unset; `python manage.py rebuild_rollups` settles them for certain
+    Order = apps.get_model('LittleLemonDRF', 'Order')
+    Job = apps.get_model('LittleLemonDRF', 'Job')
+    queued = Job.objects.filter(status__in=['pending', 'running'])
+    queued_orders = {name: set() for name in ('rollup_order', 'rollup_delivery')}
+    for name, payload in queued.filter(name__in=queued_orders.keys()).values_list('name', 'payload').iterator():
+        if payload.get('order_id') is not None:
+            queued_orders[name].add(payload['order_id'])
+
+    Order.objects.filter(rolled_up=False).exclude(id__in=queued_orders['rollup_order']).update(rolled_up=True)
+    Order.objects.exclude(id__in=queued_orders['rollup_delivery']).update(
+        delivery_rolled_up_crew_id=Case(When(status=True, then=F('delivery_crew_id')), default=None)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonDRF', '0010_idempotencykey_response_headers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_rolled_up_crew',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(mark_counted_orders, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User, Group
 
@@ -31,12 +32,31 @@ class Cart(models.Model):
     class Meta:
         unique_together = ('menuitem', 'user')
 
+# Running totals of a user's Cart rows, kept in step by LittleLemonDRF/carts.py
+class CartHeader(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='cart_header')
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0) # Sum of Cart.price
+    item_count = models.IntegerField(default=0) # Sum of Cart.quantity
+    revision = models.IntegerField(default=0) # Bumped on every change, the cart ETag
+
+    def __str__(self):
+        return '{}: {} item(s), {} (revision {})'.format(self.user_id, self.item_count, self.subtotal, self.revision)
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='delivery_crew', null=True)
     status = models.BooleanField(db_index=True, default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True)
+    rolled_up = models.BooleanField(default=False) # Counted in the report rollups (LittleLemonDRF/rollups.py)
+    # The crew member this order's delivery is counted for in CrewDeliveries, None while it isn't
+    delivery_rolled_up_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Open orders per crew, oldest first: the crew work queue and "claim next order"
+            models.Index(fields=['delivery_crew', 'date', 'id'], condition=models.Q(status=False), name='order_open_by_crew_idx')
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -46,4 +66,97 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
     class Meta:
-        unique_together = ('order', 'menuitem')
\ No newline at end of file
+        unique_together = ('order', 'menuitem')
+
+class Job(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100, db_index=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.SmallIntegerField(default=0)
+    max_attempts = models.SmallIntegerField(default=3)
+    run_after = models.DateTimeField()
+    last_error = models.TextField(blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True) # While RUNNING: past this, the worker is presumed dead
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx')]
+
+    def __str__(self):
+        return '{} #{} ({})'.format(self.name, self.id, self.status)
+
+
+# Responses of requests sent with an `Idempotency-Key` header (see LittleLemonDRF/idempotency.py),
+# replayed when the client retries. Expired rows are removed by `python manage.py purge_idempotency_keys`.
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64) # sha256 of method, path and body
+    response_status = models.SmallIntegerField()
+    response_data = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    response_headers = models.JSONField(default=dict) # IDEMPOTENCY['REPLAY_HEADERS'] the response had
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_user_key_uniq')]
+
+    def __str__(self):
+        return '{} ({})'.format(self.key, self.user_id)
+
+
+# Delivered orders are moved here by LittleLemonDRF/archive.py so the Order and
+# OrderItem tables only hold recent history. Ids are kept from the original rows.
+
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='archived_deliveries', null=True)
+    status = models.BooleanField(default=True)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.SmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        unique_together = ('order', 'menuitem')
+
+
+# Pre-aggregated reporting tables, maintained by LittleLemonDRF/rollups.py
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    order_count = models.IntegerField(default=0)
+    item_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+class MenuItemSales(models.Model):
+    date = models.DateField(db_index=True)
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+class CrewDeliveries(models.Model):
+    date = models.DateField(db_index=True)
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE)
+    delivered = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'delivery_crew')
@@ -1,5 +1,25 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
+
+from .links import get_links
 
 class StandardResultsSetPagination(PageNumberPagination):
    page_size = 2
-   page_size_query_param = 'page_size' # As written in django github
\ No newline at end of file
+   page_size_query_param = 'page_size' # As written in django github
+
+   # Same links as DRF's, built from the request's cached link builder instead of re-parsing the absolute URL
+   def get_next_link(self):
+      if not self.page.has_next():
+         return None
+      return get_links(self.request).current(**{self.page_query_param: self.page.next_page_number()})
+
+   def get_previous_link(self):
+      if not self.page.has_previous():
+         return None
+      page_number = self.page.previous_page_number()
+      return get_links(self.request).current(**{self.page_query_param: page_number if page_number != 1 else None})
+
+class KeysetResultsSetPagination(CursorPagination): # WHERE id > last seen id: no OFFSET or COUNT, so every page costs the same
+   ordering = 'id'
+   page_size = 100
+   page_size_query_param = 'page_size'
+   max_page_size = 1000
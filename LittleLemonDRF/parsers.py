@@ -0,0 +1,30 @@
+import codecs
+import io
+import re
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import FastJSONRenderer, orjson
+
+LONG_NUMBER = re.compile(rb'\d{19}') # orjson reads integers beyond 64 bits as floats, the standard parser keeps them exact
+
+
+class FastJSONParser(JSONParser):
+    # JSONParser backed by orjson for UTF-8 bodies when it is installed. Bodies orjson rejects, or could
+    # read differently (long numbers), are handed to JSONParser, so the result and error messages are the same
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if LONG_NUMBER.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
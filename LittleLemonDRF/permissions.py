@@ -1,11 +1,41 @@
+from collections import namedtuple
+
+from django.contrib.auth.models import Group
+from django.db.models import Exists
 from rest_framework import permissions
 
+class _Superuser:
+    # Pseudo role for superusers. Not a string, so no group name can ever match it
+    def __repr__(self):
+        return 'ADMIN'
+
+ADMIN = _Superuser()
+ANY = '*' # Policy rule: no ownership required
+
+def cached_roles(request):
+    return getattr(getattr(request, '_request', request), '_littlelemon_roles', None)
+
+def get_roles(request):
+    # Group names of the current user, plus ADMIN for superusers. Fetched once and cached on the request,
+    # so composed permissions like (IsCustomer | IsManagerOrAdmin | IsDeliveryCrew) cost a single query
+    roles = cached_roles(request)
+    if roles is None:
+        http_request = getattr(request, '_request', request)
+        user = request.user
+        roles = set()
+        if user and user.is_authenticated:
+            roles.update(user.groups.values_list('name', flat=True))
+            if user.is_superuser:
+                roles.add(ADMIN)
+        roles = frozenset(roles)
+        http_request._littlelemon_roles = roles
+    return roles
+
 class IsManagerOrAdmin(permissions.BasePermission):
     message = "You are not a manager/admin to be authorized to access to this endpoint."
     def has_permission(self, request, view):
-        is_manager = request.user.groups.filter(name='Manager').exists()
-        is_admin = request.user.is_superuser
-        return is_manager or is_admin
+        roles = get_roles(request)
+        return 'Manager' in roles or ADMIN in roles
 
 class IsAdmin(permissions.BasePermission):
     message = "You need to be admin to be authorized to access to this endpoint."
@@ -15,9 +45,66 @@ class IsAdmin(permissions.BasePermission):
 class IsCustomer(permissions.BasePermission):
     message = "You are not a customer to be authorized to access to this endpoint."
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Customer').exists()
+        return 'Customer' in get_roles(request)
 
 class IsDeliveryCrew(permissions.BasePermission):
     message = "You are not a delivery crew to be authorized to access to this endpoint."
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Delivery Crew').exists()
\ No newline at end of file
+        return 'Delivery Crew' in get_roles(request)
+
+
+# Declarative role policies
+#
+# A view sets `policy = {method: {role: rule}}`, where rule is ANY or the name of the
+# foreign key on the object that has to point at the current user (e.g. 'user',
+# 'delivery_crew'). RolePolicy checks the method against the user's roles; `decide`
+# then fetches the object and checks ownership with one query.
+
+Decision = namedtuple('Decision', ['allowed', 'reason', 'obj']) # reason: 'allowed', 'forbidden' or 'not_found'
+
+def get_rules(request, view):
+    roles = get_roles(request)
+    return {role: rule for role, rule in view.policy.get(request.method, {}).items() if role in roles}
+
+class RolePolicy(permissions.BasePermission):
+    message = "You are not authorized to access to this endpoint."
+    def has_permission(self, request, view):
+        return bool(get_rules(request, view))
+
+def decide(request, view, queryset, **lookup):
+    # One query in all: unless the roles were already resolved for this request, the user's membership of
+    # each group named in the policy is fetched with the object, as EXISTS() subqueries
+    policy = view.policy.get(request.method, {})
+    if cached_roles(request) is not None:
+        rules = get_rules(request, view)
+        if not rules:
+            return Decision(False, 'forbidden', None)
+        obj = queryset.filter(**lookup).first()
+    else:
+        user = request.user
+        group_names = [role for role in policy if role is not ADMIN]
+        flags = {
+            '_littlelemon_in_group_{}'.format(i): Exists(Group.objects.filter(name=name, user=user.id))
+            for i, name in enumerate(group_names)
+        }
+        obj = queryset.filter(**lookup).annotate(**flags).first()
+        if obj is None: # Without the row the roles are unknown: the permission classes have screened the user already
+            return Decision(False, 'not_found', None)
+        roles = {name for i, name in enumerate(group_names) if getattr(obj, '_littlelemon_in_group_{}'.format(i))}
+        if user.is_superuser:
+            roles.add(ADMIN)
+        rules = {role: rule for role, rule in policy.items() if role in roles}
+        if not rules:
+            return Decision(False, 'forbidden', obj)
+
+    if obj is None:
+        return Decision(False, 'not_found', None)
+
+    if check_object(request, view, obj, rules):
+        return Decision(True, 'allowed', obj)
+    return Decision(False, 'forbidden', obj)
+
+def check_object(request, view, obj, rules=None):
+    # For objects the view already fetched: ownership is read from the foreign key ids, no query
+    rules = get_rules(request, view) if rules is None else rules
+    return ANY in rules.values() or any(getattr(obj, field + '_id') == request.user.id for field in set(rules.values()))
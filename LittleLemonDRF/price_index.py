@@ -0,0 +1,125 @@
+"""
+In-process snapshot of menu pricing used by the cart and checkout.
+
+The index keeps `MenuItem` id -> (price, category id, featured) in parallel
+sorted arrays, so a lookup is a binary search with no database round trip.
+It is tied to a menu version stored in the Django cache and bumped whenever a
+menu item is saved or deleted. A process reloads its index when the version
+changes, and in any case once it is older than PRICE_INDEX['MAX_AGE']
+seconds, which bounds staleness for changes the signals cannot see
+(`QuerySet.update`, other processes on a per-process cache backend).
+"""
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from decimal import Decimal
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import MenuItem
+
+MENU_VERSION_KEY = 'littlelemon:menu-version'
+
+DEFAULTS = {
+    'MAX_AGE': 60, # seconds
+}
+
+PriceEntry = namedtuple('PriceEntry', ['id', 'price', 'category_id', 'featured'])
+
+_index = None
+_index_lock = Lock()
+
+
+def get_setting(name):
+    return getattr(settings, 'PRICE_INDEX', {}).get(name, DEFAULTS[name])
+
+
+def get_menu_version():
+    return cache.get_or_set(MENU_VERSION_KEY, time.time_ns, timeout=None)
+
+
+def bump_menu_version(**kwargs):
+    # Also used as the post_save/post_delete receiver for MenuItem (see apps.py)
+    cache.set(MENU_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+class PriceIndex:
+    def __init__(self, rows, version):
+        # rows: (id, price, category_id, featured) sorted by id
+        self.ids = array('q')
+        self.cents = array('q')
+        self.category_ids = array('q')
+        self.featured = bytearray()
+        for menuitem_id, price, category_id, featured in rows:
+            self.ids.append(menuitem_id)
+            self.cents.append(int(price * 100))
+            self.category_ids.append(category_id)
+            self.featured.append(bool(featured))
+
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        version = get_menu_version() # Read first, so a change during the load triggers another reload
+        rows = MenuItem.objects.order_by('id').values_list('id', 'price', 'category_id', 'featured')
+        return cls(rows.iterator(), version)
+
+    def is_fresh(self):
+        return time.monotonic() - self.loaded_at < get_setting('MAX_AGE') and self.version == get_menu_version()
+
+    def get(self, menuitem_id):
+        position = bisect_left(self.ids, menuitem_id)
+        if position == len(self.ids) or self.ids[position] != menuitem_id:
+            return None
+        return PriceEntry(
+            menuitem_id
+            , Decimal(self.cents[position]).scaleb(-2)
+            , self.category_ids[position]
+            , bool(self.featured[position])
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def get_index():
+    global _index
+    index = _index
+    if index is not None and index.is_fresh():
+        return index
+
+    with _index_lock:
+        if _index is None or not _index.is_fresh():
+            _index = PriceIndex.load()
+        return _index
+
+
+def lookup(menuitem_id):
+    return get_index().get(menuitem_id)
+
+
+def invalidate():
+    global _index
+    _index = None
+
+
+def reconcile(current_prices):
+    """
+    Compare `{menuitem_id: price}` read from the database against the index.
+    Any mismatch means the index (in this or another process) is stale, so
+    the menu version is bumped. Returns the ids whose price differed.
+    """
+    index = get_index()
+    stale = []
+    for menuitem_id, price in current_prices.items():
+        entry = index.get(menuitem_id)
+        if entry is None or entry.price != price:
+            stale.append(menuitem_id)
+    if stale:
+        bump_menu_version()
+        invalidate()
+    return stale
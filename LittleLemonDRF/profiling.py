@@ -0,0 +1,193 @@
+"""
+Request profiling for staging: on demand for admins, and 1-in-N sampling.
+
+On demand: an admin adds `X-Profile: cprofile` (or `?profile=cprofile`) to a
+request and gets the profile back instead of the response: pstats text
+sorted by cumulative time with `cprofile`, or collapsed stacks
+('frame;frame;frame count' per line, the input of flamegraph.pl and
+speedscope) from a sampling profiler with `collapsed`. The token or session
+is only authenticated here when the flag is present; other requests pay for
+one header and one query parameter lookup.
+
+Sampling: PROFILING['SAMPLE_RATES'] = {'SingleOrderView': 100} profiles
+every 100th request to that view and writes the profile to
+PROFILING['DIRECTORY'], keeping the newest MAX_FILES files.
+"""
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+HEADER = 'X-Profile'
+QUERY_PARAM = 'profile'
+PROFILERS = ('cprofile', 'collapsed')
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATES': {}, # view name -> N, profile 1 in N requests
+    'SAMPLE_PROFILER': 'cprofile',
+    'DIRECTORY': None,
+    'MAX_FILES': 100,
+    'SAMPLING_INTERVAL': 0.001, # seconds between stack samples of the collapsed profiler
+    'STATS_LIMIT': 60, # functions listed in the pstats text
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'PROFILING', {}).get(name, DEFAULTS[name])
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '{}:{}'.format(os.path.basename(code.co_filename), getattr(code, 'co_qualname', code.co_name))
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread; `collapsed()` gives 'root;...;leaf count' lines."""
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def collapsed(self):
+        return ''.join('{} {}\n'.format(stack, count) for stack, count in sorted(self.stacks.items()))
+
+
+def run_profiled(profiler, view_func, request, args, kwargs):
+    """Runs the view (and renders its response) under `profiler`. Returns (response, cProfile.Profile or StackSampler)."""
+    def call():
+        response = view_func(request, *args, **kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        return response
+
+    if profiler == 'cprofile':
+        profile = cProfile.Profile()
+        response = profile.runcall(call)
+        return response, profile
+    with StackSampler(threading.get_ident(), get_setting('SAMPLING_INTERVAL')) as sampler:
+        response = call()
+    return response, sampler
+
+
+def stats_text(profile):
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(get_setting('STATS_LIMIT'))
+    return out.getvalue()
+
+
+def is_admin(request):
+    # Same authentication as the API (token or session), done here because the view hasn't run yet
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            user = drf_request.user
+        except APIException:
+            return False
+    return bool(user and user.is_superuser)
+
+
+def get_view_name(view_func):
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    return view_class.__name__ if view_class is not None else view_func.__name__
+
+
+class SampleBuffer:
+    # Rolling directory of sampled profiles
+    def __init__(self):
+        self.counters = defaultdict(lambda: itertools.count(1)) # 1 in N is the Nth, 2Nth, ... request, not the first
+        self.lock = Lock()
+
+    def should_sample(self, view_name):
+        rate = get_setting('SAMPLE_RATES').get(view_name)
+        if not rate:
+            return False
+        with self.lock:
+            return next(self.counters[view_name]) % rate == 0
+
+    def save(self, view_name, request, result):
+        # Names start with the time, so sorting them gives the oldest first
+        directory = get_setting('DIRECTORY')
+        os.makedirs(directory, exist_ok=True)
+        now = time.time_ns()
+        name = '{}-{:09d}-{}-{}'.format(time.strftime('%Y%m%dT%H%M%S', time.gmtime(now // 10 ** 9)), now % 10 ** 9, view_name, request.method)
+        if isinstance(result, cProfile.Profile):
+            result.dump_stats(os.path.join(directory, name + '.prof')) # For pstats, snakeviz, ...
+        else:
+            with open(os.path.join(directory, name + '.collapsed'), 'w') as file:
+                file.write(result.collapsed())
+
+        with self.lock:
+            files = sorted(entry for entry in os.listdir(directory) if entry.endswith(('.prof', '.collapsed')))
+            for old in files[:-get_setting('MAX_FILES')]:
+                os.remove(os.path.join(directory, old))
+
+    def clear(self):
+        with self.lock:
+            self.counters.clear()
+
+
+samples = SampleBuffer()
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profiler = request.headers.get(HEADER) or request.GET.get(QUERY_PARAM)
+        if profiler in PROFILERS and is_admin(request):
+            response, result = run_profiled(profiler, view_func, request, view_args, view_kwargs)
+            if profiler == 'cprofile':
+                profile_response = HttpResponse(stats_text(result), content_type='text/plain; charset=utf-8')
+            else:
+                profile_response = HttpResponse(result.collapsed(), content_type='text/plain; charset=utf-8')
+                profile_response['Content-Disposition'] = 'attachment; filename="{}.collapsed"'.format(get_view_name(view_func))
+            profile_response['X-Profiled-Status'] = str(response.status_code)
+            return profile_response
+
+        view_name = get_view_name(view_func)
+        if get_setting('DIRECTORY') and samples.should_sample(view_name):
+            response, result = run_profiled(get_setting('SAMPLE_PROFILER'), view_func, request, view_args, view_kwargs)
+            samples.save(view_name, request, result)
+            return response
+        return None
@@ -0,0 +1,174 @@
+"""
+Query inspection for development and staging: slow query log, duplicate
+(N+1) detection and a per-endpoint report.
+
+With QUERY_INSPECTOR['ENABLED'], `QueryInspectorMiddleware` wraps every
+database cursor for the duration of a request (`connection.execute_wrapper`).
+Each query is reduced to its shape (parameters are already placeholders;
+numbers and `IN`/`VALUES` lists are collapsed) and attributed to the
+innermost LittleLemonDRF frame that ran it. Queries slower than
+SLOW_QUERY_SECONDS are logged with that origin, and so is any shape run
+DUPLICATE_THRESHOLD times or more in one request.
+
+With REPORT_PATH set, a JSON report keyed by endpoint ('GET api/orders') is
+rewritten after every request. It holds query counts and duplicated shapes
+with their origins but no timings or line numbers, so the same requests
+produce the same file and CI can diff it between commits. The report is per
+process: run the suite without `--parallel` when writing it.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = str(Path(__file__).resolve().parent)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SLOW_QUERY_SECONDS': 0.05,
+    'DUPLICATE_THRESHOLD': 3,
+    'REPORT_PATH': None,
+}
+
+NUMBER = re.compile(r'(?<![\w"])\d+(?:\.\d+)?(?![\w"])')
+PLACEHOLDER_LIST = re.compile(r'\((?:%s|N)(?:, (?:%s|N))+\)')
+ROW_LIST = re.compile(r'(\((?:%s|N)\)|\(\.\.\.\))(?:, (?:\((?:%s|N)\)|\(\.\.\.\)))+')
+WHITESPACE = re.compile(r'\s+')
+
+
+def get_setting(name):
+    return getattr(settings, 'QUERY_INSPECTOR', {}).get(name, DEFAULTS[name])
+
+
+def shape(sql):
+    # 'WHERE id IN (1, 2, 3) LIMIT 21' and 'WHERE id IN (4, 5) LIMIT 21' have the same shape
+    sql = NUMBER.sub('N', WHITESPACE.sub(' ', sql.strip()))
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return ROW_LIST.sub(r'\1, ...', sql)
+
+
+def origin():
+    # Innermost frame in LittleLemonDRF code outside this module, as 'views.py:OrderListView.get'
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename != __file__:
+            code = frame.f_code
+            return '{}:{}'.format(os.path.relpath(filename, APP_DIR), getattr(code, 'co_qualname', code.co_name))
+        frame = frame.f_back
+    return None
+
+
+class QueryInspector:
+    def __init__(self):
+        self.shapes = Counter()
+        self.origins = {} # shape -> origin of its first run
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            query_shape = shape(sql)
+            self.shapes[query_shape] += 1
+            if query_shape not in self.origins:
+                self.origins[query_shape] = origin()
+            if duration >= get_setting('SLOW_QUERY_SECONDS'):
+                where = origin()
+                self.slow.append((duration, query_shape, where))
+                logger.warning('Slow query (%.1f ms) from %s: %s', duration * 1000, where, sql[:500])
+
+    @property
+    def count(self):
+        return sum(self.shapes.values())
+
+    def duplicates(self, threshold=None):
+        threshold = threshold or get_setting('DUPLICATE_THRESHOLD')
+        return {query_shape: count for query_shape, count in self.shapes.items() if count >= threshold}
+
+
+@contextmanager
+def inspect_queries():
+    """Records every query run inside the block, on every database connection."""
+    inspector = QueryInspector()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(inspector))
+        yield inspector
+
+
+class QueryReport:
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = Lock()
+
+    def add(self, endpoint, inspector):
+        with self.lock:
+            entry = self.endpoints.setdefault(endpoint, {'requests': 0, 'queries': 0, 'max_queries': 0, 'duplicates': {}})
+            entry['requests'] += 1
+            entry['queries'] += inspector.count
+            entry['max_queries'] = max(entry['max_queries'], inspector.count)
+            for query_shape, count in inspector.duplicates().items():
+                duplicate = entry['duplicates'].setdefault(query_shape, {'max_count': 0, 'origin': inspector.origins[query_shape]})
+                duplicate['max_count'] = max(duplicate['max_count'], count)
+
+    def write(self, path):
+        # Readers never see a half written report: it goes to a temporary file of its own, renamed over `path`.
+        # The lock keeps the threads of this process from replacing a newer report with an older one
+        directory, name = os.path.split(os.path.abspath(path))
+        with self.lock:
+            content = json.dumps(self.endpoints, indent=2, sort_keys=True)
+            with tempfile.NamedTemporaryFile('w', dir=directory, prefix=name + '.', suffix='.tmp', delete=False) as file:
+                file.write(content + '\n')
+            try:
+                os.replace(file.name, path)
+            except OSError:
+                os.unlink(file.name)
+                raise
+
+    def clear(self):
+        with self.lock:
+            self.endpoints = {}
+
+
+report = QueryReport()
+
+
+def get_endpoint(request):
+    match = request.resolver_match
+    return '{} {}'.format(request.method, match.route if match is not None else request.path)
+
+
+class QueryInspectorMiddleware:
+    def __init__(self, get_response):
+        if not get_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with inspect_queries() as inspector:
+            response = self.get_response(request)
+
+        endpoint = get_endpoint(request)
+        for query_shape, count in inspector.duplicates().items():
+            logger.warning('%s ran the same query %d times from %s: %s', endpoint, count, inspector.origins[query_shape], query_shape[:500])
+
+        report.add(endpoint, inspector)
+        if get_setting('REPORT_PATH'):
+            report.write(get_setting('REPORT_PATH'))
+        return response
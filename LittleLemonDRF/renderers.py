@@ -0,0 +1,48 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError: # Optional, see REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] in settings.py
+    msgpack = None
+
+try:
+    import orjson
+except ImportError: # Optional, FastJSONRenderer falls back to JSONRenderer
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    # JSONRenderer backed by orjson when it is installed, for compact responses. Dates, times and anything
+    # else orjson would format its own way go through DRF's encoder. Floats can't: orjson has no hook for them,
+    # so they keep orjson's notation (1e16 for DRF's 1e+16, 1e-7 for 1e-07, the same values) and NaN/Infinity
+    # render as null where JSONRenderer raises. The API's own numbers are Decimals rendered as strings.
+    # Indented output (browsable API, `; indent=` in Accept), ASCII-only output and values orjson can't
+    # encode (e.g. integers over 64 bits, non-string keys) are left to JSONRenderer
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like JSONRenderer, escape U+2028 and U+2029 so the output is also valid javascript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    # Compact binary alternative to JSON for `Accept: application/msgpack` (or `?format=msgpack`).
+    # Values JSON can't hold natively (Decimal, dates, ...) are converted the way DRF's JSON renderer does
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
@@ -0,0 +1,134 @@
+"""
+Incremental maintenance of the reporting tables (`DailySales`, `MenuItemSales`,
+`CrewDeliveries`).
+
+Views never touch these tables directly: they enqueue the `rollup_order` and
+`rollup_delivery` jobs (see tasks.py) so the extra writes happen after the
+request. `rebuild` recomputes everything from the order history, archived
+orders included, and is what `python manage.py rebuild_rollups` runs.
+
+Jobs run at least once, so the order records what the rollups hold for it:
+`record_order` flips `Order.rolled_up` in the job's transaction and skips
+orders already counted, and `record_delivery` moves the order's delivery
+from `delivery_rolled_up_crew` to its current delivered crew, if any, rather
+than applying a +1/-1 it was handed. `rebuild` marks every live order with
+what it counted.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Sum, When
+
+from .models import DailySales, MenuItemSales, CrewDeliveries, Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+
+
+def _bump(model, keys, **deltas):
+    """Add `deltas` to the row identified by `keys`, creating it if needed."""
+    increments = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**keys).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError: # Someone else created the row in between
+        model.objects.filter(**keys).update(**increments)
+
+
+def record_order(order_id):
+    # Claims the order first: a retried or duplicated job finds it already counted
+    if not Order.objects.filter(id=order_id, rolled_up=False).update(rolled_up=True):
+        return
+    order = Order.objects.get(id=order_id)
+
+    lines = list(OrderItem.objects.filter(order_id=order_id).values('menuitem_id', 'quantity', 'price'))
+    _bump(
+        DailySales, {'date': order.date}
+        , order_count = 1
+        , item_count = sum(line['quantity'] for line in lines)
+        , revenue = order.total
+    )
+    for line in lines:
+        _bump(
+            MenuItemSales, {'date': order.date, 'menuitem_id': line['menuitem_id']}
+            , quantity = line['quantity']
+            , revenue = line['price']
+        )
+
+
+def record_delivery(order_id):
+    # Brings the crew rollup in line with the order's current delivery state. `delivery_rolled_up_crew` is the crew
+    # member the order is counted for (None: not counted); it is moved with a conditional UPDATE in the job's
+    # transaction, so a retried or duplicated job, or one queued before a rebuild, finds nothing left to do
+    order = Order.objects.filter(id=order_id).values('date', 'status', 'delivery_crew_id', 'delivery_rolled_up_crew_id').first()
+    if order is None: # Deleted, or archived with its delivery already counted
+        return
+    counted = order['delivery_rolled_up_crew_id']
+    target = order['delivery_crew_id'] if order['status'] else None
+    if counted == target:
+        return
+    if not Order.objects.filter(id=order_id, delivery_rolled_up_crew_id=counted).update(delivery_rolled_up_crew_id=target):
+        return # Another run of the job moved it first
+    if counted is not None:
+        _bump(CrewDeliveries, {'date': order['date'], 'delivery_crew_id': counted}, delivered = -1)
+    if target is not None:
+        _bump(CrewDeliveries, {'date': order['date'], 'delivery_crew_id': target}, delivered = 1)
+
+
+def delivered_crew():
+    # What `record_delivery` counts an order for: its crew once delivered
+    return Case(When(status=True, then=F('delivery_crew_id')), default=None)
+
+
+def _history(order_model, item_model):
+    """Aggregates for one order table pair (live or archived)."""
+    daily = {
+        row['date']: [row['order_count'], 0, row['revenue']]
+        for row in order_model.objects.values('date').annotate(order_count=Count('id'), revenue=Sum('total')).order_by()
+    }
+    for order_date, quantity in item_model.objects.values_list('order__date').annotate(Sum('quantity')).order_by():
+        daily[order_date][1] = quantity
+
+    items = {
+        (row['order__date'], row['menuitem_id']): [row['quantity'], row['revenue']]
+        for row in item_model.objects.values('order__date', 'menuitem_id')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('price')).order_by()
+    }
+
+    crew = {
+        (row['date'], row['delivery_crew_id']): [row['delivered']]
+        for row in order_model.objects.filter(status=True, delivery_crew__isnull=False)
+        .values('date', 'delivery_crew_id').annotate(delivered=Count('id')).order_by()
+    }
+    return daily, items, crew
+
+
+def _merge(target, source):
+    for key, values in source.items():
+        if key in target:
+            target[key] = [a + b for a, b in zip(target[key], values)]
+        else:
+            target[key] = values
+    return target
+
+
+def rebuild(batch_size=1000):
+    """Recompute every rollup table from the live and archived order history in one transaction."""
+    with transaction.atomic():
+        daily, items, crew = _history(Order, OrderItem)
+        for merged, archived in zip((daily, items, crew), _history(ArchivedOrder, ArchivedOrderItem)):
+            _merge(merged, archived)
+
+        for model in (DailySales, MenuItemSales, CrewDeliveries):
+            model.objects.all().delete()
+        Order.objects.update(rolled_up=True, delivery_rolled_up_crew_id=delivered_crew()) # Counted by this rebuild
+
+        DailySales.objects.bulk_create((
+            DailySales(date=order_date, order_count=order_count, item_count=item_count, revenue=revenue)
+            for order_date, (order_count, item_count, revenue) in daily.items()
+        ), batch_size=batch_size)
+        MenuItemSales.objects.bulk_create((
+            MenuItemSales(date=order_date, menuitem_id=menuitem_id, quantity=quantity, revenue=revenue)
+            for (order_date, menuitem_id), (quantity, revenue) in items.items()
+        ), batch_size=batch_size)
+        CrewDeliveries.objects.bulk_create((
+            CrewDeliveries(date=order_date, delivery_crew_id=crew_id, delivered=delivered)
+            for (order_date, crew_id), (delivered,) in crew.items()
+        ), batch_size=batch_size)
@@ -1,9 +1,13 @@
 from rest_framework import serializers
-from rest_framework.reverse import reverse
 
 from django.contrib.auth.models import User, Group
+from django.core.validators import validate_slug
+from django.db.models import prefetch_related_objects
 
-from .models import MenuItem, Category, Cart, Order, OrderItem
+from .models import MenuItem, Category, Cart, CartHeader, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, DailySales, CrewDeliveries
+
+from . import price_index
+from .links import get_links
 
 from decimal import Decimal
 import os
@@ -22,6 +26,138 @@ class UserSerializer(serializers.ModelSerializer):
             for field in ('password', 'last_login', 'first_name', 'last_name', 'is_staff', 'is_active', 'date_joined')
         }
 
+def parse_fieldset(request, param='fields'):
+    # `?fields=id,username` -> ['id', 'username'], None when the parameter is absent
+    value = request.query_params.get(param) if request is not None else None
+    if not value:
+        return None
+    return [field.strip() for field in value.split(',') if field.strip()]
+
+class SparseFieldsetMixin:
+    # Limits the output to the fields named in `?fields=`. Unknown names are a validation error
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = parse_fieldset(self.context.get('request'))
+        if fields is None:
+            return
+
+        unknown = set(fields) - set(self.fields)
+        if unknown:
+            raise serializers.ValidationError({'fields': 'Unknown field(s): {}'.format(', '.join(sorted(unknown)))})
+        for field in set(self.fields) - set(fields):
+            self.fields.pop(field)
+
+def parse_expand(request):
+    # `?expand=order.user,menuitem` -> {'order', 'order.user', 'menuitem'}, None when the parameter is absent
+    if request is None or 'expand' not in request.query_params:
+        return None
+    paths = set()
+    for path in parse_fieldset(request, 'expand') or []:
+        parts = path.split('.')
+        paths.update('.'.join(parts[:depth]) for depth in range(1, len(parts) + 1))
+    return paths
+
+class ExpandableFieldsMixin(SparseFieldsetMixin):
+    # Nested objects listed in `expandable` are rendered in full only when named in `?expand=` (all of them
+    # when the parameter is absent), the others collapse to their id. `expandable` maps each path to the
+    # select_related lookups it needs and the many-to-many fields to prefetch on the related objects,
+    # so `fetch` only queries what is rendered. `related_fields` lists the joins of plain fields that
+    # read a related object (e.g. a slug)
+    expandable = {}
+    related_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        expand = parse_expand(self.context.get('request'))
+        if expand is None:
+            return
+
+        unknown = expand - set(self.expandable)
+        if unknown:
+            raise serializers.ValidationError({'expand': 'Unknown path(s): {}'.format(', '.join(sorted(unknown)))})
+        self.collapse(self, '', expand)
+
+    def collapse(self, serializer, prefix, expand):
+        for name, field in list(serializer.fields.items()):
+            path = prefix + name
+            if path not in self.expandable:
+                continue
+            if path in expand:
+                self.collapse(field, path + '.', expand)
+                continue
+
+            kwargs = {'read_only': True}
+            if field.source != name:
+                kwargs['source'] = field.source
+            serializer.fields[name] = serializers.PrimaryKeyRelatedField(**kwargs)
+            if serializer.fields[name].parent is None: # DynamicWriteOnlySerializer keeps its fields in a plain dict
+                serializer.fields[name].bind(name, serializer)
+
+    @classmethod
+    def fetch(cls, queryset, request, select_related=()):
+        # Evaluates the queryset with the joins and columns for just what `?fields=` / `?expand=` will render.
+        # `select_related` is joined regardless, e.g. for an ownership check. Related objects of the same model
+        # are prefetched together, one query per field however many paths lead to them
+        fields = parse_fieldset(request)
+        expand = parse_expand(request)
+
+        joins, prefetches = list(select_related), []
+        for path, (path_joins, path_prefetches) in cls.expandable.items():
+            if (fields is None or path.split('.')[0] in fields) and (expand is None or path in expand):
+                joins += path_joins
+                prefetches += path_prefetches.items()
+        for name, field_joins in cls.related_fields.items():
+            if fields is None or name in fields:
+                joins += field_joins
+
+        if fields is not None:
+            columns = {}
+            for field in cls.Meta.model._meta.concrete_fields:
+                columns[field.name] = columns[field.attname] = field.name
+            queryset = queryset.only(
+                'pk'
+                , *{columns[name] for name in fields if name in columns}
+                , *{join.split('__')[0] for join in joins}
+            )
+        if joins: # select_related() without arguments would follow every foreign key
+            queryset = queryset.select_related(*joins)
+        instances = list(queryset)
+
+        related = {}
+        for path, lookups in prefetches:
+            for instance in instances:
+                obj = instance
+                for attr in path.split('__'):
+                    obj = getattr(obj, attr) if obj is not None else None
+                if obj is not None:
+                    related.setdefault((type(obj), tuple(lookups)), []).append(obj)
+        for (_, lookups), objs in related.items():
+            prefetch_related_objects(objs, *lookups)
+        return instances
+
+class GroupMemberSerializer(SparseFieldsetMixin, serializers.ModelSerializer): # Slim listing of the users in a group
+    groups = serializers.SlugRelatedField(
+        many=True,
+        read_only=True,
+        slug_field='name',
+     )
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'email', 'groups']
+
+class UserIdListSerializer(serializers.Serializer): # Bulk group membership changes
+    userIds = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=5000)
+
+class ResourceURLField(serializers.Field): # Absolute URL of the object's detail route, e.g. 'menu-item'
+    def __init__(self, view_name, **kwargs):
+        self.view_name = view_name
+        kwargs['read_only'] = True
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return get_links(self.context.get('request')).resource(self.view_name, value.pk)
+
 class CategorySerializer(serializers.ModelSerializer):
     menu_items_url = serializers.SerializerMethodField('get_related_url')
     class Meta:
@@ -29,22 +165,59 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'slug', 'title', 'menu_items_url']
 
     def get_related_url(self, category: Category):
-        full_url = self.context.get('request').build_absolute_uri(reverse('menu-items'))
-
-        return full_url + '?search={}'.format(category.title)
+        return get_links(self.context.get('request')).url('menu-items', {'search': category.title})
 
 class MenuItemSerializer(serializers.ModelSerializer):
     category = serializers.SlugRelatedField(
         queryset = Category.objects.all()
         , slug_field = 'title'
     )
+    url = ResourceURLField('menu-item')
     
     class Meta:
         model = MenuItem
-        fields = ['id', 'title', 'price', 'featured', 'category']
+        fields = ['id', 'url', 'title', 'price', 'featured', 'category']
         extra_kwargs = {'price': {'min_value': Decimal("0.00")}}
 
-class CartSerializer(serializers.ModelSerializer):
+CATEGORY_ID = serializers.IntegerField(max_value=2 ** 63 - 1) # Largest id the database can hold
+
+class MenuItemFilterSerializer(serializers.Serializer): # `GET /api/menu-items` filters, see filters.MenuItemFilter
+    price__gte = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0.00'), required=False)
+    price__lte = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0.00'), required=False)
+    featured = serializers.BooleanField(required=False)
+    category = serializers.CharField(max_length=50, required=False) # Category id or slug
+    title = serializers.CharField(max_length=255, required=False, allow_blank=True) # Title prefix, case sensitive; blank: any
+
+    def validate_category(self, value):
+        if value.isascii() and value.isdigit(): # isdigit() alone also takes '²' and other non-ASCII digits
+            return CATEGORY_ID.run_validation(value)
+        validate_slug(value)
+        return value
+
+    def validate(self, attrs):
+        if attrs.get('price__gte', Decimal('0.00')) > attrs.get('price__lte', Decimal('9999.99')):
+            raise serializers.ValidationError({'price__lte': 'Must not be lower than price__gte'})
+        if attrs.get('title') == '': # `?title=` is no filter, and shares the unfiltered listing's cache entry
+            del attrs['title']
+        return attrs
+
+class IndexedMenuItemField(serializers.PrimaryKeyRelatedField):
+    # Validates the id against the in-process price index instead of the database.
+    # The validated value is the index entry: (id, price, category_id, featured)
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        entry = price_index.lookup(pk)
+        if entry is None:
+            self.fail('does_not_exist', pk_value=data)
+        return entry
+
+class CartSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     user = serializers.SlugRelatedField(
         # many=True,
         read_only=True,
@@ -53,10 +226,12 @@ class CartSerializer(serializers.ModelSerializer):
     menuitem = MenuItemSerializer(read_only=True)
     
     # This will give a BrowsableAPI a better view with restricted set of dropdown values
-    menuitem_id = serializers.PrimaryKeyRelatedField(
+    menuitem_id = IndexedMenuItemField(
         queryset = MenuItem.objects.all()
         , write_only = True
     )
+    expandable = {'menuitem': (['menuitem__category'], {})}
+    related_fields = {'user': ['user']}
 
     class Meta:
         model = Cart
@@ -78,9 +253,14 @@ class CartSerializer(serializers.ModelSerializer):
         price = quantity * unit_price
         user = kwargs['user']
 
-        new_cart = Cart.objects.create(user=user, menuitem=menuitem, quantity=quantity, price=price, unit_price=unit_price)
+        new_cart = Cart.objects.create(user=user, menuitem_id=menuitem.id, quantity=quantity, price=price, unit_price=unit_price)
         return new_cart
 
+class CartHeaderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CartHeader
+        fields = ['subtotal', 'item_count', 'revision']
+
 class DynamicWriteOnlySerializer(serializers.ModelSerializer):
     def __init__(self, *args, **kwargs):
         if type(super) == type(self):
@@ -118,13 +298,24 @@ class OrderSerializer(DynamicWriteOnlySerializer):
         , write_only=True
         , source = 'delivery_crew__id'
     )
+    url = ResourceURLField('order')
     class Meta:
         model = Order
-        fields = ['id', 'user', 'delivery_crew', 'status', 'total', 'date', 'delivery_crew_id']
+        fields = ['id', 'url', 'user', 'delivery_crew', 'status', 'total', 'date', 'delivery_crew_id']
+
+USER_PREFETCH = ['groups', 'user_permissions'] # Many-to-many fields rendered by UserSerializer
 
-class OrderItemSerializer(DynamicWriteOnlySerializer): # Since this is only use in BrowsableAPIView GET, we can make every field `read_only` = True
+ORDER_ITEM_EXPANDABLE = {
+    'order': (['order'], {})
+    , 'order.user': (['order__user'], {'order__user': USER_PREFETCH})
+    , 'order.delivery_crew': (['order__delivery_crew'], {'order__delivery_crew': USER_PREFETCH})
+    , 'menuitem': (['menuitem__category'], {})
+}
+
+class OrderItemSerializer(ExpandableFieldsMixin, DynamicWriteOnlySerializer): # Since this is only use in BrowsableAPIView GET, we can make every field `read_only` = True
     order = OrderSerializer(read_only=True)
     menuitem = MenuItemSerializer(read_only=True)
+    expandable = ORDER_ITEM_EXPANDABLE
 
     class Meta:
         model = OrderItem
@@ -132,9 +323,10 @@ class OrderItemSerializer(DynamicWriteOnlySerializer): # Since this is only use
         read_only_fields = ('order', 'menuitem', 'menuitem_id', 'quantity', 'unit_price', 'price')
         extra_kwargs = {'price': {'min_value': Decimal("0.00")}}
 
-class ManagerOrderItemSerializer(DynamicWriteOnlySerializer): # Since this is only use in BrowsableAPIView GET, we can make every field `read_only` = True
+class ManagerOrderItemSerializer(ExpandableFieldsMixin, DynamicWriteOnlySerializer): # Since this is only use in BrowsableAPIView GET, we can make every field `read_only` = True
     order = OrderSerializer(read_only=True, writeable_fields = ['delivery_crew_id'])
     menuitem = MenuItemSerializer(read_only=True)
+    expandable = ORDER_ITEM_EXPANDABLE
 
     class Meta:
         model = OrderItem
@@ -142,12 +334,78 @@ class ManagerOrderItemSerializer(DynamicWriteOnlySerializer): # Since this is on
         read_only_fields = ('order', 'menuitem', 'menuitem_id', 'quantity', 'unit_price', 'price')
         extra_kwargs = {'price': {'min_value': Decimal("0.00")}}
 
-class DeliveryCrewOrderItemSerializer(DynamicWriteOnlySerializer): # Since this is only use in BrowsableAPIView GET, we can make every field `read_only` = True
+class DeliveryCrewOrderItemSerializer(ExpandableFieldsMixin, DynamicWriteOnlySerializer): # Since this is only use in BrowsableAPIView GET, we can make every field `read_only` = True
     order = OrderSerializer(read_only=True, writeable_fields = ['status'])
     menuitem = MenuItemSerializer(read_only=True)
+    expandable = ORDER_ITEM_EXPANDABLE
 
     class Meta:
         model = OrderItem
         fields = ['order', 'menuitem', 'menuitem_id', 'quantity', 'unit_price', 'price']
         read_only_fields = ('order', 'menuitem', 'menuitem_id', 'quantity', 'unit_price', 'price')
-        extra_kwargs = {'price': {'min_value': Decimal("0.00")}}
\ No newline at end of file
+        extra_kwargs = {'price': {'min_value': Decimal("0.00")}}
+
+class WorkQueueOrderItemSerializer(serializers.ModelSerializer):
+    menuitem = serializers.SlugRelatedField(read_only=True, slug_field='title')
+
+    class Meta:
+        model = OrderItem
+        fields = ['menuitem_id', 'menuitem', 'quantity', 'unit_price', 'price']
+
+class WorkQueueOrderSerializer(serializers.ModelSerializer):
+    user = serializers.SlugRelatedField(read_only=True, slug_field='username')
+    items = WorkQueueOrderItemSerializer(source='orderitem_set', many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'user', 'status', 'total', 'date', 'items']
+
+class OrderAssignmentSerializer(serializers.Serializer):
+    order_id = serializers.IntegerField(min_value=1)
+    delivery_crew_id = serializers.IntegerField(min_value=1)
+
+class BatchOrderAssignmentSerializer(serializers.Serializer):
+    assignments = OrderAssignmentSerializer(many=True, required=False, max_length=5000)
+    auto_balance = serializers.BooleanField(default=False)
+    limit = serializers.IntegerField(min_value=1, max_value=5000, default=500) # Only used by auto_balance
+
+    def validate(self, attrs):
+        if bool(attrs.get('assignments')) == attrs['auto_balance']:
+            raise serializers.ValidationError("Pass either a non-empty 'assignments' list or 'auto_balance': true")
+
+        order_ids = [assignment['order_id'] for assignment in attrs.get('assignments', [])]
+        if len(order_ids) != len(set(order_ids)):
+            raise serializers.ValidationError({'assignments': 'Each order_id can only be assigned once'})
+        return attrs
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    menuitem = serializers.SlugRelatedField(read_only=True, slug_field='title')
+
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['menuitem_id', 'menuitem', 'quantity', 'unit_price', 'price']
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    user = serializers.SlugRelatedField(read_only=True, slug_field='username')
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'user', 'delivery_crew_id', 'status', 'total', 'date', 'archived_at', 'items']
+
+class DailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailySales
+        fields = ['date', 'order_count', 'item_count', 'revenue']
+
+class TopMenuItemSerializer(serializers.Serializer): # Rows are aggregated from MenuItemSales over the requested dates
+    menuitem_id = serializers.IntegerField()
+    title = serializers.CharField(source='menuitem__title')
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class CrewDeliveriesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CrewDeliveries
+        fields = ['date', 'delivery_crew', 'delivered']
+
@@ -1,26 +1,76 @@
 # from django.test import TestCase, LiveServerTestCase
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
+from rest_framework.request import Request
+from rest_framework.renderers import JSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.authtoken.models import Token
 
-from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
+from rest_framework.status import (HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN, HTTP_409_CONFLICT
+, HTTP_422_UNPROCESSABLE_ENTITY)
 
 from django.contrib.auth.models import User, Group
-
-from LittleLemonDRF.models import Category, MenuItem, Order, OrderItem
+from django.core import mail
+from django.test import override_settings
+from django.http import HttpResponse
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import F, Sum
+from django.core.management.base import CommandError
+
+from LittleLemonDRF.models import (Category, MenuItem, Cart, CartHeader, Order, OrderItem, Job, ArchivedOrder, ArchivedOrderItem
+, DailySales, MenuItemSales, CrewDeliveries, IdempotencyKey)
+from LittleLemonDRF import jobs, rollups, archive, price_index, idempotency, throttling, warmup, links, factories, querylog, profiling, carts, dispatch
+from LittleLemonDRF.hashers import ProfiledPBKDF2PasswordHasher
+from LittleLemonDRF.dispatch import auto_balance
+from LittleLemonDRF.middleware import CompressionMiddleware, negotiate, never_compress
+from LittleLemonDRF.renderers import FastJSONRenderer, msgpack, orjson
+from LittleLemonDRF.parsers import FastJSONParser
 from LittleLemonDRF.serializers import MenuItemSerializer, OrderItemSerializer, OrderSerializer
-
+from LittleLemonDRF.permissions import IsCustomer, IsManagerOrAdmin, IsDeliveryCrew, ADMIN, decide, get_roles
+from LittleLemonDRF.views import SingleOrderView
+
+import gzip
+import os
+import tempfile
+import threading
+from time import perf_counter
 import urllib
 import json
+import unittest
+import unittest.mock
+from decimal import Decimal
+from datetime import date, datetime, time, timedelta, timezone
+import io
 from requests.auth import _basic_auth_str
 
+# The suite creates and logs in many users: hash their passwords with a fast, insecure hasher
+FAST_PASSWORD_HASHERS = override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+def setUpModule():
+    FAST_PASSWORD_HASHERS.enable()
+
+def tearDownModule():
+    FAST_PASSWORD_HASHERS.disable()
+
 # Create your tests here.
 class MenuItemTestCase(APITestCase):
+    all_groups = ['Manager', 'Delivery Crew', 'Customer']
+    admin = 'Admin'
+
+    @classmethod
+    def setUpTestData(cls): # Built once for the class; every test runs in a transaction that is rolled back
+        cls.setup_persistent_user_accounts_and_groups()
+        cls.setup_persistent_categories()
+        cls.setup_persistent_menu_items()
+        cls.setup_persistent_orders()
 
     def setUp(self):
         self.client = APIClient()
 
-        self.all_groups = ['Manager', 'Delivery Crew', 'Customer']
-        self.admin = 'Admin'
-
         self.endpoints = {
             'login': '/api/users/login'
             , 'register': '/api/users/'
@@ -31,20 +81,16 @@ class MenuItemTestCase(APITestCase):
             , 'cart': '/api/cart/menu-items'
         }
 
-        self.setup_persistent_user_accounts_and_groups()
-        self.setup_persistent_categories()
-        self.setup_persistent_menu_items()
-        self.setup_persistent_orders()
-
-    def setup_persistent_user_accounts_and_groups(self):
+    @classmethod
+    def setup_persistent_user_accounts_and_groups(cls):
         # Create Admin and all users
-        admin = self.admin
+        admin = cls.admin
         admin_account = User(username=admin)
         admin_account.set_password(admin)
         admin_account.is_superuser = True
         admin_account.save()
 
-        for group_name in self.all_groups:
+        for group_name in cls.all_groups:
             group = Group(name=group_name)
             group.save()
             user_account = User(username=group_name)
@@ -58,7 +104,8 @@ class MenuItemTestCase(APITestCase):
         
         admin_account.save()
 
-    def setup_persistent_categories(self):
+    @classmethod
+    def setup_persistent_categories(cls):
         category_data = [
             {'title': 'Main'}
             , {'title': 'Beverage'}
@@ -69,7 +116,8 @@ class MenuItemTestCase(APITestCase):
         for data in category_data:
             Category(**data).save()
 
-    def setup_persistent_menu_items(self):
+    @classmethod
+    def setup_persistent_menu_items(cls):
         data = [
             {
                 "title": "Apple Juice"
@@ -107,67 +155,69 @@ class MenuItemTestCase(APITestCase):
             item['category'] = Category.objects.get(title=item['category'])
             MenuItem(**item).save()
 
-    def setup_persistent_orders(self):
+    @classmethod
+    def setup_persistent_orders(cls):
         order_infos = [
             {
-                'user': 1
+                'user': 'Admin'
                 , 'date': '2024-06-01'
             }
             , {
-                'user': 1
+                'user': 'Admin'
                 , 'date': '2024-07-01'
-                , 'delivery_crew': 3
+                , 'delivery_crew': 'Delivery Crew'
             }
         ]
 
         order_items = [
             [
                 {
-                    'menuitem_id': 1
+                    'menuitem': 'Apple Juice'
                     , 'quantity': 4
                 }
                 , {
-                    'menuitem_id': 2
+                    'menuitem': 'Coca Cola'
                     , 'quantity': 3
                 }
                 , {
-                    'menuitem_id': 3
+                    'menuitem': 'Carbonara'
                     , 'quantity': 5
                 }
             ]
             , 
             [
                 {
-                    'menuitem_id': 1
+                    'menuitem': 'Apple Juice'
                     , 'quantity': 5
                 }
                 , {
-                    'menuitem_id': 2
+                    'menuitem': 'Coca Cola'
                     , 'quantity': 1
                 }
                 , {
-                    'menuitem_id': 3
+                    'menuitem': 'Carbonara'
                     , 'quantity': 2
                 }
             ]
         ]
 
-        self.assertEqual(len(order_infos), len(order_items), 'Please ensure the order_infos and order_items length are the same.')
+        assert len(order_infos) == len(order_items), 'Please ensure the order_infos and order_items length are the same.'
 
         for order_info, items in zip(order_infos, order_items):
-            order_info['user'] = User.objects.get(pk=order_info['user'])
+            order_info['user'] = User.objects.get(username=order_info['user'])
             order_info['total'] = 0.0
             if 'delivery_crew' in order_info:
-                order_info['delivery_crew'] = User.objects.get(pk=order_info['delivery_crew'])
+                order_info['delivery_crew'] = User.objects.get(username=order_info['delivery_crew'])
             order_obj = Order.objects.create(**order_info)
             total = 0
             for item in items:
-                item_data = MenuItem.objects.get(pk=item['menuitem_id'])
+                item_data = MenuItem.objects.get(title=item['menuitem'])
                 unit_price = item_data.price
                 price = item['quantity'] * unit_price
                 total += price
                 order_info_dict = {
                     **item
+                    , 'menuitem': item_data
                     , 'price': price
                     , 'unit_price': unit_price
                     , 'order': order_obj
@@ -316,15 +366,15 @@ class MenuItemTestCase(APITestCase):
     def add_to_cart(self):
         cart_info = [
             {
-                'menuitem_id': 1
+                'menuitem_id': MenuItem.objects.get(title='Apple Juice').id
                 , 'quantity': 3
             }
             , {
-                'menuitem_id': 2
+                'menuitem_id': MenuItem.objects.get(title='Coca Cola').id
                 , 'quantity': 4
             }
             , {
-                'menuitem_id': 1
+                'menuitem_id': MenuItem.objects.get(title='Apple Juice').id
                 , 'quantity': 4
             }
         ]
@@ -453,4 +503,1555 @@ class MenuItemTestCase(APITestCase):
         self.add_to_cart()
         self.place_order()
 
-        self.clear_cart()
\ No newline at end of file
+        self.clear_cart()
+
+
+@jobs.register('test_flaky')
+def flaky_job(fail_times, counter_key):
+    FLAKY_CALLS[counter_key] = FLAKY_CALLS.get(counter_key, 0) + 1
+    if FLAKY_CALLS[counter_key] <= fail_times:
+        raise RuntimeError('flaky job failed')
+
+FLAKY_CALLS = {}
+
+
+@override_settings(JOB_QUEUE={'EXECUTOR_WORKERS': 0, 'MAX_ATTEMPTS': 2, 'RETRY_DELAY': 0})
+class JobQueueTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'job_customer', groups['Customer'])[0]
+        cls.admin = factories.create_users(1, 'job_admin', is_superuser=True)[0]
+        cls.menu_item = factories.create_menu_items(1, factories.create_categories(1))[0]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_checkout_enqueues_order_confirmation(self):
+        Cart.objects.create(user=self.customer, menuitem=self.menu_item, quantity=2, unit_price=self.menu_item.price, price=self.menu_item.price * 2)
+        self.client.force_authenticate(self.customer)
+
+        resp = self.client.post('/api/orders')
+        self.assertEqual(resp.status_code, HTTP_201_CREATED, 'Unable to place order')
+
+        job = Job.objects.get(name='send_order_confirmation')
+        self.assertEqual(job.payload, {'order_id': Order.objects.get(user=self.customer).id})
+        self.assertEqual(len(mail.outbox), 0, 'Order confirmation must not be sent inside the request')
+
+        self.assertEqual(jobs.run_pending(), 2) # The confirmation and the order rollup
+        self.assertEqual(Job.objects.get(id=job.id).status, Job.DONE)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.customer.email])
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        recovering = jobs.enqueue('test_flaky', fail_times=1, counter_key='recovering')
+        broken = jobs.enqueue('test_flaky', fail_times=5, counter_key='broken')
+
+        jobs.run_pending()
+        self.assertEqual(Job.objects.get(id=recovering.id).status, Job.PENDING, 'Failed job should be queued for retry')
+
+        jobs.run_pending()
+        self.assertEqual(Job.objects.get(id=recovering.id).status, Job.DONE)
+        broken = Job.objects.get(id=broken.id)
+        self.assertEqual((broken.status, broken.attempts), (Job.FAILED, 2))
+        self.assertIn('flaky job failed', broken.last_error)
+
+    def test_job_of_a_dead_worker_is_reclaimed_after_its_lease(self):
+        lost = jobs.enqueue('test_flaky', fail_times=0, counter_key='lost')
+        exhausted = jobs.enqueue('test_flaky', fail_times=0, counter_key='exhausted', max_attempts=1)
+        self.assertTrue(jobs.claim(lost.id) and jobs.claim(exhausted.id)) # Their workers die here
+
+        self.assertEqual(jobs.run_pending(), 0, 'The leases are still valid')
+        self.assertEqual(Job.objects.get(id=lost.id).status, Job.RUNNING)
+
+        Job.objects.filter(id__in=[lost.id, exhausted.id]).update(lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        self.assertEqual(jobs.run_pending(), 1)
+        lost = Job.objects.get(id=lost.id)
+        self.assertEqual((lost.status, lost.attempts, lost.lease_expires_at), (Job.DONE, 2, None))
+        exhausted = Job.objects.get(id=exhausted.id)
+        self.assertEqual(exhausted.status, Job.FAILED)
+        self.assertIn('Lease expired', exhausted.last_error)
+
+    def test_queue_depth_is_admin_only(self):
+        jobs.enqueue('test_flaky', fail_times=0, counter_key='depth')
+
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/jobs/stats').status_code, HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.admin)
+        resp = self.client.get('/api/jobs/stats')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.data['jobs']['test_flaky'], {'pending': 1})
+
+
+@override_settings(JOB_QUEUE={'EXECUTOR_WORKERS': 0})
+class SalesReportTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'report_customer', groups['Customer'])[0]
+        cls.manager = factories.create_users(1, 'report_manager', groups['Manager'])[0]
+        cls.crew = factories.create_users(1, 'report_crew', groups['Delivery Crew'])[0]
+        cls.pasta, cls.bread = factories.create_menu_items(2, factories.create_categories(1))
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def place_order(self, lines):
+        for menuitem, quantity in lines:
+            Cart.objects.create(user=self.customer, menuitem=menuitem, quantity=quantity
+            , unit_price=menuitem.price, price=menuitem.price * quantity)
+        self.client.force_authenticate(self.customer)
+        resp = self.client.post('/api/orders')
+        self.assertEqual(resp.status_code, HTTP_201_CREATED, 'Unable to place order')
+        self.assertEqual(jobs.run_pending(), 2) # The confirmation and the order rollup
+        return Order.objects.filter(user=self.customer).order_by('-id').first()
+
+    def rollup_rows(self):
+        return (
+            list(DailySales.objects.order_by('date').values_list('date', 'order_count', 'item_count', 'revenue'))
+            , list(MenuItemSales.objects.order_by('menuitem_id').values_list('menuitem_id', 'quantity', 'revenue'))
+            , list(CrewDeliveries.objects.values_list('delivery_crew_id', 'delivered'))
+        )
+
+    def test_rollups_follow_orders_and_deliveries(self):
+        self.place_order([(self.pasta, 2), (self.bread, 1)])
+        order = self.place_order([(self.pasta, 1)])
+
+        self.client.force_authenticate(self.manager)
+        resp = self.client.get('/api/reports/daily-sales')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(len(resp.data), 1)
+        revenue = str(self.pasta.price * 3 + self.bread.price)
+        self.assertEqual((resp.data[0]['order_count'], resp.data[0]['item_count'], resp.data[0]['revenue']), (2, 4, revenue))
+
+        resp = self.client.get('/api/reports/top-items', {'limit': 1})
+        self.assertEqual([(row['title'], row['quantity']) for row in resp.data], [(self.pasta.title, 3)])
+
+        order.delivery_crew = self.crew
+        order.save()
+        self.client.force_authenticate(self.crew)
+        resp = self.client.put('/api/orders/{}'.format(order.id), {'order.status': True})
+        self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+        self.assertEqual(jobs.run_pending(), 1) # The delivery rollup
+
+        self.client.force_authenticate(self.manager)
+        resp = self.client.get('/api/reports/crew-deliveries')
+        self.assertEqual([(row['delivery_crew'], row['delivered']) for row in resp.data], [(self.crew.id, 1)])
+
+        incremental = self.rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(self.rollup_rows(), incremental, 'Rebuilt rollups differ from the incremental ones')
+
+    def test_order_rollup_counts_an_order_once(self):
+        order = self.place_order([(self.pasta, 2)])
+        self.assertTrue(Order.objects.get(id=order.id).rolled_up)
+        jobs.enqueue('rollup_order', order_id=order.id) # A retry of a job that did its work but was not marked done
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(list(DailySales.objects.values_list('order_count', 'item_count')), [(1, 2)])
+
+    def test_delivery_rollup_counts_a_delivery_once(self):
+        order = self.place_order([(self.pasta, 1)])
+        Order.objects.filter(id=order.id).update(delivery_crew=self.crew, status=True)
+        jobs.enqueue('rollup_delivery', order_id=order.id)
+        jobs.enqueue('rollup_delivery', order_id=order.id) # A retry of a job that did its work but was not marked done
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual(list(CrewDeliveries.objects.values_list('delivery_crew_id', 'delivered')), [(self.crew.id, 1)])
+
+        Order.objects.filter(id=order.id).update(status=False)
+        jobs.enqueue('rollup_delivery', order_id=order.id)
+        rollups.rebuild() # Already counts the undelivered order, so the queued job has nothing left to do
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(list(CrewDeliveries.objects.values_list('delivery_crew_id', 'delivered')), [])
+
+    def test_reports_are_manager_only_and_validate_dates(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/reports/daily-sales').status_code, HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.client.get('/api/reports/daily-sales', {'start': 'yesterday'}).status_code, HTTP_400_BAD_REQUEST)
+
+
+class OrderArchiveTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customers = factories.create_users(2, 'archive_customer_', groups['Customer'])
+        cls.crew = factories.create_users(1, 'archive_crew', groups['Delivery Crew'])[0]
+        cls.menu_item = factories.create_menu_items(1, factories.create_categories(1))[0]
+
+        old, recent = date.today() - timedelta(days=200), date.today() - timedelta(days=1)
+        cls.old_delivered = [cls.create_order(customer, old, True) for customer in cls.customers for _ in range(2)]
+        cls.old_open = cls.create_order(cls.customers[0], old, False)
+        cls.recent_delivered = cls.create_order(cls.customers[0], recent, True)
+
+    @classmethod
+    def create_order(cls, customer, order_date, delivered):
+        price = cls.menu_item.price
+        order = Order.objects.create(user=customer, delivery_crew=cls.crew, status=delivered, total=price * 2, date=order_date
+        , rolled_up=True, delivery_rolled_up_crew=cls.crew if delivered else None) # As left by the rollup jobs
+        OrderItem.objects.create(order=order, menuitem=cls.menu_item, quantity=2, unit_price=price, price=price * 2)
+        return order
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_archive_moves_only_old_delivered_orders_in_batches(self):
+        rollups.rebuild()
+        before = list(DailySales.objects.order_by('date').values_list('date', 'order_count', 'item_count', 'revenue'))
+
+        self.assertEqual(archive.archive_orders(after_days=90, batch_size=3, max_batches=1), 3)
+        self.assertEqual(archive.archive_orders(after_days=90, batch_size=3), 1)
+
+        self.assertEqual(set(ArchivedOrder.objects.values_list('id', flat=True)), {order.id for order in self.old_delivered})
+        self.assertEqual(ArchivedOrderItem.objects.count(), len(self.old_delivered))
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {self.old_open.id, self.recent_delivered.id})
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+        rollups.rebuild()
+        after = list(DailySales.objects.order_by('date').values_list('date', 'order_count', 'item_count', 'revenue'))
+        self.assertEqual(after, before, 'Rollup rebuild must include archived orders')
+
+    def test_orders_not_yet_rolled_up_are_not_archived(self):
+        Order.objects.filter(id=self.old_delivered[0].id).update(rolled_up=False)
+        Order.objects.filter(id=self.old_delivered[1].id).update(delivery_rolled_up_crew=None) # Delivery job pending
+        self.assertEqual(archive.archive_orders(after_days=90), 2)
+        self.assertEqual(Order.objects.filter(id__in=[order.id for order in self.old_delivered[:2]]).count(), 2)
+
+        rollups.record_order(self.old_delivered[0].id)
+        rollups.record_delivery(self.old_delivered[1].id)
+        self.assertEqual(archive.archive_orders(after_days=90), 2)
+
+    def test_history_endpoint_is_role_scoped(self):
+        archive.archive_orders(after_days=90)
+
+        self.client.force_authenticate(self.customers[0])
+        resp = self.client.get('/api/orders/history', {'page_size': 10})
+        self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+        self.assertEqual({row['id'] for row in resp.data['results']}, {order.id for order in self.old_delivered[:2]})
+        self.assertEqual(resp.data['results'][0]['items'][0]['menuitem'], self.menu_item.title)
+
+        self.client.force_authenticate(self.crew)
+        resp = self.client.get('/api/orders/history', {'page_size': 10})
+        self.assertEqual(resp.data['count'], len(self.old_delivered))
+
+
+class PriceIndexTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'index_customer', groups['Customer'])[0]
+        cls.pasta, cls.bread = factories.create_menu_items(2, factories.create_categories(1)) # Only the first is featured
+
+    def setUp(self):
+        price_index.invalidate() # Prices changed by an earlier test were rolled back
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_lookup_and_refresh_on_menu_change(self):
+        entry = price_index.lookup(self.pasta.id)
+        self.assertEqual(entry, (self.pasta.id, self.pasta.price, self.pasta.category_id, True))
+        self.assertIsNone(price_index.lookup(self.bread.id + 1000))
+
+        self.pasta.price += Decimal('0.60')
+        self.pasta.save()
+        self.assertEqual(price_index.lookup(self.pasta.id).price, self.pasta.price, 'Index not refreshed after menu change')
+
+    def test_cart_add_does_not_query_menu_items(self):
+        price_index.get_index()
+        for expected_status in (HTTP_201_CREATED, HTTP_200_OK):
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.post('/api/cart/menu-items', {'menuitem_id': self.pasta.id, 'quantity': 2})
+            self.assertEqual(resp.status_code, expected_status, resp.content)
+            menu_queries = [q['sql'] for q in queries if 'FROM "LittleLemonDRF_menuitem"' in q['sql']]
+            self.assertEqual(menu_queries, [], 'Cart add should read prices from the index')
+
+        cart = Cart.objects.get(user=self.customer)
+        self.assertEqual((cart.quantity, cart.unit_price, cart.price), (4, self.pasta.price, self.pasta.price * 4))
+
+        resp = self.client.post('/api/cart/menu-items', {'menuitem_id': self.bread.id + 1000, 'quantity': 1})
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+    def test_checkout_reconciles_stale_index(self):
+        price_index.get_index()
+        new_price = self.bread.price + Decimal('0.50')
+        MenuItem.objects.filter(id=self.bread.id).update(price=new_price) # Bypasses the post_save version bump
+        self.assertEqual(price_index.lookup(self.bread.id).price, self.bread.price)
+
+        self.client.post('/api/cart/menu-items', {'menuitem_id': self.bread.id, 'quantity': 1})
+        resp = self.client.post('/api/orders')
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        self.assertEqual(price_index.lookup(self.bread.id).price, new_price, 'Checkout should refresh a stale index')
+
+
+class RolePolicyTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.users = {}
+        for username, group_names in (('owner', ['Customer']), ('other', ['Customer']), ('crew', ['Delivery Crew'])
+        , ('idle_crew', ['Delivery Crew']), ('manager', ['Manager']), ('crew_customer', ['Customer', 'Delivery Crew'])):
+            cls.users[username] = factories.create_users(1, 'policy_' + username)[0]
+            cls.users[username].groups.add(*(groups[name] for name in group_names))
+
+        menu_item = factories.create_menu_items(1, factories.create_categories(1))[0]
+        cls.order = Order.objects.create(user=cls.users['owner'], delivery_crew=cls.users['crew'], total=menu_item.price, date=date.today())
+        OrderItem.objects.create(order=cls.order, menuitem=menu_item, quantity=1, unit_price=menu_item.price, price=menu_item.price)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def make_request(self, username, method='GET'):
+        request = Request(getattr(APIRequestFactory(), method.lower())('/'))
+        request.user = self.users[username]
+        return request
+
+    def test_composed_permissions_resolve_roles_once(self):
+        request = self.make_request('crew')
+        with self.assertNumQueries(1):
+            self.assertTrue((IsCustomer | IsManagerOrAdmin | IsDeliveryCrew)().has_permission(request, None))
+            self.assertFalse(IsManagerOrAdmin().has_permission(request, None))
+
+    def test_decision_fetches_and_checks_ownership_in_one_query(self):
+        expected = {'owner': 'allowed', 'other': 'forbidden', 'crew': 'allowed', 'idle_crew': 'forbidden'
+        , 'manager': 'allowed', 'crew_customer': 'forbidden'}
+        for username, reason in expected.items():
+            for roles_resolved in (False, True): # The roles come with the object, unless they are known already
+                request = self.make_request(username)
+                if roles_resolved:
+                    get_roles(request)
+                with self.assertNumQueries(1):
+                    decision = decide(request, SingleOrderView, Order.objects, pk=self.order.id)
+                self.assertEqual(decision.reason, reason, username)
+
+        request = self.make_request('manager')
+        self.assertEqual(decide(request, SingleOrderView, Order.objects, pk=self.order.id + 1).reason, 'not_found')
+
+    def test_admin_group_is_not_superuser(self):
+        self.users['owner'].groups.add(Group.objects.create(name='Admin'))
+        request = self.make_request('owner')
+        self.assertNotIn(ADMIN, get_roles(request))
+        self.assertFalse(IsManagerOrAdmin().has_permission(request, None))
+        self.assertEqual(decide(self.make_request('other'), SingleOrderView, Order.objects, pk=self.order.id).reason, 'forbidden')
+
+        self.users['other'].is_superuser = True
+        self.assertEqual(decide(self.make_request('other'), SingleOrderView, Order.objects, pk=self.order.id).reason, 'allowed')
+        self.assertTrue(IsManagerOrAdmin().has_permission(self.make_request('other'), None))
+
+    def test_single_order_endpoint_follows_policy(self):
+        expected = {'owner': HTTP_200_OK, 'other': HTTP_403_FORBIDDEN, 'crew': HTTP_200_OK, 'idle_crew': HTTP_403_FORBIDDEN, 'manager': HTTP_200_OK}
+        for username, status_code in expected.items():
+            self.client.force_authenticate(self.users[username])
+            resp = self.client.get('/api/orders/{}'.format(self.order.id))
+            self.assertEqual(resp.status_code, status_code, username)
+
+        self.assertEqual(self.client.get('/api/orders/{}'.format(self.order.id + 1)).status_code, HTTP_400_BAD_REQUEST)
+
+
+class SingleOrderQueryTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'single_customer', groups['Customer'])[0]
+        cls.manager = factories.create_users(1, 'single_manager', groups['Manager'])[0]
+        cls.crew, cls.other_crew = factories.create_users(2, 'single_crew', groups['Delivery Crew'])
+
+        menu_items = factories.create_menu_items(5, factories.create_categories(1))
+        cls.order = Order.objects.create(user=cls.customer, delivery_crew=cls.crew, total=sum(item.price for item in menu_items), date=date.today())
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.order, menuitem=menu_item, quantity=1, unit_price=menu_item.price, price=menu_item.price)
+            for menu_item in menu_items
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_get_uses_constant_queries(self):
+        for user in (self.customer, self.manager, self.crew):
+            self.client.force_authenticate(user)
+            with self.assertNumQueries(4): # roles, order lines (with order, users and menu items), users' groups and permissions
+                resp = self.client.get('/api/orders/{}'.format(self.order.id))
+            self.assertEqual(resp.status_code, HTTP_200_OK)
+            self.assertEqual(len(resp.data), 5)
+            self.assertEqual(resp.data[0]['order']['user']['groups'], ['Customer'])
+
+    def test_crew_status_update_is_a_targeted_update(self):
+        url = '/api/orders/{}'.format(self.order.id)
+        self.client.force_authenticate(self.crew)
+        with self.assertNumQueries(3): # roles, UPDATE, rollup job
+            resp = self.client.put(url, {'order.status': True})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertTrue(Order.objects.get(id=self.order.id).status)
+
+        resp = self.client.put(url, {'order.status': True}) # Unchanged: no rollup job
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(Job.objects.filter(name='rollup_delivery').count(), 1)
+
+        self.client.force_authenticate(self.other_crew)
+        self.assertEqual(self.client.put(url, {'order.status': False}).status_code, HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.put('/api/orders/{}'.format(self.order.id + 1), {'order.status': False}).status_code, HTTP_400_BAD_REQUEST)
+        self.assertTrue(Order.objects.get(id=self.order.id).status)
+
+    def test_manager_assignment_is_a_targeted_update(self):
+        self.client.force_authenticate(self.manager)
+        with self.assertNumQueries(3): # roles, crew validation, UPDATE
+            resp = self.client.put('/api/orders/{}'.format(self.order.id), {'order.delivery_crew_id': self.other_crew.id})
+        self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+        self.assertEqual(Order.objects.get(id=self.order.id).delivery_crew_id, self.other_crew.id)
+
+        resp = self.client.put('/api/orders/{}'.format(self.order.id), {'order.delivery_crew_id': self.customer.id})
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST, 'Only delivery crew can be assigned')
+        resp = self.client.put('/api/orders/{}'.format(self.order.id + 1), {'order.delivery_crew_id': self.crew.id})
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+
+class BatchOrderAssignmentTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'batch_customer', groups['Customer'])[0]
+        cls.manager = factories.create_users(1, 'batch_manager', groups['Manager'])[0]
+        cls.crew = factories.create_users(3, 'batch_crew_', groups['Delivery Crew'])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def create_orders(self, count, **kwargs):
+        return [Order.objects.create(user=self.customer, total=Decimal('10.00'), date=date.today(), **kwargs) for _ in range(count)]
+
+    def assign(self, data):
+        return self.client.post('/api/orders/assign', data, format='json')
+
+    def test_batch_assignment_runs_constant_queries(self):
+        query_counts = []
+        for count in (3, 30):
+            orders = self.create_orders(count)
+            data = {'assignments': [{'order_id': order.id, 'delivery_crew_id': self.crew[i % 2].id} for i, order in enumerate(orders)]}
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.assign(data)
+            self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+            self.assertEqual(resp.data['assigned'], count)
+            query_counts.append(len(queries))
+
+            for i, order in enumerate(orders):
+                self.assertEqual(Order.objects.get(id=order.id).delivery_crew_id, self.crew[i % 2].id)
+        self.assertEqual(query_counts[0], query_counts[1], 'Query count should not grow with the batch size')
+
+    def test_invalid_batch_is_rejected_as_a_whole(self):
+        order, other = self.create_orders(2)
+        resp = self.assign({'assignments': [
+            {'order_id': order.id, 'delivery_crew_id': self.crew[0].id}
+            , {'order_id': other.id, 'delivery_crew_id': self.customer.id}
+            , {'order_id': other.id + 100, 'delivery_crew_id': self.crew[0].id}
+        ]})
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(resp.data), {'delivery_crew_id', 'order_id'})
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=False).exists(), 'Nothing should be assigned')
+
+        self.assertEqual(self.assign({}).status_code, HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(self.crew[0])
+        self.assertEqual(self.assign({'auto_balance': True}).status_code, HTTP_403_FORBIDDEN)
+
+    def test_auto_balance_uses_current_load(self):
+        self.create_orders(3, delivery_crew=self.crew[0])
+        self.create_orders(2, delivery_crew=self.crew[1], status=True) # Delivered orders are not load
+        unassigned = self.create_orders(7)
+
+        resp = self.assign({'auto_balance': True})
+        self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+        self.assertEqual(resp.data['assigned'], len(unassigned))
+
+        open_loads = [Order.objects.filter(delivery_crew=crew, status=False).count() for crew in self.crew]
+        self.assertEqual(sorted(open_loads), [3, 3, 4])
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=True).exists())
+
+    def test_auto_balance_reports_only_its_own_assignments(self):
+        unassigned = self.create_orders(4)
+        taken = unassigned[1]
+        update = dispatch._update
+
+        def claimed_first(assignments, only_unassigned=False):
+            # Another manager or a claiming crew member gets to one of the planned orders first
+            Order.objects.filter(id=taken.id).update(delivery_crew_id=self.manager.id)
+            return update(assignments, only_unassigned)
+
+        with unittest.mock.patch.object(dispatch, '_update', claimed_first):
+            resp = self.assign({'auto_balance': True})
+        self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+        self.assertEqual(resp.data['assigned'], 3)
+        self.assertNotIn(taken.id, [assignment['order_id'] for assignment in resp.data['assignments']])
+        self.assertEqual(Order.objects.get(id=taken.id).delivery_crew_id, self.manager.id)
+        for assignment in resp.data['assignments']:
+            self.assertEqual(Order.objects.get(id=assignment['order_id']).delivery_crew_id, assignment['delivery_crew_id'])
+
+
+class CrewWorkQueueTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'queue_customer', groups['Customer'])[0]
+        cls.crew = factories.create_users(2, 'queue_crew_', groups['Delivery Crew'])
+        cls.menu_item = factories.create_menu_items(1, factories.create_categories(1))[0]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_order(self, days_ago, **kwargs):
+        price = self.menu_item.price
+        order = Order.objects.create(user=self.customer, total=price, date=date.today() - timedelta(days=days_ago), **kwargs)
+        OrderItem.objects.create(order=order, menuitem=self.menu_item, quantity=1, unit_price=price, price=price)
+        return order
+
+    def test_queue_lists_own_open_orders_oldest_first(self):
+        newer = self.create_order(1, delivery_crew=self.crew[0])
+        older = self.create_order(3, delivery_crew=self.crew[0])
+        self.create_order(5, delivery_crew=self.crew[0], status=True)
+        self.create_order(5, delivery_crew=self.crew[1])
+
+        self.client.force_authenticate(self.crew[0])
+        with self.assertNumQueries(4): # roles, count, orders with customer, lines with menu items
+            resp = self.client.get('/api/orders/queue', {'page_size': 10})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual([row['id'] for row in resp.data['results']], [older.id, newer.id])
+        self.assertEqual(resp.data['results'][0]['items'][0]['menuitem'], self.menu_item.title)
+
+    def test_claim_takes_oldest_unassigned_order_once(self):
+        self.create_order(9, delivery_crew=self.crew[1])
+        oldest, newest = self.create_order(5), self.create_order(1)
+
+        claimed = []
+        for crew in (self.crew[0], self.crew[1], self.crew[0]):
+            self.client.force_authenticate(crew)
+            resp = self.client.post('/api/orders/queue/claim')
+            claimed.append((resp.status_code, resp.data['id'] if resp.data else None))
+
+        self.assertEqual(claimed, [(HTTP_200_OK, oldest.id), (HTTP_200_OK, newest.id), (HTTP_204_NO_CONTENT, None)])
+        self.assertEqual(Order.objects.get(id=oldest.id).delivery_crew_id, self.crew[0].id)
+        self.assertEqual(Order.objects.get(id=newest.id).delivery_crew_id, self.crew[1].id)
+
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.post('/api/orders/queue/claim').status_code, HTTP_403_FORBIDDEN)
+
+    def test_claim_keeps_going_after_lost_races(self):
+        orders = [self.create_order(days_ago) for days_ago in range(10, 0, -1)]
+        find = dispatch.next_unassigned_order
+        lost = []
+
+        def contended():
+            # The first 8 orders found are claimed by someone else before our UPDATE runs
+            order_id = find()
+            if order_id is not None and len(lost) < 8:
+                Order.objects.filter(id=order_id).update(delivery_crew_id=self.crew[1].id)
+                lost.append(order_id)
+            return order_id
+
+        self.client.force_authenticate(self.crew[0])
+        with unittest.mock.patch.object(dispatch, 'next_unassigned_order', contended):
+            resp = self.client.post('/api/orders/queue/claim')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.data['id'], orders[8].id)
+        self.assertEqual(lost, [order.id for order in orders[:8]])
+
+
+class BulkGroupMembershipTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.crew_group = factories.create_groups()['Delivery Crew']
+        cls.admin = factories.create_users(1, 'bulk_admin', is_superuser=True)[0]
+        cls.users = factories.create_users(40, 'bulk_user_')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_bulk_add_and_remove_use_constant_queries(self):
+        endpoint = '/api/groups/delivery-crew/users'
+        self.users[0].groups.add(self.crew_group)
+        missing_id = self.users[-1].id + 100
+        user_ids = [user.id for user in self.users] + [missing_id]
+
+        with self.assertNumQueries(5): # group, users with membership, SAVEPOINT, bulk INSERT, RELEASE
+            resp = self.client.post(endpoint, {'userIds': user_ids}, format='json')
+        self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+        self.assertEqual(resp.data['summary'], {'added': 39, 'already a member': 1, 'user not found': 1})
+        self.assertEqual(resp.data['results'][-1], {'userId': missing_id, 'result': 'user not found'})
+        self.assertEqual(self.crew_group.user_set.count(), 40)
+
+        resp = self.client.delete(endpoint, {'userIds': user_ids[:10]}, format='json')
+        self.assertEqual(resp.data['summary'], {'removed': 10})
+        self.assertEqual(self.crew_group.user_set.count(), 30)
+
+    def test_bulk_endpoints_accept_form_lists_and_validate(self):
+        endpoint = '/api/groups/manager/users'
+        resp = self.client.post(endpoint, urllib.parse.urlencode({'userIds': [self.users[0].id, self.users[1].id]}, doseq=True)
+        , content_type='application/x-www-form-urlencoded')
+        self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+        self.assertEqual(resp.data['summary'], {'added': 2})
+
+        self.assertEqual(self.client.post(endpoint, {'userIds': []}, format='json').status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post(endpoint, {'userIds': ['x']}, format='json').status_code, HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(self.users[2])
+        self.assertEqual(self.client.post(endpoint, {'userIds': [self.users[2].id]}, format='json').status_code, HTTP_403_FORBIDDEN)
+
+
+class GroupListingTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.admin = factories.create_users(1, 'listing_admin', is_superuser=True)[0]
+        cls.members = factories.create_users(25, 'listing_crew_', groups['Delivery Crew'])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_keyset_pages_cover_all_members_in_constant_queries(self):
+        url, seen = '/api/groups/delivery-crew/users?page_size=10', []
+        while url:
+            with self.assertNumQueries(2): # members page, their groups
+                resp = self.client.get(url)
+            self.assertEqual(resp.status_code, HTTP_200_OK, resp.content)
+            seen.extend(row['id'] for row in resp.data['results'])
+            url = resp.data['next']
+
+        self.assertEqual(seen, [member.id for member in self.members])
+        self.assertEqual(resp.data['results'][0], {'id': self.members[-5].id, 'username': 'listing_crew_20'
+        , 'email': 'listing_crew_20@littlelemon.test', 'groups': ['Delivery Crew']})
+
+    def test_sparse_fieldset_prunes_output_and_sql(self):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/api/groups/delivery-crew/users', {'fields': 'id,username'})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.data['results'][0], {'id': self.members[0].id, 'username': 'listing_crew_0'})
+        self.assertEqual(len(queries), 1, 'groups should not be prefetched when not requested')
+        self.assertNotIn('"auth_user"."password"', queries[0]['sql'])
+
+        resp = self.client.get('/api/groups/delivery-crew/users', {'fields': 'id,password'})
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
+
+
+class OrderPayloadExpansionTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'expand_customer', groups['Customer'])[0]
+        cls.manager = factories.create_users(1, 'expand_manager', groups['Manager'])[0]
+        cls.crew = factories.create_users(1, 'expand_crew', groups['Delivery Crew'])[0]
+
+        cls.menu_item = factories.create_menu_items(1, factories.create_categories(1))[0]
+        price = cls.menu_item.price
+        cls.orders = []
+        for _ in range(3):
+            order = Order.objects.create(user=cls.customer, delivery_crew=cls.crew, total=price * 2, date=date.today())
+            OrderItem.objects.create(order=order, menuitem=cls.menu_item, quantity=2, unit_price=price, price=price * 2)
+            cls.orders.append(order)
+        Cart.objects.create(user=cls.customer, menuitem=cls.menu_item, quantity=1, unit_price=price, price=price)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_default_payload_is_fully_expanded_in_constant_queries(self):
+        self.client.force_authenticate(self.manager)
+        with self.assertNumQueries(4): # roles, lines with orders, users and menu items, users' groups and permissions
+            resp = self.client.get('/api/orders')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(len(resp.data), 3)
+        self.assertEqual(resp.data[0]['order']['delivery_crew']['groups'], ['Delivery Crew'])
+        self.assertEqual(resp.data[0]['menuitem']['category'], self.menu_item.category.title)
+
+    def test_collapsed_objects_become_ids_without_joins(self):
+        self.client.force_authenticate(self.manager)
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/api/orders', {'fields': 'order,quantity', 'expand': ''})
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp.data[0], {'order': self.orders[0].id, 'quantity': 2})
+        self.assertEqual(len(queries), 2) # roles, lines
+        self.assertNotIn('JOIN', queries[1]['sql'])
+        self.assertNotIn('"price"', queries[1]['sql'])
+
+        resp = self.client.get('/api/orders', {'fields': 'order', 'expand': 'order'})
+        self.assertEqual(resp.data[0]['order']['user'], self.customer.id)
+        self.assertEqual(resp.data[0]['order']['delivery_crew'], self.crew.id)
+
+        with self.assertNumQueries(4): # roles, lines with order and customer, customer's groups and permissions
+            resp = self.client.get('/api/orders/{}'.format(self.orders[1].id), {'expand': 'order.user'})
+        self.assertEqual(resp.data[0]['order']['user']['username'], self.customer.username)
+        self.assertEqual(resp.data[0]['order']['delivery_crew'], self.crew.id)
+        self.assertEqual(resp.data[0]['menuitem'], self.menu_item.id)
+
+    def test_single_order_still_checks_ownership(self):
+        other = User.objects.create(username='expand_other')
+        other.groups.add(Group.objects.get(name='Customer'))
+        self.client.force_authenticate(other)
+        resp = self.client.get('/api/orders/{}'.format(self.orders[0].id), {'fields': 'quantity'})
+        self.assertEqual(resp.status_code, HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.customer)
+        resp = self.client.get('/api/orders/{}'.format(self.orders[0].id), {'fields': 'quantity'})
+        self.assertEqual(resp.data, [{'quantity': 2}])
+
+    def test_cart_fields_and_expand(self):
+        self.client.force_authenticate(self.customer)
+        resp = self.client.get('/api/cart/menu-items')
+        self.assertEqual(resp.data[0]['menuitem']['title'], self.menu_item.title)
+        self.assertEqual(resp.data[0]['user'], self.customer.username)
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/api/cart/menu-items', {'fields': 'menuitem,price', 'expand': ''})
+        self.assertEqual(resp.data, [{'menuitem': self.menu_item.id, 'price': str(self.menu_item.price)}])
+        self.assertNotIn('JOIN', queries[-1]['sql'])
+
+    def test_unknown_fields_or_paths_are_rejected(self):
+        self.client.force_authenticate(self.manager)
+        self.assertEqual(self.client.get('/api/orders', {'expand': 'order.secret'}).status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/orders', {'fields': 'secret'}).status_code, HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/cart/menu-items', {'expand': 'user'}).status_code, HTTP_400_BAD_REQUEST)
+
+
+class ResponseEncodingTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.manager = factories.create_users(1, 'encoding_manager', groups['Manager'])[0]
+        customer = factories.create_users(1, 'encoding_customer', groups['Customer'])[0]
+        factories.create_orders(1, [customer], factories.create_menu_items(20, factories.create_categories(1)), lines_per_order=20)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate('deflate'), None)
+        self.assertEqual(negotiate('gzip;q=0'), None)
+        self.assertEqual(negotiate('*'), negotiate('br, gzip'))
+
+    def test_large_responses_are_compressed_when_accepted(self):
+        plain = self.client.get('/api/orders')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        resp = self.client.get('/api/orders', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertLess(len(resp.content), len(plain.content))
+        self.assertEqual(gzip.decompress(resp.content), plain.content)
+        self.assertTrue(resp.content[3] & 0x08) # FNAME set: GZipMiddleware's random padding against BREACH
+
+    def test_exempt_paths_and_secret_responses_are_not_compressed(self):
+        with override_settings(RESPONSE_COMPRESSION={'EXEMPT_PATHS': ('/api/orders',)}):
+            resp = self.client.get('/api/orders', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', resp)
+        self.assertEqual(len(resp.json()), 20)
+
+        request = APIRequestFactory().get('/api/menu-items', HTTP_ACCEPT_ENCODING='gzip, br')
+        middleware = CompressionMiddleware(never_compress(lambda request: HttpResponse(b'secret ' * 1000)))
+        resp = middleware(request)
+        self.assertNotIn('Content-Encoding', resp)
+        self.assertEqual(resp.content, b'secret ' * 1000)
+
+    @override_settings(RESPONSE_COMPRESSION={'MIN_SIZE': 10 ** 6})
+    def test_small_responses_are_not_compressed(self):
+        resp = self.client.get('/api/orders', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', resp)
+        self.assertEqual(len(resp.json()), 20)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_messagepack_renderer(self):
+        resp = self.client.get('/api/orders', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(resp['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(resp.content), self.client.get('/api/orders').json())
+
+
+class FastJSONTestCase(APITestCase):
+
+    def test_output_is_identical_to_drf_renderer(self):
+        payloads = [
+            {'price': Decimal('8.50'), 'raw': Decimal('1.10'), 'date': date(2024, 2, 29), 'time': time(12, 30, 5, 123456)
+            , 'naive': datetime(2024, 1, 1, 8, 0, 0, 123456), 'utc': datetime(2024, 1, 1, 8, tzinfo=timezone.utc)}
+            , [{'title': 'Caf\u00e9 \u2028 line \u2029 paragraph', 'error': ErrorDetail('Invalid', code='invalid')}]
+            , {'big': 2 ** 70, 'keys': {1: 'one', 2: 'two'}} # Handled by the stdlib fallback
+            , {'nested': [[1, 2.5, None, True], ('tuple',), {}], 'empty': ''}
+        ]
+        for payload in payloads:
+            self.assertEqual(FastJSONRenderer().render(payload), JSONRenderer().render(payload), payload)
+        self.assertEqual(
+            FastJSONRenderer().render(payloads[0], 'application/json; indent=4')
+            , JSONRenderer().render(payloads[0], 'application/json; indent=4')
+        )
+
+    @unittest.skipIf(orjson is None, 'orjson is not installed')
+    def test_float_differences_from_drf_renderer(self):
+        # orjson has its own float notation and no way to hand floats to DRF's encoder
+        payload = {'large': 1e16, 'small': 1e-7, 'plain': 2.5}
+        self.assertEqual(FastJSONRenderer().render(payload), b'{"large":1e16,"small":1e-7,"plain":2.5}')
+        self.assertEqual(JSONRenderer().render(payload), b'{"large":1e+16,"small":1e-07,"plain":2.5}')
+        self.assertEqual(json.loads(FastJSONRenderer().render(payload)), json.loads(JSONRenderer().render(payload)))
+
+        self.assertEqual(FastJSONRenderer().render({'value': float('nan')}), b'{"value":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'value': float('nan')})
+
+    def test_responses_use_fast_renderer(self):
+        user = User.objects.create(username='json_customer')
+        user.groups.add(Group.objects.create(name='Customer'))
+        category = Category.objects.create(title='Main', slug='main')
+        menu_item = MenuItem.objects.create(title='Caf\u00e9 au lait', price=Decimal('3.10'), featured=False, category=category)
+        Cart.objects.create(user=user, menuitem=menu_item, quantity=3, unit_price=Decimal('3.10'), price=Decimal('9.30'))
+
+        self.client.force_authenticate(user)
+        resp = self.client.get('/api/cart/menu-items')
+        self.assertEqual(resp.content, JSONRenderer().render(resp.data))
+        self.assertEqual(resp.json()[0]['price'], '9.30')
+
+    def test_parser_matches_drf_parser(self):
+        for body in (b'{"userIds": [1, 2, 3], "name": "Caf\xc3\xa9"}', b'[123456789012345678901234567890]'):
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+
+        for body in (b'{"a": ', b'[NaN]'):
+            with self.assertRaises(ParseError) as expected:
+                JSONParser().parse(io.BytesIO(body))
+            with self.assertRaises(ParseError) as fast:
+                FastJSONParser().parse(io.BytesIO(body))
+            self.assertEqual(str(fast.exception), str(expected.exception))
+
+
+@override_settings(JOB_QUEUE={'EXECUTOR_WORKERS': 0})
+class IdempotencyKeyTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'idempotent_customer', groups['Customer'])[0]
+        cls.pasta = factories.create_menu_items(1, factories.create_categories(1))[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def add_to_cart(self, quantity, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post('/api/cart/menu-items', {'menuitem_id': self.pasta.id, 'quantity': quantity}, **headers)
+
+    def test_retried_checkout_replays_the_first_response(self):
+        self.add_to_cart(2)
+        first = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.status_code, HTTP_201_CREATED)
+
+        with self.assertNumQueries(2): # roles, key lookup
+            retry = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual((retry.status_code, retry.content), (first.status_code, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(first['Location'], 'http://testserver/api/orders/{}'.format(Order.objects.get().id))
+        self.assertEqual(retry['Location'], first['Location'], 'Stored headers are replayed')
+
+        self.add_to_cart(1)
+        self.assertEqual(self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout-2').status_code, HTTP_201_CREATED)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_retried_cart_add_is_applied_once(self):
+        self.assertEqual(self.add_to_cart(2, key='cart-1').status_code, HTTP_201_CREATED)
+        self.assertEqual(self.add_to_cart(2, key='cart-1').status_code, HTTP_201_CREATED)
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 2)
+
+        resp = self.add_to_cart(3, key='cart-1')
+        self.assertEqual(resp.status_code, HTTP_422_UNPROCESSABLE_ENTITY, 'Same key, different request')
+        self.assertEqual(self.add_to_cart(2).status_code, HTTP_200_OK, 'Requests without a key are not deduplicated')
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 4)
+
+    def test_keys_are_per_user_and_expire(self):
+        self.add_to_cart(1, key='shared')
+        other = User.objects.create(username='idempotent_other')
+        other.groups.add(Group.objects.get(name='Customer'))
+        self.client.force_authenticate(other)
+        self.assertEqual(self.add_to_cart(1, key='shared').status_code, HTTP_201_CREATED)
+        self.assertEqual(Cart.objects.count(), 2)
+
+        IdempotencyKey.objects.update(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+        self.assertEqual(self.add_to_cart(1, key='shared').status_code, HTTP_200_OK, 'Expired keys run the request again')
+        self.assertEqual(idempotency.purge_expired(batch_size=1), 1)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_invalid_keys_are_rejected(self):
+        self.add_to_cart(1)
+        self.assertEqual(self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='').status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='x' * 256).status_code, HTTP_400_BAD_REQUEST)
+        self.assertEqual((Order.objects.count(), IdempotencyKey.objects.count()), (0, 0))
+
+    def test_client_errors_are_replayed(self):
+        first = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='empty-cart') # Nothing in the cart yet
+        self.assertEqual(first.status_code, HTTP_400_BAD_REQUEST)
+        self.add_to_cart(1)
+        retry = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='empty-cart')
+        self.assertEqual((retry.status_code, retry.content), (first.status_code, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 0)
+
+
+TEST_THROTTLING = {
+    'RATES': {
+        'Customer': {'read': '100/min', 'write': '100/min', 'polling': '3/min', 'checkout': '2/min'}
+        , 'Manager': {'read': '100/min', 'polling': '5/min'}
+    }
+    , 'ADMISSION': {'ENABLED': True, 'LATENCY_THRESHOLD': 0.5}
+}
+
+@override_settings(THROTTLING=TEST_THROTTLING, JOB_QUEUE={'EXECUTOR_WORKERS': 0})
+class ThrottlingTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'throttle_customer', groups['Customer'])[0]
+        cls.manager = factories.create_users(1, 'throttle_manager', groups['Manager'])[0]
+        cls.pasta = factories.create_menu_items(1, factories.create_categories(1))[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        throttling.local_buckets.clear()
+        throttling.latency.reset()
+        cache.clear()
+
+    def poll_until_throttled(self, user, url, limit=20):
+        self.client.force_authenticate(user)
+        for allowed in range(limit):
+            resp = self.client.get(url)
+            if resp.status_code == 429:
+                return allowed, resp
+        self.fail('{} was never throttled'.format(url))
+
+    def test_polling_is_limited_per_role_without_blocking_checkout(self):
+        allowed, resp = self.poll_until_throttled(self.customer, '/api/orders')
+        self.assertEqual(allowed, 3)
+        self.assertGreater(int(resp['Retry-After']), 0)
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 429, 'Polling endpoints share a bucket')
+        self.assertEqual(self.client.get('/api/category').status_code, HTTP_200_OK, "Other reads use the 'read' bucket")
+
+        self.client.post('/api/cart/menu-items', {'menuitem_id': self.pasta.id, 'quantity': 1})
+        self.assertEqual(self.client.post('/api/orders').status_code, HTTP_201_CREATED, 'Checkout has its own bucket')
+
+        allowed, _ = self.poll_until_throttled(self.manager, '/api/orders')
+        self.assertEqual(allowed, 5)
+
+    @override_settings(THROTTLING=dict(TEST_THROTTLING, BACKEND='cache'))
+    def test_cache_backend(self):
+        allowed, _ = self.poll_until_throttled(self.customer, '/api/menu-items')
+        self.assertEqual(allowed, 3)
+        self.assertEqual(len(throttling.local_buckets.buckets), 0)
+
+    def test_admission_control_sheds_reads_first(self):
+        self.client.force_authenticate(self.customer)
+        self.assertEqual(self.client.get('/api/menu-items').status_code, HTTP_200_OK)
+
+        throttling.latency.record(5.0) # A slow burst pushes the average over the threshold
+        resp = self.client.get('/api/menu-items')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp['Retry-After'], '5')
+
+        resp = self.client.post('/api/cart/menu-items', {'menuitem_id': self.pasta.id, 'quantity': 1})
+        self.assertEqual(resp.status_code, HTTP_201_CREATED, 'Writes are still admitted')
+
+        throttling.latency.reset()
+        self.assertEqual(self.client.get('/api/menu-items').status_code, HTTP_200_OK)
+
+
+class WarmUpTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.menu_item = factories.create_menu_items(1, factories.create_categories(1))[0]
+
+    def setUp(self):
+        price_index.invalidate()
+        cache.clear()
+
+    def test_warm_up_fills_the_caches(self):
+        timings = warmup.warm_up()
+        self.assertEqual(list(timings), ['url resolver', 'serializers', 'price index', 'menu listing'])
+        with self.assertNumQueries(0):
+            price_index.get_index()
+
+        self.client.force_authenticate(User.objects.create(username='warm_up_customer'))
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/api/menu-items')
+        self.assertEqual([row['title'] for row in resp.data['results']], [self.menu_item.title])
+        self.assertFalse([query for query in queries if 'menuitem' in query['sql'].lower()], 'Served from the warmed cache')
+
+    @override_settings(WARM_UP_MENU_ORIGINS=['http://not-allowed.example'])
+    def test_a_failing_step_is_logged_not_raised(self):
+        with self.assertLogs('LittleLemonDRF.warmup', 'WARNING') as logs:
+            timings = warmup.warm_up()
+        self.assertIn('menu listing', timings)
+        self.assertIn('Menu listing not warmed up', logs.output[0])
+
+    def test_serializers_of_routed_views_are_built(self):
+        from django.urls import get_resolver
+        built = warmup.warm_serializers(get_resolver())
+        self.assertIn(MenuItemSerializer, built)
+
+
+class LinkBuilderTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'links_customer', groups['Customer'])[0]
+        # A title that needs encoding in the category's menu_items_url
+        cls.category = Category.objects.create(title='Fish & Chips', slug='fish-and-chips')
+        cls.items = factories.create_menu_items(5, [cls.category], 'Cod')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+        links.clear()
+
+    def test_category_links_are_encoded_and_reversed_once(self):
+        Category.objects.create(title='Main', slug='main')
+        resp = self.client.get('/api/category')
+        self.assertEqual([row['menu_items_url'] for row in resp.data], [
+            'http://testserver/api/menu-items?search=Fish+%26+Chips', 'http://testserver/api/menu-items?search=Main'
+        ])
+        self.client.get('/api/category')
+        self.assertEqual(links.reverse_path.cache_info().misses, 1)
+
+        resp = self.client.get(resp.data[0]['menu_items_url'])
+        self.assertEqual(resp.data['count'], 5)
+
+    def test_resource_urls(self):
+        resp = self.client.get('/api/menu-items/{}'.format(self.items[0].id))
+        self.assertEqual(resp.data['url'], 'http://testserver/api/menu-items/{}'.format(self.items[0].id))
+
+        resp = self.client.post('/api/cart/menu-items', {'menuitem_id': self.items[0].id, 'quantity': 1})
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        self.assertEqual(resp.data['menuitem']['url'], 'http://testserver/api/menu-items/{}'.format(self.items[0].id))
+        self.client.post('/api/orders')
+        order = Order.objects.get(user=self.customer)
+        resp = self.client.get('/api/orders')
+        self.assertEqual(resp.data[0]['order']['url'], 'http://testserver/api/orders/{}'.format(order.id))
+        self.assertEqual(resp.data[0]['menuitem']['url'], 'http://testserver/api/menu-items/{}'.format(self.items[0].id))
+        self.assertEqual(self.client.get(resp.data[0]['order']['url']).status_code, HTTP_200_OK)
+
+    def test_pagination_links(self):
+        resp = self.client.get('/api/menu-items', {'search': 'Fish & Chips', 'page': 2})
+        self.assertEqual(resp.data['next'], 'http://testserver/api/menu-items?page=3&search=Fish+%26+Chips')
+        self.assertEqual(resp.data['previous'], 'http://testserver/api/menu-items?search=Fish+%26+Chips')
+
+        resp = self.client.get(resp.data['next'])
+        self.assertIsNone(resp.data['next'])
+        self.assertEqual(resp.data['previous'], 'http://testserver/api/menu-items?page=2&search=Fish+%26+Chips')
+
+
+class MenuItemFilterTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'filter_customer', groups['Customer'])[0]
+
+        # Named items with chosen prices, so every filter below picks a different subset
+        cls.main = Category.objects.create(title='Main', slug='main')
+        cls.dessert = Category.objects.create(title='Dessert', slug='dessert')
+        cls.items = {
+            title: MenuItem.objects.create(title=title, price=Decimal(price), featured=featured, category=category)
+            for title, price, featured, category in [
+                ('Salmon', '18.00', True, cls.main), ('Salad', '8.50', False, cls.main), ('Steak', '24.00', False, cls.main)
+                , ('Sorbet', '5.00', True, cls.dessert), ('Tiramisu', '7.50', False, cls.dessert)
+            ]
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def titles(self, **params):
+        resp = self.client.get('/api/menu-items', dict(params, page_size=100))
+        self.assertEqual(resp.status_code, HTTP_200_OK, resp.data)
+        return [row['title'] for row in resp.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.titles(), ['Salmon', 'Salad', 'Steak', 'Sorbet', 'Tiramisu'], 'Ordered by id by default')
+        self.assertEqual(self.titles(price__gte='7.50', price__lte=18), ['Salmon', 'Salad', 'Tiramisu'])
+        self.assertEqual(self.titles(featured='true'), ['Salmon', 'Sorbet'])
+        self.assertEqual(self.titles(category=self.dessert.id), ['Sorbet', 'Tiramisu'])
+        self.assertEqual(self.titles(category='main', featured='false'), ['Salad', 'Steak'])
+        self.assertEqual(self.titles(title='Sal'), ['Salmon', 'Salad'])
+        self.assertEqual(self.titles(title='sal'), [], 'Prefix match is case sensitive')
+        self.assertEqual(self.titles(title=''), self.titles(), 'An empty title is no filter')
+
+    def test_invalid_filters_are_rejected(self):
+        for params, field in [
+            ({'price__gte': 'cheap'}, 'price__gte'), ({'price__lte': '-1'}, 'price__lte'), ({'featured': 'maybe'}, 'featured')
+            , ({'category': 'not a slug'}, 'category'), ({'price__gte': '10', 'price__lte': '5'}, 'price__lte')
+            , ({'category': '\u00b2'}, 'category'), ({'category': '9' * 20}, 'category')
+        ]:
+            resp = self.client.get('/api/menu-items', params)
+            self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST, params)
+            self.assertIn(field, resp.data)
+
+    def test_ordering_is_limited_to_indexed_fields(self):
+        self.assertEqual(self.titles(ordering='-price'), ['Steak', 'Salmon', 'Salad', 'Tiramisu', 'Sorbet'])
+        self.assertEqual(self.titles(ordering='category'), self.titles(), 'Unindexed orderings are ignored')
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_title_prefix_uses_the_index(self):
+        from LittleLemonDRF.filters import MenuItemFilter
+        request = Request(APIRequestFactory().get('/api/menu-items', {'title': 'Sal'}))
+        queryset = MenuItemFilter().filter_queryset(request, MenuItem.objects.all(), None)
+        plan = queryset.explain()
+        self.assertIn('USING INDEX LittleLemonDRF_menuitem_title', plan)
+
+    def test_listings_are_cached_per_menu_version(self):
+        self.titles(price__gte='5')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.titles(price__gte='5.00'), ['Salmon', 'Salad', 'Steak', 'Sorbet', 'Tiramisu'])
+        self.assertFalse([query for query in queries if 'littlelemondrf_menuitem' in query['sql']], 'Served from the cache')
+
+        self.items['Salad'].price = Decimal('4.00')
+        self.items['Salad'].save()
+        self.assertEqual(self.titles(price__gte='5'), ['Salmon', 'Steak', 'Sorbet', 'Tiramisu'])
+
+        self.dessert.title = 'Sweets'
+        self.dessert.save()
+        resp = self.client.get('/api/menu-items', {'price__gte': '5', 'page_size': 100})
+        self.assertEqual(resp.data['results'][-1]['category'], 'Sweets')
+
+
+@override_settings(PASSWORD_HASHERS=settings.PASSWORD_HASHERS, PASSWORD_HASHING={'ITERATIONS': 1000, 'ALLOW_FEWER_ITERATIONS': True})
+class PasswordHashingTestCase(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def login(self, username, password):
+        return self.client.post('/api/users/login', {'username': username, 'password': password})
+
+    def test_registration_uses_the_configured_iterations(self):
+        resp = self.client.post('/api/users/', {'username': 'hashing_new', 'password': 'a-long-passphrase-1'})
+        self.assertEqual(resp.status_code, HTTP_201_CREATED, resp.data)
+        self.assertTrue(User.objects.get(username='hashing_new').password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_password_is_rehashed_on_login(self):
+        user = User.objects.create(username='hashing_old', password=make_password('old-passphrase', hasher='pbkdf2_sha1'))
+        self.assertEqual(self.login('hashing_old', 'old-passphrase').status_code, HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'), 'Upgraded to the preferred hasher')
+
+        with override_settings(PASSWORD_HASHING={'ITERATIONS': 2000, 'ALLOW_FEWER_ITERATIONS': True}):
+            self.assertEqual(self.login('hashing_old', 'old-passphrase').status_code, HTTP_200_OK)
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'))
+            self.assertFalse(ProfiledPBKDF2PasswordHasher().must_update(user.password))
+
+        self.assertEqual(self.login('hashing_old', 'old-passphrase').status_code, HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$2000$'), 'Lowering the count never downgrades a hash')
+        self.assertEqual(self.login('hashing_old', 'wrong-passphrase').status_code, HTTP_400_BAD_REQUEST)
+
+    def test_fewer_iterations_than_django_need_an_opt_in(self):
+        with override_settings(PASSWORD_HASHING={'ITERATIONS': 1000}):
+            self.assertEqual(ProfiledPBKDF2PasswordHasher().iterations, PBKDF2PasswordHasher.iterations)
+        with override_settings(PASSWORD_HASHING={}):
+            self.assertEqual(ProfiledPBKDF2PasswordHasher().iterations, PBKDF2PasswordHasher.iterations)
+        self.assertEqual(ProfiledPBKDF2PasswordHasher().iterations, 1000)
+
+
+@override_settings(JOB_QUEUE={'EXECUTOR_WORKERS': 0}, THROTTLING={'RATES': {}})
+class OrderVolumeTestCase(APITestCase):
+    ORDERS = 10000
+    LINES_PER_ORDER = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        # Plain values only on the class: Django deep-copies test data objects for every test
+        groups = factories.create_groups()
+        customers = factories.create_users(200, 'volume_customer', groups['Customer'])
+        crew = factories.create_users(10, 'volume_crew', groups['Delivery Crew'])
+        menu_items = factories.create_menu_items(40, factories.create_categories(5))
+        orders = factories.create_orders(cls.ORDERS, customers, menu_items, lines_per_order=cls.LINES_PER_ORDER
+        , crew=crew[:5], assigned_ratio=0.8, delivered_ratio=0.5)
+
+        cls.customer_id, cls.crew_id, cls.idle_crew_id = customers[0].id, crew[0].id, crew[-1].id
+        cls.revenue = sum(order.total for order in orders)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_fixtures(self):
+        self.assertEqual(Order.objects.count(), self.ORDERS)
+        self.assertEqual(OrderItem.objects.count(), self.ORDERS * self.LINES_PER_ORDER)
+        self.assertEqual(Order.objects.filter(user_id=self.customer_id).count(), self.ORDERS // 200)
+        self.assertEqual(price_index.lookup(MenuItem.objects.first().id).price, MenuItem.objects.first().price, 'Menu version was bumped')
+
+    def test_rollups_rebuild(self):
+        rollups.rebuild()
+        daily = DailySales.objects.all()
+        self.assertEqual(sum(row.order_count for row in daily), self.ORDERS)
+        self.assertEqual(sum(row.item_count for row in daily), sum(OrderItem.objects.values_list('quantity', flat=True)))
+        self.assertEqual(sum(row.revenue for row in daily), self.revenue)
+
+    def test_customer_listing_queries_do_not_grow(self):
+        self.client.force_authenticate(User.objects.get(id=self.customer_id))
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get('/api/orders')
+        self.assertEqual(len(resp.data), self.ORDERS // 200 * self.LINES_PER_ORDER)
+        self.assertLessEqual(len(queries), 6)
+
+    def test_crew_queue_and_auto_balance(self):
+        self.client.force_authenticate(User.objects.get(id=self.crew_id))
+        resp = self.client.get('/api/orders/queue', {'page_size': 50})
+        open_orders = Order.objects.filter(delivery_crew_id=self.crew_id, status=False).count()
+        self.assertEqual(resp.data['count'], open_orders)
+        self.assertEqual(len(resp.data['results']), min(50, open_orders))
+
+        unassigned = Order.objects.filter(delivery_crew__isnull=True).count()
+        self.assertEqual(len(auto_balance(limit=unassigned)), unassigned)
+        self.assertFalse(Order.objects.filter(delivery_crew__isnull=True).exists())
+        self.assertTrue(Order.objects.filter(delivery_crew_id=self.idle_crew_id).exists(), 'Crew without orders got some')
+
+
+class GenerateDataTestCase(APITestCase):
+
+    def test_order_specs_are_deterministic(self):
+        from LittleLemonDRF.management.commands.generate_data import order_specs
+        args = (500, 50, 5, 30, date(2024, 1, 1), 10)
+        specs = list(order_specs(7, *args))
+        self.assertEqual(specs, list(order_specs(7, *args)))
+        self.assertNotEqual(specs, list(order_specs(8, *args)))
+
+        sizes = [len(lines) for *_, lines in specs]
+        self.assertGreater(sizes.count(1), len(specs) / 3, 'Most orders are small')
+        self.assertLessEqual(max(sizes), 20)
+        for *_, lines in specs:
+            self.assertEqual(len({item for item, _ in lines}), len(lines), 'Menu items are distinct within an order')
+
+    def test_command(self):
+        from django.core.management import call_command
+        out = io.StringIO()
+        options = {'customers': 20, 'crew': 3, 'managers': 1, 'categories': 2, 'menu_items': 10, 'carts': 5, 'orders': 250
+        , 'batch_size': 100, 'stdout': out}
+        call_command('generate_data', **options)
+        self.assertEqual(Order.objects.count(), 250)
+        self.assertEqual(User.objects.filter(groups__name='Customer').count(), 20)
+        self.assertEqual(sum(DailySales.objects.values_list('order_count', flat=True)), 250, 'Rollups were rebuilt')
+        totals = {order.id: order.total for order in Order.objects.all()}
+        for order_id, line_sum in OrderItem.objects.values_list('order_id').annotate(Sum('price')).order_by():
+            self.assertEqual(totals[order_id], line_sum)
+        self.assertEqual(OrderItem.objects.values('order_id').distinct().count(), 250, 'Every order got its lines')
+        self.assertEqual(carts.check(), [], 'Cart headers were rebuilt')
+
+        with self.assertRaises(CommandError):
+            call_command('generate_data', **options)
+
+
+class QueryInspectorTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'inspector_customer', groups['Customer'])[0]
+        factories.create_orders(2, [cls.customer], factories.create_menu_items(4, factories.create_categories(1)), lines_per_order=2)
+
+    def setUp(self):
+        querylog.report.clear()
+        self.client = APIClient()
+
+    def test_shape(self):
+        self.assertEqual(
+            querylog.shape('SELECT "a"."id" FROM "a" WHERE "a"."id" IN (%s, %s, %s)\n LIMIT 21')
+            , querylog.shape('SELECT "a"."id" FROM "a" WHERE "a"."id" IN (%s, %s) LIMIT 1')
+        )
+        self.assertEqual(querylog.shape('INSERT INTO "a" ("x", "y") VALUES (%s, %s), (%s, %s), (%s, %s)'), 'INSERT INTO "a" ("x", "y") VALUES (...), ...')
+
+    def test_duplicates_are_attributed_to_app_code(self):
+        with querylog.inspect_queries() as inspector:
+            titles = [line.menuitem.title for line in OrderItem.objects.all()] # N+1
+        self.assertEqual(len(titles), 4)
+        duplicates = inspector.duplicates()
+        self.assertEqual(list(duplicates.values()), [4])
+        origin = inspector.origins[next(iter(duplicates))]
+        self.assertTrue(origin.startswith('tests.py:QueryInspectorTestCase.test_duplicates_are_attributed_to_app_code'), origin)
+
+    def test_endpoint_report(self):
+        self.client.force_authenticate(self.customer)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'query-report.json')
+            with override_settings(QUERY_INSPECTOR={'ENABLED': True, 'REPORT_PATH': path, 'SLOW_QUERY_SECONDS': 0}):
+                with self.assertLogs('LittleLemonDRF.querylog', 'WARNING') as logs:
+                    self.assertEqual(self.client.get('/api/orders').status_code, HTTP_200_OK)
+                    self.assertEqual(self.client.get('/api/orders').status_code, HTTP_200_OK)
+            with open(path) as file:
+                content = file.read()
+
+        self.assertTrue(any('Slow query' in line and 'views.py:' in line for line in logs.output))
+        entry = json.loads(content)['GET api/orders']
+        self.assertEqual(entry['requests'], 2)
+        self.assertEqual(entry['duplicates'], {}, 'No N+1 in the order listing')
+        self.assertEqual(entry['queries'], entry['max_queries'] * 2)
+
+    def test_concurrent_report_writes(self):
+        report = querylog.QueryReport()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'query-report.json')
+            threads = [threading.Thread(target=report.write, args=(path,)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(os.listdir(directory), ['query-report.json'], 'No temporary file is left behind')
+            with open(path) as file:
+                self.assertEqual(json.load(file), {})
+
+
+@override_settings(PROFILING={**settings.PROFILING, 'ENABLED': True})
+class ProfilingTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.admin = factories.create_users(1, 'profiling_admin', is_superuser=True)[0]
+        cls.customer = factories.create_users(1, 'profiling_customer', groups['Customer'])[0]
+        factories.create_menu_items(3, factories.create_categories(1))
+
+    def setUp(self):
+        profiling.samples.clear()
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        # Token, not force_authenticate: the middleware authenticates before the view does
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(Token.objects.create(user=user).key))
+
+    def test_flag_is_ignored_for_non_admins(self):
+        self.authenticate(self.customer)
+        resp = self.client.get('/api/menu-items?profile=cprofile')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertEqual(resp.json()['count'], 3)
+
+    def test_cprofile_on_demand(self):
+        self.authenticate(self.admin)
+        resp = self.client.get('/api/menu-items?profile=cprofile')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        self.assertTrue(resp['Content-Type'].startswith('text/plain'))
+        self.assertEqual(resp['X-Profiled-Status'], '200')
+        content = resp.content.decode()
+        self.assertIn('function calls', content)
+        self.assertIn('cumulative', content)
+
+    def test_collapsed_stacks_on_demand(self):
+        self.authenticate(self.admin)
+        resp = self.client.get('/api/menu-items', HTTP_X_PROFILE='collapsed')
+        self.assertEqual(resp['X-Profiled-Status'], '200')
+        self.assertIn('MenuItemView.collapsed', resp['Content-Disposition'])
+
+    def test_stack_sampler(self):
+        def busy():
+            deadline = perf_counter() + 0.05
+            while perf_counter() < deadline:
+                pass
+
+        with profiling.StackSampler(threading.get_ident(), 0.001) as sampler:
+            busy()
+        lines = sampler.collapsed().splitlines()
+        self.assertTrue(lines)
+        stack, count = max((line.rsplit(' ', 1) for line in lines), key=lambda pair: int(pair[1]))
+        self.assertTrue(stack.endswith(';tests.py:ProfilingTestCase.test_stack_sampler.<locals>.busy'), stack)
+
+    def test_sampling_keeps_newest_files(self):
+        self.authenticate(self.customer)
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFILING={**settings.PROFILING, 'DIRECTORY': directory, 'SAMPLE_RATES': {'MenuItemView': 2}, 'MAX_FILES': 2}):
+                for _ in range(6):
+                    resp = self.client.get('/api/menu-items')
+                    self.assertEqual(resp.status_code, HTTP_200_OK)
+                    self.assertEqual(resp.json()['count'], 3)
+                self.client.get('/api/category') # Not sampled
+                files = sorted(os.listdir(directory))
+        self.assertEqual(len(files), 2)
+        self.assertTrue(all(name.endswith('-MenuItemView-GET.prof') for name in files), files)
+
+    def test_one_in_n_skips_the_first_requests(self):
+        with override_settings(PROFILING={**settings.PROFILING, 'SAMPLE_RATES': {'MenuItemView': 3}}):
+            self.assertEqual([profiling.samples.should_sample('MenuItemView') for _ in range(6)], [False, False, True] * 2)
+            self.assertFalse(profiling.samples.should_sample('CategoryView'))
+
+
+class CartHeaderTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'header_customer', groups['Customer'])[0]
+        cls.pasta, cls.bread = factories.create_menu_items(2, factories.create_categories(1))
+
+    def setUp(self):
+        price_index.invalidate() # Prices changed by an earlier test were rolled back
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def summary(self):
+        resp = self.client.get('/api/cart/summary')
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        return resp
+
+    def test_header_follows_cart_changes(self):
+        self.assertEqual(self.summary().json(), {'subtotal': '0.00', 'item_count': 0, 'revision': 0})
+
+        self.client.post('/api/cart/menu-items', {'menuitem_id': self.pasta.id, 'quantity': 2})
+        self.client.post('/api/cart/menu-items', {'menuitem_id': self.pasta.id, 'quantity': 1})
+        self.client.post('/api/cart/menu-items', {'menuitem_id': self.bread.id, 'quantity': 1})
+        self.assertEqual(self.summary().json(), {
+            'subtotal': str(self.pasta.price * 3 + self.bread.price), 'item_count': 4, 'revision': 3
+        })
+        self.assertEqual(carts.check(), [])
+
+        self.bread.delete() # Its cart line goes by cascade
+        self.assertEqual(self.summary().json()['subtotal'], str(self.pasta.price * 3))
+        self.assertEqual(carts.check(), [])
+
+        self.assertEqual(self.client.post('/api/orders').status_code, HTTP_201_CREATED)
+        self.assertEqual(self.summary().json(), {'subtotal': '0.00', 'item_count': 0, 'revision': 5})
+
+        self.client.post('/api/cart/menu-items', {'menuitem_id': self.pasta.id, 'quantity': 1})
+        self.client.delete('/api/cart/menu-items')
+        self.assertEqual(self.summary().json(), {'subtotal': '0.00', 'item_count': 0, 'revision': 7})
+
+    def test_conditional_get(self):
+        self.client.post('/api/cart/menu-items', {'menuitem_id': self.pasta.id, 'quantity': 2})
+        for url in ('/api/cart/summary', '/api/cart/menu-items'):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, HTTP_200_OK)
+            etag = resp['ETag']
+
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp['ETag'], etag)
+            self.assertFalse([q for q in queries if 'FROM "LittleLemonDRF_cart"' in q['sql']], 'Cart lines were read')
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='W/' + etag).status_code, 304, 'Weak comparison')
+
+        etags = [self.client.get(url)['ETag'] for url in ('/api/cart/summary', '/api/cart/menu-items')]
+        self.client.post('/api/cart/menu-items', {'menuitem_id': self.bread.id, 'quantity': 1})
+        for url, etag in zip(('/api/cart/summary', '/api/cart/menu-items'), etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, HTTP_200_OK)
+
+        # The line listing embeds the menu items, so a menu change is a new representation
+        etag = self.client.get('/api/cart/menu-items')['ETag']
+        self.pasta.title = 'Renamed'
+        self.pasta.save()
+        self.assertEqual(self.client.get('/api/cart/menu-items', HTTP_IF_NONE_MATCH=etag).status_code, HTTP_200_OK)
+
+    def test_check_command(self):
+        from django.core.management import call_command
+        factories.create_carts([self.customer], [self.pasta, self.bread])
+        Cart.objects.filter(user=self.customer, menuitem=self.pasta).update(quantity=F('quantity') + 1, price=F('price') + self.pasta.price)
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_cart_headers', stdout=out)
+        self.assertIn('User {}:'.format(self.customer.id), out.getvalue())
+
+        call_command('check_cart_headers', fix=True, stdout=out)
+        header = CartHeader.objects.get(user=self.customer)
+        self.assertEqual(header.subtotal, Cart.objects.filter(user=self.customer).aggregate(Sum('price'))['price__sum'])
+        self.assertEqual(carts.check(), [])
+
+
+class CheckoutRevalidationTestCase(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = factories.create_groups()
+        cls.customer = factories.create_users(1, 'checkout_customer', groups['Customer'])[0]
+        cls.menu_items = factories.create_menu_items(10, factories.create_categories(1))
+
+    def setUp(self):
+        price_index.invalidate() # Prices changed by an earlier test were rolled back
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def fill_cart(self, menu_items):
+        for menuitem in menu_items:
+            self.client.post('/api/cart/menu-items', {'menuitem_id': menuitem.id, 'quantity': 2})
+
+    def change_price(self, menuitem, delta='1.00'):
+        menuitem.price += Decimal(delta)
+        menuitem.save()
+
+    def test_reprice(self):
+        pasta, bread = self.menu_items[:2]
+        self.fill_cart([pasta, bread])
+        old_price = pasta.price
+        self.change_price(pasta)
+
+        resp = self.client.post('/api/orders')
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        self.assertEqual(resp.json()['repriced'], [{
+            'menuitem_id': pasta.id, 'title': pasta.title, 'quantity': 2, 'old_unit_price': str(old_price), 'unit_price': str(pasta.price)
+        }])
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(order.total, (pasta.price + bread.price) * 2)
+        self.assertEqual(OrderItem.objects.get(order=order, menuitem=pasta).price, pasta.price * 2)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+        self.assertEqual(carts.check(), [])
+
+    @override_settings(CHECKOUT={'PRICE_CHANGES': 'reject'})
+    def test_reject(self):
+        pasta, bread = self.menu_items[:2]
+        self.fill_cart([pasta, bread])
+        self.change_price(bread, '-0.50')
+
+        resp = self.client.post('/api/orders')
+        self.assertEqual(resp.status_code, HTTP_409_CONFLICT)
+        self.assertEqual([line['menuitem_id'] for line in resp.json()['changed']], [bread.id])
+        self.assertFalse(Order.objects.filter(user=self.customer).exists())
+
+        # The cart now has the current prices, so placing the order again goes through
+        self.assertEqual(Cart.objects.get(user=self.customer, menuitem=bread).price, bread.price * 2)
+        self.assertEqual(carts.check(), [])
+        self.assertEqual(self.client.get('/api/cart/summary').json()['subtotal'], str((pasta.price + bread.price) * 2))
+        resp = self.client.post('/api/orders')
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        self.assertEqual(resp.json(), {'detail': "All carted items has placed order successfully.", 'repriced': []})
+
+    @override_settings(CHECKOUT={'PRICE_CHANGES': 'reject'})
+    def test_reject_is_not_replayed_under_the_idempotency_key(self):
+        pasta = self.menu_items[0]
+        self.fill_cart([pasta])
+        self.change_price(pasta)
+
+        self.assertEqual(self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout').status_code, HTTP_409_CONFLICT)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        resp = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout') # The client's retry, same key
+        self.assertEqual(resp.status_code, HTTP_201_CREATED)
+        self.assertEqual(Order.objects.get(user=self.customer).total, pasta.price * 2)
+        retry = self.client.post('/api/orders', HTTP_IDEMPOTENCY_KEY='checkout')
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (HTTP_201_CREATED, 'true'))
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        counts = []
+        for menu_items in (self.menu_items[:2], self.menu_items[2:]):
+            self.fill_cart(menu_items)
+            for menuitem in menu_items:
+                self.change_price(menuitem)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.post('/api/orders').status_code, HTTP_201_CREATED)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(OrderItem.objects.count(), 10)
@@ -0,0 +1,187 @@
+"""
+Per-role, per-scope rate limits and latency based admission control.
+
+`RoleRateThrottle` gives every (user, scope) pair a token bucket: `N/min`
+allows bursts of N requests and refills at N per minute. The rate depends
+on the user's role and on the scope of the request: a view can name scopes
+per method with `throttle_scopes = {'GET': 'polling', ...}`, otherwise safe
+methods are 'read' and the others 'write'. Buckets live in the process by
+default; with THROTTLING['BACKEND'] = 'cache' they are kept in the Django
+cache, shared by every process using it (approximate under concurrency: two
+processes can take the same token).
+
+`AdmissionControlMiddleware` tracks request latency and, when it passes
+THROTTLING['ADMISSION']['LATENCY_THRESHOLD'], answers low priority requests
+(safe methods: the polling traffic) with 503 so that checkout, cart and other
+writes keep going.
+"""
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+from .permissions import ADMIN, get_roles
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+ROLE_PRIORITY = (ADMIN, 'Manager', 'Delivery Crew', 'Customer') # A user in several groups gets the first one's rates
+AUTHENTICATED = 'authenticated' # Rates for users without a role
+ANONYMOUS = 'anonymous'
+
+DEFAULTS = {
+    'BACKEND': 'local', # 'local' or 'cache'
+    'CACHE_ALIAS': 'default',
+    'MAX_LOCAL_BUCKETS': 10000,
+    'RATES': {},
+    'ADMISSION': {},
+}
+
+ADMISSION_DEFAULTS = {
+    'ENABLED': False,
+    'LATENCY_THRESHOLD': 1.0, # seconds, average over recent requests
+    'HALF_LIFE': 5.0, # seconds for the average to halve when no requests finish
+    'RETRY_AFTER': 5, # seconds
+    'EXEMPT_PATHS': (),
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'THROTTLING', {}).get(name, DEFAULTS[name])
+
+
+def get_admission_setting(name):
+    return get_setting('ADMISSION').get(name, ADMISSION_DEFAULTS[name])
+
+
+def parse_rate(rate):
+    # '120/min' -> (capacity 120, refill 2 tokens per second); None means unthrottled
+    if rate is None:
+        return None
+    num, period = rate.split('/')
+    duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+    return int(num), int(num) / duration
+
+
+class LocalBuckets:
+    def __init__(self):
+        self.buckets = {} # key -> (tokens, updated, full_at)
+        self.lock = Lock()
+
+    def take(self, key, capacity, refill):
+        # Returns 0 if a token was taken, else the seconds until one is available
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated, _ = self.buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            wait = 0 if tokens >= 1 else (1 - tokens) / refill
+            tokens = tokens - 1 if not wait else tokens
+            self.buckets[key] = (tokens, now, now + (capacity - tokens) / refill)
+
+            if len(self.buckets) > get_setting('MAX_LOCAL_BUCKETS'): # Full buckets are the same as no bucket
+                self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[2] > now}
+            return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets = {}
+
+
+class CacheBuckets:
+    def take(self, key, capacity, refill):
+        cache = caches[get_setting('CACHE_ALIAS')]
+        now = time.time() # Shared between processes, so wall clock time
+        tokens, updated = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        wait = 0 if tokens >= 1 else (1 - tokens) / refill
+        cache.set(key, (tokens - 1 if not wait else tokens, now), timeout=int(capacity / refill) + 1)
+        return wait
+
+    def clear(self):
+        pass # Entries expire once their bucket would be full again
+
+
+local_buckets = LocalBuckets()
+
+
+def get_buckets():
+    return CacheBuckets() if get_setting('BACKEND') == 'cache' else local_buckets
+
+
+def get_role(request):
+    user = request.user
+    if not user or not user.is_authenticated:
+        return ANONYMOUS
+    if user.is_superuser: # No query needed, e.g. for the admin only views that don't resolve roles
+        return ADMIN
+    roles = get_roles(request) # Shared with the permission checks, one query per request
+    return next((role for role in ROLE_PRIORITY if role in roles), AUTHENTICATED)
+
+
+def get_scope(request, view):
+    scope = getattr(view, 'throttle_scopes', {}).get(request.method)
+    return scope or ('read' if request.method in SAFE_METHODS else 'write')
+
+
+class RoleRateThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        role, scope = get_role(request), get_scope(request, view)
+        rates = get_setting('RATES').get(role, {})
+        rate = parse_rate(rates.get(scope, rates.get('read' if request.method in SAFE_METHODS else 'write')))
+        if rate is None:
+            return True
+
+        ident = request.user.pk if role != ANONYMOUS else self.get_ident(request)
+        key = 'littlelemon:throttle:{}:{}:{}'.format(scope, role, ident)
+        self.wait_time = get_buckets().take(key, *rate)
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+
+class LatencyTracker:
+    # Exponentially weighted average of request latency that also decays while no request finishes,
+    # so shedding stops on its own once the slow requests are gone
+    def __init__(self):
+        self.average = 0.0
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def current(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.average * 0.5 ** ((now - self.updated) / get_admission_setting('HALF_LIFE'))
+
+    def record(self, latency):
+        with self.lock:
+            now = time.monotonic()
+            self.average = 0.8 * self.current(now) + 0.2 * latency
+            self.updated = now
+
+    def reset(self):
+        with self.lock:
+            self.average, self.updated = 0.0, time.monotonic()
+
+
+latency = LatencyTracker()
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_admission_setting('ENABLED'):
+            return self.get_response(request)
+
+        low_priority = request.method in SAFE_METHODS and not request.path.startswith(tuple(get_admission_setting('EXEMPT_PATHS')))
+        if low_priority and latency.current() > get_admission_setting('LATENCY_THRESHOLD'):
+            response = JsonResponse({'detail': 'Server busy, try again later.'}, status=503)
+            response['Retry-After'] = str(get_admission_setting('RETRY_AFTER'))
+            return response
+
+        started = time.monotonic()
+        response = self.get_response(request)
+        latency.record(time.monotonic() - started)
+        return response
@@ -2,7 +2,8 @@ from django.urls import path, include
 
 from .views import (MenuItemView, SingleMenuItemView, CategoryView, SingleCategoryView, ManagerGroupView
 , RemoveManagerGroupView, DeliveryCrewGroupView, RemoveDeliveryCrewGroupView
-, CartView, OrderListView, SingleOrderView, UserView)
+, CartView, CartSummaryView, OrderListView, SingleOrderView, OrderAssignmentView, CrewWorkQueueView, ClaimOrderView, OrderHistoryView, UserView, JobQueueStatsView
+, DailySalesReportView, TopMenuItemsReportView, CrewDeliveriesReportView)
 from django.views.generic import RedirectView
 from rest_framework.routers import DefaultRouter
 
@@ -15,15 +16,24 @@ urlpatterns = [
     path('', include(CustomRouter.urls)),
     path('users/login', TokenCreateView.as_view(), name='login'),
     path('users/logout', TokenDestroyView.as_view(), name='logout'),
-    path('category', CategoryView.as_view()),
-    path('category/<int:pk>', SingleCategoryView.as_view()),
+    path('category', CategoryView.as_view(), name='categories'),
+    path('category/<int:pk>', SingleCategoryView.as_view(), name='category'),
     path('menu-items', MenuItemView.as_view(), name='menu-items'),
-    path('menu-items/<int:pk>', SingleMenuItemView.as_view()),
+    path('menu-items/<int:pk>', SingleMenuItemView.as_view(), name='menu-item'),
     path('groups/manager/users', ManagerGroupView.as_view()),
     path('groups/manager/users/<int:userId>', RemoveManagerGroupView.as_view()),
     path('groups/delivery-crew/users', DeliveryCrewGroupView.as_view()),
     path('groups/delivery-crew/users/<int:userId>', RemoveDeliveryCrewGroupView.as_view()),
     path('cart/menu-items', CartView.as_view()),
-    path('orders', OrderListView.as_view()),
-    path('orders/<int:pk>', SingleOrderView.as_view())
+    path('cart/summary', CartSummaryView.as_view(), name='cart-summary'),
+    path('orders', OrderListView.as_view(), name='orders'),
+    path('orders/<int:pk>', SingleOrderView.as_view(), name='order'),
+    path('orders/assign', OrderAssignmentView.as_view()),
+    path('orders/queue', CrewWorkQueueView.as_view()),
+    path('orders/queue/claim', ClaimOrderView.as_view()),
+    path('orders/history', OrderHistoryView.as_view()),
+    path('jobs/stats', JobQueueStatsView.as_view()),
+    path('reports/daily-sales', DailySalesReportView.as_view()),
+    path('reports/top-items', TopMenuItemsReportView.as_view()),
+    path('reports/crew-deliveries', CrewDeliveriesReportView.as_view())
 ]
\ No newline at end of file
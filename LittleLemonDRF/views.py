@@ -3,45 +3,70 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework import generics
 from rest_framework import views
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
 
-from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
+from rest_framework.status import HTTP_200_OK, HTTP_201_CREATED, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN, HTTP_409_CONFLICT
 from rest_framework.response import Response
 
 from django.contrib.auth.models import User, Group
-
-from .models import MenuItem, Category, Cart, Order, OrderItem
-from .serializers import ( MenuItemSerializer, UserSerializer, CartSerializer
-, OrderItemSerializer, CategorySerializer, ManagerOrderItemSerializer, DeliveryCrewOrderItemSerializer)
-from .permissions import IsManagerOrAdmin, IsCustomer, IsDeliveryCrew, IsAdmin
-
-from .paginator import StandardResultsSetPagination
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum, Prefetch
+from django.utils.cache import get_conditional_response
+
+from .models import MenuItem, Category, Cart, Order, OrderItem, ArchivedOrder, DailySales, MenuItemSales, CrewDeliveries
+from .serializers import ( MenuItemSerializer, UserSerializer, GroupMemberSerializer, UserIdListSerializer, CartSerializer
+, OrderItemSerializer, CategorySerializer, ManagerOrderItemSerializer, DeliveryCrewOrderItemSerializer
+, ArchivedOrderSerializer, WorkQueueOrderSerializer, BatchOrderAssignmentSerializer, DailySalesSerializer, TopMenuItemSerializer, CrewDeliveriesSerializer, CartHeaderSerializer, parse_fieldset)
+from .permissions import IsManagerOrAdmin, IsCustomer, IsDeliveryCrew, IsAdmin, RolePolicy, ADMIN, ANY, get_roles, decide, check_object
+
+from .paginator import StandardResultsSetPagination, KeysetResultsSetPagination
+from .filters import MenuItemFilter, IndexedOrderingFilter, menu_cache_key, get_setting as get_menu_cache_setting
+from .jobs import enqueue, queue_depth
+from . import price_index, carts
+from .memberships import change_membership, summarize
+from .dispatch import AssignmentError, assign_orders, auto_balance, claim_next_order
+from .idempotency import idempotent, not_stored
+from .links import get_links
 
 from djoser import signals
 from djoser.conf import settings
-from djoser.compat import get_user_email
 from djoser.views import UserViewSet
 
 from decimal import Decimal
 
-from datetime import datetime
+from datetime import datetime, date
 
 # Create your views here. #menu-items
 class MenuItemView(generics.ListCreateAPIView):
-    queryset = MenuItem.objects.all()
+    queryset = MenuItem.objects.select_related('category').all()
     serializer_class = MenuItemSerializer
 
-    ordering_fields = '__all__'
+    filter_backends = [MenuItemFilter, IndexedOrderingFilter, SearchFilter]
+    ordering_fields = ['id', 'title', 'price', 'featured'] # Indexed columns only
+    ordering = ['id']
     search_fields = ['category__title']
 
     pagination_class = StandardResultsSetPagination
+    throttle_scopes = {'GET': 'polling'}
 
     def get_permissions(self):
         if self.request.method == 'GET':
             return [IsAuthenticated()]
         return [IsAuthenticated(), IsAdmin()]
+
+    def list(self, request, *args, **kwargs):
+        key = menu_cache_key(request, self) # Rejects invalid filters with 400 before anything is cached
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, timeout=get_menu_cache_setting('TIMEOUT'))
+        return Response(data)
     
     def post(self, request):
-        new_menu_item = MenuItemSerializer(data=request.POST)
+        new_menu_item = MenuItemSerializer(data=request.POST, context={'request': request})
         if new_menu_item.is_valid():
             new_menu_item.save()
             return Response(new_menu_item.data, status=HTTP_201_CREATED)
@@ -72,7 +97,7 @@ class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
             if self.request.user.is_superuser or k == 'featured': # Admin or Manager can only edit 'featured' field
                 setattr(menu_item, k, v)
         menu_item.save()
-        return Response(self.serializer_class(menu_item).data, status=HTTP_200_OK)
+        return Response(self.serializer_class(menu_item, context={'request': request}).data, status=HTTP_200_OK)
 
     def patch(self, request, pk):
         return self.put(request, pk)
@@ -98,11 +123,29 @@ class ManagerGroupView(generics.ListCreateAPIView):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, IsAdmin]
 
+    pagination_class = KeysetResultsSetPagination
+    filter_backends = [] # Keyset pagination needs the fixed 'id' ordering
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return GroupMemberSerializer
+        return self.serializer_class
+
     def get_queryset(self):
         user_group_name = self.__class__.user_group_name
-        return User.objects.filter(groups__name=user_group_name)
+        queryset = User.objects.filter(groups__name=user_group_name)
+
+        # Only load the columns and relations that `?fields=` asks for
+        fields = parse_fieldset(self.request) or GroupMemberSerializer.Meta.fields
+        queryset = queryset.only('id', *(set(fields) & {'username', 'email'}))
+        if 'groups' in fields:
+            queryset = queryset.prefetch_related(Prefetch('groups', queryset=Group.objects.only('id', 'name')))
+        return queryset
 
     def post(self, request):
+        if 'userIds' in request.data: # Bulk add
+            return self.change_members(request, add=True)
+
         user_data = request.POST
         user_group_name = self.__class__.user_group_name
         selected_user = get_object_or_404(User, pk=user_data['userId'])
@@ -116,6 +159,21 @@ class ManagerGroupView(generics.ListCreateAPIView):
         selected_user.groups.add(manager_group)
         return Response('user added to {} group'.format(user_group_name), status=HTTP_200_OK)
 
+    def delete(self, request): # Bulk remove
+        return self.change_members(request, add=False)
+
+    def change_members(self, request, add):
+        user_group_name = self.__class__.user_group_name
+        serialized_data = UserIdListSerializer(data=request.data)
+        if not serialized_data.is_valid():
+            return Response(serialized_data.errors, status=HTTP_400_BAD_REQUEST)
+
+        try:
+            results = change_membership(user_group_name, serialized_data.validated_data['userIds'], add=add)
+        except Group.DoesNotExist:
+            return Response("Group '{}' does not exist".format(user_group_name), status=HTTP_400_BAD_REQUEST)
+        return Response(summarize(user_group_name, results), status=HTTP_200_OK)
+
 
 class RemoveManagerGroupView(generics.DestroyAPIView):
     user_group_name = "Manager"
@@ -149,13 +207,23 @@ class CartView(views.APIView):
     serializer_class = CartSerializer
 
     permission_classes = [IsAuthenticated, IsCustomer]
+    throttle_scopes = {'GET': 'polling'}
 
     def get_queryset(self):
         return Cart.objects.filter(user__id = self.request.user.id).all()
 
-    def get(self, request):
-        return Response(self.serializer_class(self.get_queryset(), many=True).data, status=HTTP_200_OK)
+    def get(self, request): # `?fields=` / `?expand=menuitem` trim the payload and the query
+        # The header's revision is the ETag: an unchanged cart is answered with 304 without reading the lines
+        etag = carts.etag(carts.get(request.user.id), with_menu=True)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        instances = self.serializer_class.fetch(self.get_queryset(), request)
+        return Response(self.serializer_class(instances, many=True, context={'request': request}).data, status=HTTP_200_OK, headers={'ETag': etag})
     
+    @idempotent
     def post(self, request): # Take in distinct menu item in POST and check past record and add the quantity
         data = {k:v for k,v in request.POST.items()}
 
@@ -168,35 +236,49 @@ class CartView(views.APIView):
             if field not in data:
                 return Response("'{}' is missing from request body".format(field), status=HTTP_400_BAD_REQUEST)
 
-        menuitem_info = MenuItem.objects.filter(id=data['menuitem_id']).first()
-        if not menuitem_info:
-            return Response("menuitem_id '{}' does not exist".format(data['menuitem_id']))
-
-        cart_serializer = CartSerializer(data=data)
+        cart_serializer = CartSerializer(data=data, context={'request': request})
 
-        if cart_serializer.is_valid(): # We make good use of serializer
+        if cart_serializer.is_valid(): # We make good use of serializer. menuitem_id is checked against the price index, not the DB
             # 1. We want to check if we have previous record of same user_id and menu item
             # 2. If yes, update the old record
             # 3. Else, just save the new cart item record
-            user_cart_info = Cart.objects.select_related('user', 'menuitem').filter(user__id = request.user.id).filter(menuitem_id=data['menuitem_id']).first()
-
-            if user_cart_info:
-                user_cart_info.quantity += cart_serializer.validated_data.get('quantity', 0)
-                user_cart_info.price += menuitem_info.price * cart_serializer.validated_data.get('quantity', 0)
-                user_cart_info.save()
-                return Response(CartSerializer(user_cart_info).data, status=HTTP_200_OK)
-            else:
-                new_cart_obj = cart_serializer.save(user=self.request.user)
-                return Response(CartSerializer(new_cart_obj).data, status=HTTP_201_CREATED)
-        
-        return Response(new_cart_item.errors, status=HTTP_400_BAD_REQUEST)
+            menuitem_info = cart_serializer.validated_data['menuitem_id']
+            quantity = cart_serializer.validated_data.get('quantity', 0)
+            user_cart_info = Cart.objects.filter(user__id = request.user.id).filter(menuitem_id=menuitem_info.id)
+
+            with transaction.atomic(): # The line and the cart header change together
+                if user_cart_info.update(quantity=F('quantity') + quantity, price=F('price') + menuitem_info.price * quantity):
+                    status = HTTP_200_OK
+                else:
+                    cart_serializer.save(user=self.request.user)
+                    status = HTTP_201_CREATED
+                carts.apply(request.user.id, menuitem_info.price * quantity, quantity)
+            return Response(CartSerializer(user_cart_info.select_related('user', 'menuitem__category').get(), context={'request': request}).data, status=status)
+
+        return Response(cart_serializer.errors, status=HTTP_400_BAD_REQUEST)
     
     def delete(self, pk):
-        queryset = self.get_queryset()
-        queryset.delete()
+        carts.clear(self.request.user.id)
         return Response("Cart has successfully cleared", status=HTTP_200_OK)
 
 
+class CartSummaryView(views.APIView):
+    # GET Customer -> Subtotal, item count and revision of the cart, from the cart header alone
+    serializer_class = CartHeaderSerializer
+
+    permission_classes = [IsAuthenticated, IsCustomer]
+    throttle_scopes = {'GET': 'polling'}
+
+    def get(self, request):
+        header = carts.get(request.user.id)
+        etag = carts.etag(header)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        return Response(self.serializer_class(header).data, status=HTTP_200_OK, headers={'ETag': etag})
+
+
 class OrderListView(views.APIView):
     # GET List Customer -> Show all the order created by the user
     # GET List Manager -> Returns all orders with order items by all users
@@ -205,52 +287,79 @@ class OrderListView(views.APIView):
     # Gets current cart items from the cart endpoints and adds those items to the order items table. Then deletes all items from the cart for this user.\
 
     serializer_class = OrderItemSerializer
-
-    def get_permissions(self):
-        if self.request.method == 'GET':
-            return [IsAuthenticated(), (IsCustomer | IsManagerOrAdmin | IsDeliveryCrew)()]
-        return [IsAuthenticated(), IsCustomer()]
+    permission_classes = [IsAuthenticated, RolePolicy]
+    throttle_scopes = {'GET': 'polling', 'POST': 'checkout'}
+    policy = {
+        'GET': {'Customer': ANY, 'Manager': ANY, ADMIN: ANY, 'Delivery Crew': ANY}
+        , 'POST': {'Customer': ANY}
+    }
 
     def get_queryset(self):
-        if self.request.user.groups.filter(name='Manager'):
-            return OrderItem.objects.select_related('order', 'menuitem').order_by('order__id').all()
-        if self.request.user.groups.filter(name='Customer'):
+        roles = get_roles(self.request)
+        if 'Manager' in roles or ADMIN in roles:
+            return OrderItem.objects.order_by('order__id').all()
+        if 'Customer' in roles:
             order_ids = list(map(lambda x: x.id, Order.objects.filter(user__id = self.request.user.id)))
-            return OrderItem.objects.select_related('order', 'menuitem').filter(order__id__in = order_ids)
-        if self.request.user.groups.filter(name='Delivery Crew'):
+            return OrderItem.objects.filter(order__id__in = order_ids)
+        if 'Delivery Crew' in roles:
             order_ids = list(map(lambda x: x.id, Order.objects.filter(delivery_crew__id = self.request.user.id)))
-            return OrderItem.objects.select_related('order', 'menuitem').filter(order__id__in = order_ids)
-        return []
+            return OrderItem.objects.filter(order__id__in = order_ids)
+        return OrderItem.objects.none()
 
-    def get(self, request):
-        return Response(self.serializer_class(self.get_queryset(), many=True).data, status=HTTP_200_OK)
+    def get(self, request): # `?fields=` / `?expand=` trim the payload and the query
+        instances = self.serializer_class.fetch(self.get_queryset(), request)
+        return Response(self.serializer_class(instances, many=True, context={'request': request}).data, status=HTTP_200_OK)
 
+    @idempotent # Retried checkouts with the same `Idempotency-Key` get the first response back
     def post(self, request):
-        all_carted_items = Cart.objects.filter(user__id = self.request.user.id)
-
-        if all_carted_items.first(): #Check if there is at least one item
-            total = sum(map(lambda x: x.price, all_carted_items))
+        # A fixed number of queries whatever the cart size: the lines and their current menu prices in one join,
+        # the order, all its lines in one insert, the cart in one delete
+        with transaction.atomic():
+            carts.lock(self.request.user.id)
+            all_carted_items = list(Cart.objects.select_related('menuitem').filter(user__id = self.request.user.id))
+            if not all_carted_items: #Check if there is at least one item
+                return Response("There is no items in your cart.", status=HTTP_400_BAD_REQUEST)
+
+            # Any price the index disagrees with means it is stale: refresh it for the next cart adds
+            price_index.reconcile({carted_item.menuitem_id: carted_item.menuitem.price for carted_item in all_carted_items})
+
+            # Lines added before a menu price change are charged the current price, or sent back for review
+            repriced = carts.reprice(all_carted_items)
+            if repriced and carts.get_setting('PRICE_CHANGES') == carts.REJECT:
+                carts.save_prices(self.request.user.id, repriced)
+                # Not kept under the Idempotency-Key: retried with the same key, the order goes through at the new prices
+                return not_stored(Response({
+                    'detail': "Some prices have changed since they were added to your cart. Please review your cart and place the order again."
+                    , 'changed': carts.describe(repriced)
+                }, status=HTTP_409_CONFLICT))
+
+            total = sum(map(lambda x: x.price, all_carted_items)) # The lines are read to be copied anyway
             now = datetime.now()
             new_order = Order.objects.create(
                 user = self.request.user
                 , total = total
                 , date = now
             )
-            new_order.save()
-
-            for carted_item in all_carted_items:
-                new_order_item = OrderItem.objects.create(
+            OrderItem.objects.bulk_create([
+                OrderItem(
                     order = new_order
                     , menuitem = carted_item.menuitem
                     , quantity = carted_item.quantity
                     , unit_price = carted_item.unit_price
                     , price = carted_item.price
                 )
-                new_order_item.save()
-                carted_item.delete()
-            return Response("All carted items has placed order successfully.", status=HTTP_201_CREATED)
-        else:
-            return Response("There is no items in your cart.", status=HTTP_400_BAD_REQUEST)
+                for carted_item in all_carted_items
+            ])
+            carts.clear(self.request.user.id)
+
+            # Sent by the job queue once the order is committed
+            enqueue('send_order_confirmation', order_id=new_order.id)
+            enqueue('rollup_order', order_id=new_order.id)
+
+        return Response({
+            'detail': "All carted items has placed order successfully."
+            , 'repriced': carts.describe(repriced)
+        }, status=HTTP_201_CREATED, headers={'Location': get_links(request).resource('order', new_order.id)})
 
 
 class SingleOrderView(views.APIView):
@@ -264,88 +373,169 @@ class SingleOrderView(views.APIView):
     # DELETE manager -> Delete an order
     # serializer_class = OrderItemSerializer
 
-    def get_permissions(self):
-        if self.request.method == "GET":
-            return [IsAuthenticated(), (IsCustomer | IsManagerOrAdmin | IsDeliveryCrew)()]
-        if self.request.method in ("PUT", "PATCH"):
-            return [IsAuthenticated(), (IsManagerOrAdmin | IsDeliveryCrew)()]
-        if self.request.method in ("DELETE"):
-            return [IsAuthenticated(), IsManagerOrAdmin()]
-        return [IsAuthenticated()]
+    permission_classes = [IsAuthenticated, RolePolicy]
+    policy = {
+        'GET': {'Manager': ANY, ADMIN: ANY, 'Customer': 'user', 'Delivery Crew': 'delivery_crew'}
+        , 'PUT': {'Manager': ANY, ADMIN: ANY, 'Delivery Crew': 'delivery_crew'}
+        , 'PATCH': {'Manager': ANY, ADMIN: ANY, 'Delivery Crew': 'delivery_crew'}
+        , 'DELETE': {'Manager': ANY, ADMIN: ANY}
+    }
 
     def get_serializer_class(self, unauthorized=False):
-        cls = self.__class__
         if unauthorized:
-            cls.serializer_class = OrderItemSerializer
-        elif self.isRole('Manager') or self.request.user.is_superuser:
-            cls.serializer_class = ManagerOrderItemSerializer
+            self.serializer_class = OrderItemSerializer
+        elif self.isRole('Manager') or self.isRole(ADMIN):
+            self.serializer_class = ManagerOrderItemSerializer
         elif self.isRole('Delivery Crew'):
-            cls.serializer_class = DeliveryCrewOrderItemSerializer
+            self.serializer_class = DeliveryCrewOrderItemSerializer
         else:
-            cls.serializer_class = OrderItemSerializer
-        return cls.serializer_class
-
-    def isValidOrderId(self, pk):
-        return Order.objects.filter(id = pk).exists()
+            self.serializer_class = OrderItemSerializer
+        return self.serializer_class
 
     def isRole(self, group_name):
-        return self.request.user.groups.filter(name=group_name).exists()
-    
+        return group_name in get_roles(self.request)
+
+    def get_order_items(self, pk, serializer_class=OrderItemSerializer):
+        # One query for the lines with the order (for the ownership check) and whatever else `?fields=` / `?expand=`
+        # will render, then one each for the users' groups and permissions when the users are expanded
+        queryset = OrderItem.objects.filter(order = pk).order_by('id')
+        return serializer_class.fetch(queryset, self.request, select_related=['order'])
+
     def get(self, request, pk):
-        serializer_class = self.get_serializer_class(unauthorized=True)
-        if not self.isValidOrderId(pk):
-            return Response("Order id '{}' does not exists".format(pk), status=HTTP_400_BAD_REQUEST)
-        if self.isRole('Manager') or self.request.user.is_superuser or \
-        (self.isRole('Customer') and Order.objects.filter(id = pk).filter(user__id = self.request.user.id)) or \
-        (self.isRole('Delivery Crew') and Order.objects.filter(id = pk).filter(delivery_crew__id = self.request.user.id)):
-            serializer_class = self.get_serializer_class()
-            return Response(self.__class__.serializer_class(OrderItem.objects.filter(order = pk).all(), many=True).data, status=HTTP_200_OK)
+        serializer_class = self.get_serializer_class()
+        order_items = self.get_order_items(pk, serializer_class)
+        if order_items: # The ownership check uses the order fetched with the lines
+            allowed = check_object(request, self, order_items[0].order)
+        else: # Orders always have lines, but fall back to the policy engine for an empty one
+            decision = decide(request, self, Order.objects, pk=pk)
+            if decision.reason == 'not_found':
+                return Response("Order id '{}' does not exists".format(pk), status=HTTP_400_BAD_REQUEST)
+            allowed = decision.allowed
+
+        if allowed:
+            return Response(serializer_class(order_items, many=True, context={'request': request}).data, status=HTTP_200_OK)
 
         return Response("You are not authorized to view this order id.", status=HTTP_403_FORBIDDEN)
 
     def put(self, request, pk):
         serializer_class = self.get_serializer_class()
-        if self.isRole('Manager') or self.request.user.is_superuser:
+        if self.isRole('Manager') or self.isRole(ADMIN):
             serialized_data = serializer_class(data=request.data)
 
-            if not serialized_data.is_valid():
+            if not serialized_data.is_valid(): # delivery_crew_id is only valid for users in the 'Delivery Crew' group
                 return Response(serialized_data.errors, status=HTTP_400_BAD_REQUEST)
-            
-            if not self.isValidOrderId(pk):
-                return Response("Order id '{}' does not exists".format(pk), status=HTTP_400_BAD_REQUEST)
+
             delivery_crew = serialized_data.validated_data.get('order', {}).get('delivery_crew__id', None)
             
             if not delivery_crew:
                 return Response('Delivery crew id does not exists', status=HTTP_400_BAD_REQUEST)
-            
-            if not (delivery_crew is None or delivery_crew.groups.filter(name='Delivery Crew').exists()):
-                return Response('Delivery crew id \'{}\' given is not a \'Delivery Crew\''.format(delivery_crew.id), status=HTTP_400_BAD_REQUEST)
-            
-            order = Order.objects.get(id=pk)
-            order.delivery_crew_id = delivery_crew.id
-            order.save()
+
+            # Undelivered orders, the usual case, don't need the previous crew for the rollups
+            if not Order.objects.filter(id=pk, status=False).update(delivery_crew_id=delivery_crew.id):
+                previous_crew_id = Order.objects.filter(id=pk).values_list('delivery_crew_id', flat=True).first()
+                if not Order.objects.filter(id=pk).update(delivery_crew_id=delivery_crew.id):
+                    return Response("Order id '{}' does not exists".format(pk), status=HTTP_400_BAD_REQUEST)
+                if previous_crew_id != delivery_crew.id: # Move the delivery over in the crew rollup
+                    enqueue('rollup_delivery', order_id=pk)
             return Response("Order id \'{}\' is assigned to Delivery Crew \'{}\'".format(pk, delivery_crew.id), status=HTTP_200_OK)
         if self.isRole('Delivery Crew'):
-            # Check it is valid order id
-            if not self.isValidOrderId(pk):
-                return Response("Order id '{}' does not exists".format(pk), status=HTTP_400_BAD_REQUEST)
-            if not Order.objects.filter(pk=pk).filter(delivery_crew__id=self.request.user.id).exists():
-                return Response("You are not authorised to modify this order id.", status=HTTP_403_FORBIDDEN)
-            
             serialized_data = serializer_class(data=request.data)
             if not serialized_data.is_valid():
                 return Response(serialized_data.errors, status=HTTP_400_BAD_REQUEST)
-            
-            order = Order.objects.get(id=pk)
-            order.status = serialized_data.validated_data.get('order', {}).get('status', False)
-            order.save()
-            return Response("Order id \'{}\' status is updated to \'{}\'".format(pk, order.status), status=HTTP_200_OK)
+
+            status = serialized_data.validated_data.get('order', {}).get('status', False)
+            # WHERE id = ? AND delivery_crew_id = ?: the row count tells changed from not found/not assigned
+            if Order.objects.filter(id=pk, delivery_crew_id=self.request.user.id).exclude(status=status).update(status=status):
+                enqueue('rollup_delivery', order_id=pk)
+            else:
+                order_crew = list(Order.objects.filter(id=pk).values_list('delivery_crew_id', flat=True))
+                if not order_crew:
+                    return Response("Order id '{}' does not exists".format(pk), status=HTTP_400_BAD_REQUEST)
+                if order_crew[0] != self.request.user.id:
+                    return Response("You are not authorised to modify this order id.", status=HTTP_403_FORBIDDEN)
+            return Response("Order id \'{}\' status is updated to \'{}\'".format(pk, status), status=HTTP_200_OK)
         return Response("You are not authorized to view this api endpoint.", status=HTTP_403_FORBIDDEN)
         
     def patch(self, request, pk):
         return self.put(request, pk)
 
 
+class OrderAssignmentView(views.APIView):
+    # POST Manager -> Assign many orders at once: {"assignments": [{"order_id": 1, "delivery_crew_id": 2}, ...]}
+    # or spread unassigned open orders over the crew by current load: {"auto_balance": true, "limit": 100}
+    serializer_class = BatchOrderAssignmentSerializer
+    permission_classes = [IsAuthenticated, RolePolicy]
+    policy = {'POST': {'Manager': ANY, ADMIN: ANY}}
+
+    def post(self, request):
+        serialized_data = self.serializer_class(data=request.data)
+        if not serialized_data.is_valid():
+            return Response(serialized_data.errors, status=HTTP_400_BAD_REQUEST)
+
+        if serialized_data.validated_data['auto_balance']:
+            assignments = auto_balance(limit=serialized_data.validated_data['limit'])
+        else:
+            try:
+                assignments = assign_orders({
+                    assignment['order_id']: assignment['delivery_crew_id']
+                    for assignment in serialized_data.validated_data['assignments']
+                })
+            except AssignmentError as e:
+                return Response(e.errors, status=HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'assigned': len(assignments)
+            , 'assignments': [{'order_id': order_id, 'delivery_crew_id': crew_id} for order_id, crew_id in assignments.items()]
+        }, status=HTTP_200_OK)
+
+
+class CrewWorkQueueView(generics.ListAPIView):
+    # GET Delivery Crew -> Own undelivered orders, oldest first, with their lines (served by order_open_by_crew_idx)
+    serializer_class = WorkQueueOrderSerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [IsAuthenticated, RolePolicy]
+    throttle_scopes = {'GET': 'polling'}
+    policy = {'GET': {'Delivery Crew': ANY}}
+
+    def get_queryset(self):
+        return self.with_lines(Order.objects.filter(delivery_crew_id=self.request.user.id, status=False).order_by('date', 'id'))
+
+    @staticmethod
+    def with_lines(queryset):
+        return queryset.select_related('user').prefetch_related(Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('menuitem')))
+
+
+class ClaimOrderView(views.APIView):
+    # POST Delivery Crew -> Take the oldest unassigned open order
+    permission_classes = [IsAuthenticated, RolePolicy]
+    policy = {'POST': {'Delivery Crew': ANY}}
+
+    def post(self, request):
+        order_id = claim_next_order(request.user.id)
+        if order_id is None: # Nothing to claim
+            return Response(status=HTTP_204_NO_CONTENT)
+
+        order = CrewWorkQueueView.with_lines(Order.objects).get(id=order_id)
+        return Response(WorkQueueOrderSerializer(order).data, status=HTTP_200_OK)
+
+
+class OrderHistoryView(generics.ListAPIView):
+    # Archived (delivered and older than ORDER_ARCHIVE['AFTER_DAYS']) orders, scoped like OrderListView
+    serializer_class = ArchivedOrderSerializer
+    pagination_class = StandardResultsSetPagination
+    permission_classes = [IsAuthenticated, RolePolicy]
+    policy = {'GET': {'Customer': ANY, 'Manager': ANY, ADMIN: ANY, 'Delivery Crew': ANY}}
+
+    def get_queryset(self):
+        queryset = ArchivedOrder.objects.select_related('user').prefetch_related('items__menuitem').order_by('-date', '-id')
+        roles = get_roles(self.request)
+        if 'Manager' in roles or ADMIN in roles:
+            return queryset
+        if 'Customer' in roles:
+            return queryset.filter(user_id=self.request.user.id)
+        return queryset.filter(delivery_crew_id=self.request.user.id)
+
+
 class UserView(UserViewSet):
     serializer_class = UserSerializer
     def perform_create(self, serializer, *args, **kwargs):
@@ -361,9 +551,78 @@ class UserView(UserViewSet):
             sender=self.__class__, user=user, request=self.request
         )
 
-        context = {"user": user}
-        to = [get_user_email(user)]
+        # Emails go through the job queue so SMTP latency stays out of the request
+        email_kind = None
         if settings.SEND_ACTIVATION_EMAIL:
-            settings.EMAIL.activation(self.request, context).send(to)
+            email_kind = 'activation'
         elif settings.SEND_CONFIRMATION_EMAIL:
-            settings.EMAIL.confirmation(self.request, context).send(to)
\ No newline at end of file
+            email_kind = 'confirmation'
+
+        if email_kind:
+            site = get_current_site(self.request)
+            enqueue(
+                'send_user_email'
+                , user_id = user.id
+                , kind = email_kind
+                , domain = site.domain
+                , protocol = 'https' if self.request.is_secure() else 'http'
+                , site_name = site.name
+            )
+
+
+class JobQueueStatsView(views.APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response(queue_depth(), status=HTTP_200_OK)
+
+
+class ReportView(generics.ListAPIView):
+    # Manager reports only read the pre-aggregated rollup tables (see rollups.py)
+    permission_classes = [IsAuthenticated, IsManagerOrAdmin]
+    date_field = 'date'
+
+    def parse_date(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({name: "'{}' is not a valid date (YYYY-MM-DD)".format(value)})
+
+    def filter_dates(self, queryset):
+        start, end = self.parse_date('start'), self.parse_date('end')
+        if start:
+            queryset = queryset.filter(**{self.date_field + '__gte': start})
+        if end:
+            queryset = queryset.filter(**{self.date_field + '__lte': end})
+        return queryset
+
+
+class DailySalesReportView(ReportView):
+    serializer_class = DailySalesSerializer
+
+    def get_queryset(self):
+        return self.filter_dates(DailySales.objects.order_by('date'))
+
+
+class TopMenuItemsReportView(ReportView):
+    serializer_class = TopMenuItemSerializer
+
+    def get_queryset(self):
+        try:
+            limit = min(max(int(self.request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            raise ValidationError({'limit': 'limit must be an integer'})
+
+        return self.filter_dates(MenuItemSales.objects).values('menuitem_id', 'menuitem__title') \
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue')).order_by('-quantity', 'menuitem_id')[:limit]
+
+
+class CrewDeliveriesReportView(ReportView):
+    serializer_class = CrewDeliveriesSerializer
+
+    def get_queryset(self):
+        return self.filter_dates(CrewDeliveries.objects.order_by('date', 'delivery_crew_id'))
+
@@ -0,0 +1,107 @@
+"""
+Startup warm-up, run by LittleLemon/wsgi.py and asgi.py when
+WARM_UP_ON_STARTUP is set (LITTLELEMON_WARM_UP=1, or DEBUG off), so the first request of a fresh worker doesn't pay
+for compiling the URL patterns, building every serializer (and the model
+metadata behind it), loading the menu price index and listing the menu.
+
+The cached menu listing embeds absolute links, so it is cached per origin:
+the first page of `GET /api/menu-items` is listed for every origin in
+WARM_UP_MENU_ORIGINS (default: http:// and each ALLOWED_HOSTS entry without
+a wildcard). An origin clients don't use, e.g. without the port they send,
+fills an entry nobody reads. A step that fails is logged and skipped: it runs
+while the worker imports the application, which must not fail because of it.
+`python manage.py bench_coldstart` measures the effect.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import URLResolver, get_resolver, reverse
+
+from . import links, price_index
+from .views import MenuItemView
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed(timings, step):
+    started = time.perf_counter()
+    yield
+    timings[step] = time.perf_counter() - started
+
+
+def iter_views(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_views(pattern.url_patterns)
+            continue
+        view_class = getattr(pattern.callback, 'cls', None)
+        if view_class is not None:
+            yield view_class
+
+
+def warm_serializers(resolver):
+    # Building one instance builds the nested serializers and fills the models' _meta caches
+    built = set()
+    for view_class in iter_views(resolver.url_patterns):
+        serializer_class = getattr(view_class, 'serializer_class', None)
+        if serializer_class is None or serializer_class in built:
+            continue
+        try:
+            serializer_class().fields
+        except Exception: # Serializers that need a request or arguments are built on first use instead
+            logger.debug('Could not warm up %s', serializer_class.__name__, exc_info=True)
+        built.add(serializer_class)
+    return built
+
+
+def menu_origins():
+    origins = getattr(settings, 'WARM_UP_MENU_ORIGINS', None)
+    if origins is None:
+        origins = ['http://{}'.format(host.lstrip('.')) for host in settings.ALLOWED_HOSTS if '*' not in host]
+    return origins
+
+
+def warm_menu_listing(origins):
+    # The listing is the same for every user, so it is built without one: no authentication, permission
+    # or throttling, just MenuItemView.list filling its cache entry
+    for origin in origins:
+        scheme, _, host = origin.partition('://')
+        http_request = RequestFactory().get(links.path('menu-items'), HTTP_HOST=host, secure=scheme == 'https')
+        view = MenuItemView()
+        view.setup(http_request)
+        view.request = view.initialize_request(http_request)
+        view.format_kwarg, view.headers = None, {}
+        view.list(view.request)
+    return origins
+
+
+def warm_up():
+    """Returns the seconds spent per step."""
+    timings = {}
+    with timed(timings, 'url resolver'):
+        resolver = get_resolver()
+        reverse('menu-items') # Compiles every pattern and fills the reverse lookup tables
+    with timed(timings, 'serializers'):
+        warm_serializers(resolver)
+    with timed(timings, 'price index'):
+        try:
+            price_index.get_index()
+        except Exception: # e.g. before the first migrate; it loads on first use then. Never fail the worker's import
+            logger.warning('Price index not warmed up', exc_info=True)
+    with timed(timings, 'menu listing'):
+        try:
+            warm_menu_listing(menu_origins())
+        except Exception: # Database or cache errors, an origin outside ALLOWED_HOSTS (DisallowedHost), ...
+            logger.warning('Menu listing not warmed up', exc_info=True)
+        finally:
+            connections.close_all() # Don't hand an open connection to forked workers
+
+    logger.info('Warm-up done in %.3fs (%s)', sum(timings.values()), ', '.join(
+        '{} {:.3f}s'.format(step, seconds) for step, seconds in timings.items()
+    ))
+    return timings